@@ -3,7 +3,7 @@ import argparse
 import sys
 from pathlib import Path
 from dotenv import load_dotenv
-from src.staging_module import PediatricCancerStaging
+from src.pediatric_staging_module import PediatricCancerStaging
 
 
 # Load environment variables
@@ -120,7 +120,7 @@ def main():
 
     parser = argparse.ArgumentParser(description="Process medical notes for pediatric cancer staging.")
     parser.add_argument("--note", help="Path to a single medical note to process")
-    parser.add_argument("--staging_data", default="toronoto_staging.json", help="Path to the Toronto staging data JSON file")
+    parser.add_argument("--staging_data", default="instructions/old_toronoto_staging.json", help="Path to the Toronto staging data JSON file")
     parser.add_argument("--output", default="results.csv", help="Path to save the CSV results")
     parser.add_argument("--model", default="gpt-4o-mini", help="Azure OpenAI model to use")
     
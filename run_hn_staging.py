@@ -4,10 +4,30 @@ Run the adult head and neck cancer staging module on medical notes.
 
 import os
 import sys
+import atexit
 import argparse
+import functools
 from pathlib import Path
 from dotenv import load_dotenv
-from src.adult_staging_module import AdultCancerStaging
+from src.pediatric_staging_module import create_staging_pipeline
+from src.sharded_runner import ShardedStagingRunner
+from src.staging_service import StagingService
+from src.patient_staging import LongitudinalStaging
+from src.batch_jobs import BatchStagingJob, LocalBatchRunner, llm_responder
+from src.evaluation import EvaluationRunner, load_gold_notes, load_variants, format_summary, write_evaluation, BASELINE_VARIANT
+from src.scheduler import PRIORITY_CLASSES, DEFAULT_PRIORITY_CLASS
+from src.results_store import ResultsStore, GROUP_BY_COLUMNS, new_run_id
+from src.tracing import configure_tracing
+from src.metrics import start_metrics_server
+from src.run_logging import configure_run_logging
+from src.retry import RetryPolicy
+from src.azure_openai_config import configure_http_client
+from src.hedging import parse_stage_timeouts
+from src.cascade import parse_stage_models, parse_model_prices, DEFAULT_CASCADE_STAGES
+from src.artifact_store import MEMOIZED_STAGES
+from src.memory_monitor import parse_memory_size
+import csv
+import time
 import datetime
 
 
@@ -26,6 +46,24 @@ def disable_crewai_telemetry():
             setattr(Telemetry, attr, noop)
 
 
+def init_worker_process(log_dir, log_level, capture_transcripts, http_max_connections, http_keepalive):
+    """
+    Prepare a sharded worker process: disable telemetry, size its HTTP pool and start its own run log.
+    
+    Args:
+        log_dir: Directory of the per-run log files
+        log_level: Minimum level written to the log file
+        capture_transcripts: Whether agent transcripts are logged
+        http_max_connections: Maximum open connections of the shared LLM HTTP client
+        http_keepalive: Maximum idle keep-alive connections of the shared LLM HTTP client
+    """
+    disable_crewai_telemetry()
+    configure_http_client(max_connections=http_max_connections, max_keepalive_connections=http_keepalive)
+    run_logging = configure_run_logging(log_dir, f"{new_run_id()}-{os.getpid()}", level=log_level,
+                                        capture_transcripts=capture_transcripts)
+    atexit.register(run_logging.close)
+
+
 def setup_azure_openai_api():
     """
     Set up the Azure OpenAI API configuration from environment variables.
@@ -130,6 +168,199 @@ def create_project_status(results_csv_path, results_md_path):
     print(f"Project status updated in {status_file}")
 
 
+def staging_settings(args, model_name, staging_data_path, mapping_csv_path):
+    """
+    Pipeline settings of the command line (without the results database, which
+    only the in-process runs record to).
+    
+    Args:
+        args: Parsed command line arguments
+        model_name: The model name returned by setup_azure_openai_api
+        staging_data_path: Path to the AJCC staging data file
+        mapping_csv_path: Path to the disease mappings CSV file
+        
+    Returns:
+        Dict: create_staging_pipeline keyword arguments
+    """
+    return {
+        "staging_data_path": str(staging_data_path),
+        "staging_system": args.staging_system,
+        "pediatric_staging_data_path": args.pediatric_staging_data,
+        "model": model_name,
+        "mapping_csv_path": str(mapping_csv_path),
+        "verbose": args.verbose,
+        "capture_transcripts": args.transcripts,
+        "stage_timeouts": args.stage_timeouts,
+        "hedging": args.hedge,
+        "max_hedge_ratio": args.hedge_max_ratio,
+        "stage_deployments": args.stage_models,
+        "cascade_deployment": args.cascade_deployment,
+        "cascade_stages": args.cascade_stages,
+        "model_prices": args.model_prices,
+        "stage_correction": not args.no_stage_correction,
+        "triage_model": args.triage_model,
+        "triage_threshold": args.triage_threshold,
+        "triage_label": args.triage_label,
+        "category_model": args.category_model,
+        "category_threshold": args.category_threshold,
+        "classifier_batch_size": args.classifier_batch_size,
+        "artifact_db_path": args.artifact_db,
+        "stop_after": args.stop_after,
+        "memory_budget": args.memory_budget,
+        "memory_profile_every": args.memory_profile
+    }
+
+
+def run_sharded(args, settings):
+    """
+    Run the sharded mode: enqueue notes, run workers and/or merge partial outputs.
+    
+    Args:
+        args: Parsed command line arguments
+        settings: Pipeline settings of the workers
+    """
+    runner = ShardedStagingRunner(args.shard_dir, staging_kwargs=settings)
+    
+    if args.note_dir:
+        note_dir = Path(args.note_dir)
+        if not note_dir.exists() or not note_dir.is_dir():
+            print(f"Error: Note directory not found at {note_dir}")
+            sys.exit(1)
+        runner.enqueue_directory(str(note_dir), priority_class=args.priority,
+                                 deadline_minutes=args.deadline_minutes)
+    if args.note_source:
+        runner.enqueue_source(args.note_source, id_column=args.id_column, text_column=args.text_column,
+                              priority_class=args.priority, deadline_minutes=args.deadline_minutes)
+    
+    # This host joins the run with the requested number of workers (0 only merges)
+    if args.workers > 0:
+        if args.workers == 1:
+            runner.run_worker(worker_id=args.worker_id, lease_seconds=args.lease_seconds)
+        else:
+            runner.run_local_workers(args.workers, lease_seconds=args.lease_seconds,
+                                     initializer=functools.partial(init_worker_process, args.log_dir,
+                                                                   args.log_level, args.transcripts,
+                                                                   args.http_max_connections, args.http_keepalive),
+                                     reserved_urgent_workers=args.reserved_workers,
+                                     trace_path=args.trace, metrics_port=args.metrics_port)
+        print("Queue metrics by priority class:")
+        print(runner.class_metrics())
+    
+    if args.merge:
+        outputs = runner.merge(args.output, output_format=args.output_format)
+        if outputs is None:
+            sys.exit(1)
+        # Parquet-only merges have no CSV and markdown files to report
+        if args.output_format in ("csv", "both"):
+            create_project_status(Path(outputs[0]), Path(outputs[1]))
+
+
+def run_evaluation(args, settings):
+    """
+    Stage the gold-labeled notes with each pipeline variant and write the
+    accuracy-vs-throughput comparison.
+    
+    Args:
+        args: Parsed command line arguments
+        settings: Pipeline settings the variants override
+    """
+    if not Path(args.evaluate).is_file():
+        print(f"Error: Gold-label file not found at {args.evaluate}")
+        sys.exit(1)
+    notes_source = args.note_source or args.note_dir
+    notes = load_gold_notes(args.evaluate, id_column=args.id_column, text_column=args.text_column,
+                            notes_source=notes_source)
+    if not notes:
+        print(f"Error: No gold notes with text in {args.evaluate}")
+        sys.exit(1)
+    variants = load_variants(args.variants) if args.variants else {BASELINE_VARIANT: {}}
+    
+    summary, note_rows = EvaluationRunner(settings, create_pipeline=create_staging_pipeline).run(notes, variants)
+    print(format_summary(summary))
+    for path in write_evaluation(summary, note_rows, args.output):
+        print(f"Evaluation output saved to {path}")
+
+
+def run_batch_job(args, staging_module, model_name):
+    """
+    Advance an offline batch job by one step: add the notes and write the first request
+    file, ingest a results file and write the next one, or (with --batch_local) answer
+    every round locally. The outputs are written once no request is pending.
+
+    Args:
+        args: Parsed command line arguments
+        staging_module: The staging pipeline
+        model_name: The model name returned by setup_azure_openai_api
+    """
+    job = BatchStagingJob(staging_module, args.batch_dir, max_attempts=args.max_attempts)
+    try:
+        if not job.prepared:
+            source = args.note_source or args.note_dir
+            if not source or not Path(source).exists():
+                print("Error: a new --batch_dir job needs an existing --note_source file or --note_dir")
+                sys.exit(1)
+            print(f"Preparing batch job from: {source}")
+            requests_path = job.prepare(source, id_column=args.id_column, text_column=args.text_column)
+        elif args.batch_results:
+            print(f"Ingesting batch results: {args.batch_results}")
+            requests_path = job.ingest(args.batch_results)
+        else:
+            requests_path = job.requests_path()
+
+        if requests_path is not None and args.batch_local:
+            job.run_locally(LocalBatchRunner(llm_responder(model_name)))
+            requests_path = None
+
+        if requests_path is not None:
+            print(f"Submit {requests_path} to the batch endpoint, then rerun with --batch_dir {args.batch_dir} "
+                  f"--batch_results <results file>")
+        else:
+            job.write_outputs(args.output, output_format=args.output_format)
+    finally:
+        job.close()
+
+
+def run_query(args):
+    """
+    Query the results database and print the matching rows or group counts.
+    
+    Args:
+        args: Parsed command line arguments of the query subcommand
+    """
+    if not Path(args.db).exists():
+        print(f"Error: Results database not found at {args.db}")
+        sys.exit(1)
+    
+    store = ResultsStore(args.db)
+    group_by = [name.strip() for name in args.group_by.split(",")] if args.group_by else None
+    start = time.perf_counter()
+    try:
+        columns, rows = store.query(
+            category=args.category, stage=args.stage, stage_type=args.stage_type,
+            since=args.since, until=args.until, model=args.model, run_id=args.run_id,
+            note_id=args.note_id, content_hash=args.content_hash, group_by=group_by,
+            limit=args.limit
+        )
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        store.close()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    
+    if args.format == "csv":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(columns)
+        writer.writerows(rows)
+    else:
+        widths = [max([len(str(column))] + [len(str(row[i])) for row in rows]) for i, column in enumerate(columns)]
+        print("  ".join(str(column).ljust(width) for column, width in zip(columns, widths)))
+        print("  ".join("-" * width for width in widths))
+        for row in rows:
+            print("  ".join(str(value).ljust(width) for value, width in zip(row, widths)))
+    print(f"{len(rows)} rows in {elapsed_ms:.1f} ms", file=sys.stderr)
+
+
 def main():
     """
     Main function to run the adult cancer staging module.
@@ -139,15 +370,107 @@ def main():
     parser = argparse.ArgumentParser(description="Process medical notes for adult head and neck cancer staging.")
     parser.add_argument("--note", default="hn_example.txt", help="Path to a single medical note to process")
     parser.add_argument("--note_dir", help="Path to a directory containing multiple medical notes to process")
+    parser.add_argument("--note_source", help="Path to a JSONL, CSV or Parquet file of medical notes to process")
+    parser.add_argument("--id_column", default="note_id", help="Field or column holding the note ID in --note_source")
+    parser.add_argument("--text_column", default="text", help="Field or column holding the note text in --note_source")
+    parser.add_argument("--patients", action="store_true", help="Stage once per patient across all of their notes and write a stage timeline per patient (with --note_source or --note_dir)")
+    parser.add_argument("--patient_column", default="patient_id", help="Field or column holding the patient ID in --note_source")
+    parser.add_argument("--date_column", help="Field or column holding the note date in --note_source (notes are ordered by it)")
+    parser.add_argument("--patient_state", help="SQLite file keeping patient states between --patients runs, so only patients with new notes are restaged")
     parser.add_argument("--output", default="results/results.csv", help="Path to save the output files (both CSV and markdown)")
     parser.add_argument("--staging_data", default="AJCC8.json", help="Path to the AJCC staging data file")
+    parser.add_argument("--staging_system", default="ajcc8", choices=["ajcc8", "toronto", "auto"], help="Staging system: AJCC 8th Edition, Toronto pediatric guidelines, or auto to route each note by patient age")
+    parser.add_argument("--pediatric_staging_data", default="instructions/old_toronoto_staging.json", help="Path to the Toronto pediatric staging data file (with --staging_system toronto or auto)")
     parser.add_argument("--mapping_csv", default="disease_mappings.csv", help="Path to the disease mappings CSV file")
     parser.add_argument("--model", default="gpt-4o-mini", help="OpenAI model to use")
+    parser.add_argument("--output_format", default="csv", choices=["csv", "parquet", "both"], help="Write CSV and markdown, columnar Parquet files, or both")
+    parser.add_argument("--shard_dir", help="Shared directory for a sharded run (work table and partial outputs)")
+    parser.add_argument("--workers", type=int, default=1, help="Number of local worker processes for a sharded run (0 to only merge), or worker threads for --serve")
+    parser.add_argument("--worker_id", help="Worker identifier for a single sharded worker (default: hostname-pid)")
+    parser.add_argument("--lease_seconds", type=float, default=900.0, help="How long a sharded worker may hold a note before others can claim it")
+    parser.add_argument("--merge", action="store_true", help="Merge the partial outputs of a sharded run into the final CSV and markdown files")
+    parser.add_argument("--priority", default=DEFAULT_PRIORITY_CLASS, choices=list(PRIORITY_CLASSES), help="Priority class of the notes enqueued for a sharded run")
+    parser.add_argument("--deadline_minutes", type=float, help="Deadline in minutes for the notes enqueued for a sharded run")
+    parser.add_argument("--reserved_workers", type=int, default=0, help="Number of workers that only take urgent notes (sharded runs and --serve)")
+    parser.add_argument("--serve", action="store_true", help="Run as a long-lived staging service with a local HTTP/JSON API")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface the staging service binds to")
+    parser.add_argument("--port", type=int, default=8765, help="Port the staging service listens on")
+    parser.add_argument("--service_db", default="results/staging_service.db", help="Path to the staging service job table")
+    
+    parser.add_argument("--evaluate", help="Gold-label CSV (note ID, text, category, tnm_values, clinical_stage, pathologic_stage) to score pipeline variants on; writes accuracy, tokens, cost and latency per variant with the Pareto front")
+    parser.add_argument("--variants", help="JSON file of pipeline variants for --evaluate: variant name to settings overriding the command line, e.g. {\"mini\": {\"stage_deployments\": {\"calculate\": \"gpt-4o-mini\"}}}")
+    parser.add_argument("--batch_dir", help="Offline batch job directory: writes chat-completions batch request files per stage and ingests the provider's results files")
+    parser.add_argument("--batch_results", help="Provider results file of the current --batch_dir round to ingest (writes the next request file, or the outputs when done)")
+    parser.add_argument("--batch_local", action="store_true", help="Answer the --batch_dir request files locally with live LLM calls instead of a provider batch endpoint")
+    parser.add_argument("--results_db", default="results/results.db", help="Path to the SQLite results database every run is recorded in")
+    parser.add_argument("--no_results_db", action="store_true", help="Do not record results in the results database")
+    parser.add_argument("--max_attempts", type=int, default=3, help="Attempts per note before it goes to the dead-letter file")
+    parser.add_argument("--retry_delay", type=float, default=2.0, help="Initial retry backoff in seconds (doubles per attempt)")
+    parser.add_argument("--stage_timeouts", type=parse_stage_timeouts, help="Timeout budgets in seconds per stage, e.g. 'identify=90,report=240', or one number for all stages")
+    parser.add_argument("--hedge", action="store_true", help="Send a duplicate LLM request when a call runs longer than the stage's observed p95 latency")
+    parser.add_argument("--hedge_max_ratio", type=float, default=0.05, help="Maximum share of LLM calls that may be hedged (default: 0.05)")
+    parser.add_argument("--stage_models", type=parse_stage_models, help="Azure deployment per stage, e.g. 'identify=gpt-4o-mini,report=gpt-4o' (default: AZURE_GPT4O_DEPLOYMENT for every stage)")
+    parser.add_argument("--cascade_deployment", help="Small Azure deployment that cascaded stages run on first; results failing validation are rerun on the stage's regular deployment")
+    parser.add_argument("--cascade_stages", type=lambda text: tuple(stage.strip() for stage in text.split(",")), default=DEFAULT_CASCADE_STAGES,
+                        help="Comma-separated stages to cascade: identify, analyze, calculate (default: identify,analyze)")
+    parser.add_argument("--triage_model", help="ONNX note classifier run before any LLM call; notes scoring below --triage_threshold are not staged")
+    parser.add_argument("--triage_threshold", type=float, default=0.5, help="Minimum staging relevance score for a note to be staged (default: 0.5)")
+    parser.add_argument("--triage_label", default="relevant", help="Class of the triage model giving the relevance score (default: relevant)")
+    parser.add_argument("--category_model", help="ONNX classifier of AJCC categories; confident predictions replace the identify LLM call")
+    parser.add_argument("--category_threshold", type=float, default=0.8, help="Minimum category probability for skipping the identify LLM call (default: 0.8)")
+    parser.add_argument("--classifier_batch_size", type=int, default=32, help="Notes scored per local classifier call (default: 32)")
+    parser.add_argument("--no_stage_correction", action="store_true", help="Only log stages that fail validation against AJCC8.json instead of asking the LLM to correct them")
+    parser.add_argument("--model_prices", type=parse_model_prices, help="Deployment prices in USD per million input/output tokens for the cascade report, e.g. 'gpt-4o=2.5/10,gpt-4o-mini=0.15/0.6'")
+    parser.add_argument("--artifact_db", help="SQLite file of memoized stage outputs; reruns only recompute stages whose inputs (note, AJCC8 category, mappings, task templates, deployments) changed")
+    parser.add_argument("--stop_after", default="report", choices=list(MEMOIZED_STAGES), help="Last stage to run; earlier stops write only the columns of the stages that ran (with --artifact_db, a later full run continues from them)")
+    parser.add_argument("--memory_budget", type=parse_memory_size, help="RSS limit of a multiple-note run, e.g. '2G' or '1500M'; near it, buffered outputs are spilled to disk and reading new notes waits for memory to be freed")
+    parser.add_argument("--memory_profile", type=int, default=0, help="Take a tracemalloc snapshot every N notes of a multiple-note run and add peak RSS and the top allocation sites to the run report (default: 0, off)")
+    parser.add_argument("--check_staging_data", action="store_true", help="Check that the TNM of every stage grouping row passes stage validation with its own stage, then exit")
+    parser.add_argument("--dry_run", action="store_true", help="With --artifact_db, print which stages a run would recompute without calling the LLM")
+    parser.add_argument("--http_max_connections", type=int, default=20, help="Maximum open connections of the shared LLM HTTP client")
+    parser.add_argument("--http_keepalive", type=int, default=20, help="Maximum idle keep-alive connections of the shared LLM HTTP client")
+    parser.add_argument("--log_dir", default="results/logs", help="Directory of the per-run JSON-lines log files")
+    parser.add_argument("--log_level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"], help="Minimum level written to the run log")
+    parser.add_argument("--verbose", action="store_true", help="Print the full CrewAI agent and crew output to the console")
+    parser.add_argument("--transcripts", action="store_true", help="Log full agent transcripts (steps and task outputs) to a separate file")
+    parser.add_argument("--metrics_port", type=int, help="Serve Prometheus-style metrics on http://127.0.0.1:<port>/metrics during the run (--serve exposes /metrics on its own port)")
+    parser.add_argument("--trace", help="Write per-note trace spans to this Chrome trace JSON file (open in Perfetto or chrome://tracing)")
+    
+    subparsers = parser.add_subparsers(dest="command")
+    query_parser = subparsers.add_parser("query", help="Query the results database")
+    query_parser.add_argument("--db", default="results/results.db", help="Path to the SQLite results database")
+    query_parser.add_argument("--category", help="AJCC category, e.g. 'Laryngeal Carcinoma'")
+    query_parser.add_argument("--stage", help="Stage group (e.g. III, matching IIIA/IIIB) or full stage code (e.g. IIIB)")
+    query_parser.add_argument("--stage_type", default="any", choices=["clinical", "pathologic", "any"], help="Which stage --stage applies to")
+    query_parser.add_argument("--since", help="Earliest extraction date (YYYY-MM-DD)")
+    query_parser.add_argument("--until", help="Latest extraction date (YYYY-MM-DD)")
+    query_parser.add_argument("--model", help="Model name")
+    query_parser.add_argument("--run_id", help="Run identifier")
+    query_parser.add_argument("--note_id", help="Note identifier")
+    query_parser.add_argument("--content_hash", help="SHA-256 content hash of the note")
+    query_parser.add_argument("--group_by", help=f"Comma-separated columns to count by: {', '.join(GROUP_BY_COLUMNS)}")
+    query_parser.add_argument("--limit", type=int, help="Maximum number of rows to print")
+    query_parser.add_argument("--format", default="table", choices=["table", "csv"], help="Output format")
     
     args = parser.parse_args()
     
-    # Set up Azure OpenAI API
+    if args.command == "query":
+        run_query(args)
+        return
+    
+    # Set up Azure OpenAI API and the pool limits of the shared HTTP client
     model_name = setup_azure_openai_api()
+    configure_http_client(max_connections=args.http_max_connections, max_keepalive_connections=args.http_keepalive)
+    
+    # Worker processes of a local sharded run write their own logs and trace files and serve their own metrics
+    local_workers = args.shard_dir and args.workers > 1
+    run_logging = configure_run_logging(args.log_dir, new_run_id(), level=args.log_level,
+                                        capture_transcripts=args.transcripts and not local_workers)
+    atexit.register(run_logging.close)
+    if args.trace and not local_workers:
+        atexit.register(configure_tracing(args.trace).close)
+    if args.metrics_port and not local_workers and not args.serve:
+        start_metrics_server(args.metrics_port)
     
     # Create results directory if it doesn't exist
     results_dir = os.path.dirname(args.output)
@@ -163,6 +486,12 @@ def main():
     
     print(f"Using staging data from: {staging_data_path}")
     
+    if args.staging_system != "ajcc8":
+        if not Path(args.pediatric_staging_data).exists():
+            print(f"Error: Pediatric staging data file not found at {args.pediatric_staging_data}")
+            sys.exit(1)
+        print(f"Using pediatric staging data from: {args.pediatric_staging_data}")
+    
     # Check if mapping CSV file exists
     mapping_csv_path = Path(args.mapping_csv)
     if not mapping_csv_path.exists():
@@ -171,25 +500,97 @@ def main():
     else:
         print(f"Using disease mappings from: {mapping_csv_path}")
     
+    if args.dry_run and not args.artifact_db:
+        print("Error: --dry_run needs --artifact_db")
+        sys.exit(1)
+    
+    if args.stop_after != "report":
+        if args.patients:
+            print("Error: --stop_after needs full staging with --patients")
+            sys.exit(1)
+        if not args.artifact_db:
+            print(f"Warning: stopping after {args.stop_after} without --artifact_db; a later full run will repeat the completed stages")
+    
+    if args.batch_dir and (args.patients or args.shard_dir or args.serve):
+        print("Error: --batch_dir cannot be combined with --patients, --shard_dir or --serve")
+        sys.exit(1)
+    
+    if args.evaluate and (args.patients or args.shard_dir or args.serve or args.batch_dir or args.dry_run):
+        print("Error: --evaluate cannot be combined with --patients, --shard_dir, --serve, --batch_dir or --dry_run")
+        sys.exit(1)
+    if args.variants and not args.evaluate:
+        print("Error: --variants needs --evaluate")
+        sys.exit(1)
+    
+    settings = staging_settings(args, model_name, staging_data_path, mapping_csv_path)
+    
+    if args.evaluate:
+        run_evaluation(args, settings)
+        return
+    
+    if args.shard_dir and not args.dry_run:
+        run_sharded(args, settings)
+        return
+    
     # Create the staging module
-    staging_module = AdultCancerStaging(
-        staging_data_path=str(staging_data_path),
-        model=model_name,
-        mapping_csv_path=str(mapping_csv_path)
-    )
+    staging_module = create_staging_pipeline(results_db_path=None if args.no_results_db else args.results_db,
+                                             **settings)
+    
+    if args.check_staging_data:
+        problems = staging_module.validator.check_groupings()
+        for problem in problems:
+            print(f"Error: {problem}")
+        print(f"{len(problems)} grouping rows of {staging_data_path} fail stage validation")
+        sys.exit(1 if problems else 0)
+    
+    if args.dry_run:
+        staging_module.dry_run(args.note_source or args.note_dir or args.note, id_column=args.id_column,
+                               text_column=args.text_column)
+        return
+    
+    if args.batch_dir:
+        run_batch_job(args, staging_module, model_name)
+        return
+    
+    if args.serve:
+        service = StagingService(staging_module, args.service_db, num_workers=max(args.workers, 1),
+                                 lease_seconds=args.lease_seconds, reserved_urgent_workers=args.reserved_workers)
+        service.serve_forever(host=args.host, port=args.port)
+        return
     
     output_path = Path(args.output)
+    retry_policy = RetryPolicy(max_attempts=args.max_attempts, base_delay=args.retry_delay)
     
     try:
-        # Process either a single note or a directory of notes
-        if args.note_dir:
+        # Process notes grouped by patient, a note file source, a directory of notes or a single note
+        if args.patients:
+            source = args.note_source or args.note_dir
+            if not source or not Path(source).exists():
+                print("Error: --patients needs an existing --note_source file or --note_dir of patient subdirectories")
+                sys.exit(1)
+            
+            print(f"Staging patients from: {source}")
+            LongitudinalStaging(staging_module, state_db_path=args.patient_state).process_patients(
+                source, str(output_path), patient_column=args.patient_column, id_column=args.id_column,
+                text_column=args.text_column, date_column=args.date_column)
+        elif args.note_source:
+            if not Path(args.note_source).is_file():
+                print(f"Error: Note source file not found at {args.note_source}")
+                sys.exit(1)
+            
+            print(f"Processing medical notes from: {args.note_source}")
+            staging_module.process_multiple_notes(args.note_source, str(output_path),
+                                                  id_column=args.id_column, text_column=args.text_column,
+                                                  output_format=args.output_format, retry_policy=retry_policy)
+        elif args.note_dir:
             note_dir = Path(args.note_dir)
             if not note_dir.exists() or not note_dir.is_dir():
                 print(f"Error: Note directory not found at {note_dir}")
                 sys.exit(1)
                 
             print(f"Processing medical notes in directory: {note_dir}")
-            staging_module.process_multiple_notes(str(note_dir), str(output_path))
+            staging_module.process_multiple_notes(str(note_dir), str(output_path), output_format=args.output_format,
+                                                  retry_policy=retry_policy)
         else:
             note_path = args.note
             if not Path(note_path).exists():
@@ -198,7 +599,7 @@ def main():
                 sys.exit(1)
                 
             print(f"Processing medical note: {note_path}")
-            staging_module.process_single_note(note_path, str(output_path))
+            staging_module.process_single_note(note_path, str(output_path), output_format=args.output_format)
             
         # Get timestamp for file access
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -1,5 +1,9 @@
 from .adult_staging_module import AdultCancerStaging
 from .adult_agents import AdultCancerStagingAgents
 from .adult_tasks import AdultCancerStagingTasks
+from .cancer_type_normalizer import CancerTypeNormalizer
+from .pediatric_staging_module import PediatricCancerStaging, create_staging_pipeline
+from .pediatric_tasks import PediatricStagingTasks
 
-__all__ = ['AdultCancerStaging', 'AdultCancerStagingAgents', 'AdultCancerStagingTasks'] 
\ No newline at end of file
+__all__ = ['AdultCancerStaging', 'AdultCancerStagingAgents', 'AdultCancerStagingTasks', 'CancerTypeNormalizer',
+           'PediatricCancerStaging', 'PediatricStagingTasks', 'create_staging_pipeline'] 
\ No newline at end of file
@@ -8,16 +8,24 @@ class AdultCancerStagingAgents:
     Provides agents for adult cancer staging tasks for all cancer types in AJCC 8th Edition.
     """
     
-    def __init__(self, model: str = "gpt-4o-mini"):
+    def __init__(self, model: str = "gpt-4o-mini", verbose: bool = False, deployment_name: Optional[str] = None,
+                 staging_system: str = "AJCC 8th Edition", system_short_name: str = "AJCC"):
         """
         Initialize the agent creator with the specified model.
-        
+
         Args:
             model (str): The OpenAI model to use
+            verbose (bool): Whether agents print their reasoning to the console
+            deployment_name (str, optional): Azure deployment to use. If None, will use AZURE_GPT4O_DEPLOYMENT.
+            staging_system (str): Name of the staging system the agents apply
+            system_short_name (str): Short name of the staging system, used in agent roles
         """
         self.model = model
+        self.verbose = verbose
+        self.staging_system = staging_system
+        self.system_short_name = system_short_name
         # Get the deployment name from environment variable
-        self.deployment_name = os.getenv("AZURE_GPT4O_DEPLOYMENT", model)
+        self.deployment_name = deployment_name or os.getenv("AZURE_GPT4O_DEPLOYMENT", model)
         # Format model name for LiteLLM - azure/<deployment_name>
         self.azure_model = f"azure/{self.deployment_name}" 
         # Get Azure LLM for LangChain integration
@@ -33,14 +41,14 @@ class AdultCancerStagingAgents:
         """
         return Agent(
             role="Oncology Specialist",
-            goal="Identify the specific cancer type and any mentioned TNM values in medical notes, verifying the cancer exists in AJCC 8th Edition",
-            backstory="""You are a specialist in oncology with extensive experience
+            goal=f"Identify the specific cancer type and any mentioned TNM values in medical notes, verifying the cancer exists in {self.staging_system}",
+            backstory=f"""You are a specialist in oncology with extensive experience
             in diagnosing various types of cancers. Your expertise allows you to quickly 
             identify specific cancer subtypes from medical notes, pathology
             reports, and imaging studies, and extract any TNM staging information that may be mentioned.
-            You also verify that the identified cancer type exists in the AJCC 8th Edition staging system
+            You also verify that the identified cancer type exists in the {self.staging_system} staging system
             before proceeding with staging.""",
-            verbose=True,
+            verbose=self.verbose,
             allow_delegation=False,
             llm=self.llm,
             # For CrewAI direct integration - this is a fallback
@@ -56,13 +64,13 @@ class AdultCancerStagingAgents:
             Agent: A CrewAI agent for staging criteria analysis
         """
         return Agent(
-            role="AJCC Cancer Staging Specialist",
+            role=f"{self.system_short_name} Cancer Staging Specialist",
             goal="Identify which staging criteria are present in the medical notes for a specific cancer type",
-            backstory="""You are a specialist in cancer staging with deep knowledge
-            of the AJCC 8th Edition staging system. Your expertise allows you to meticulously analyze
+            backstory=f"""You are a specialist in cancer staging with deep knowledge
+            of the {self.staging_system} staging system. Your expertise allows you to meticulously analyze
             medical notes and identify which specific staging criteria are present for a
             particular cancer type, distinguishing between clinical and pathologic findings.""",
-            verbose=True,
+            verbose=self.verbose,
             allow_delegation=False,
             llm=self.llm,
             # For CrewAI direct integration - this is a fallback
@@ -78,13 +86,13 @@ class AdultCancerStagingAgents:
         """
         return Agent(
             role="Cancer Stage Calculator",
-            goal="Calculate the clinical and pathologic stages based on identified criteria using AJCC 8th Edition",
-            backstory="""You are an expert in applying the AJCC 8th Edition staging system for 
+            goal=f"Calculate the clinical and pathologic stages based on identified criteria using {self.staging_system}",
+            backstory=f"""You are an expert in applying the {self.staging_system} staging system for 
             all cancer types. Your deep understanding of the staging system allows you
             to accurately determine both clinical and pathologic stages based on the criteria present in the
             medical notes. You are familiar with all the nuances of the TNM classification system
             and stage groupings specific to different cancer types.""",
-            verbose=True,
+            verbose=self.verbose,
             allow_delegation=False,
             llm=self.llm,
             # For CrewAI direct integration - this is a fallback
@@ -101,12 +109,12 @@ class AdultCancerStagingAgents:
         return Agent(
             role="Cancer Staging Report Specialist",
             goal="Generate comprehensive and accurate staging reports for all cancer types",
-            backstory="""You are a specialized report writer with expertise in cancer staging.
+            backstory=f"""You are a specialized report writer with expertise in cancer staging.
             Your reports are clear, concise, and follow standard medical documentation format. You can
             explain complex staging decisions in a way that is understandable to both specialists and
             non-specialists alike. You always include all the relevant TNM values, stage groupings,
-            and explanations of how the stage was determined based on the AJCC 8th Edition criteria.""",
-            verbose=True,
+            and explanations of how the stage was determined based on the {self.staging_system} criteria.""",
+            verbose=self.verbose,
             allow_delegation=False,
             llm=self.llm,
             # For CrewAI direct integration - this is a fallback
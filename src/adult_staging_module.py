@@ -1,14 +1,40 @@
-import json
 import os
 import csv
+import time
 import datetime
-from typing import Dict, Any, List, Optional, Tuple
+import tempfile
+import threading
+from collections.abc import Mapping
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
 import pandas as pd
 from pathlib import Path
 from crewai import Crew, Process
 
 from .adult_agents import AdultCancerStagingAgents
 from .adult_tasks import AdultCancerStagingTasks
+from .note_sources import iter_notes, count_notes, DEFAULT_ID_COLUMN, DEFAULT_TEXT_COLUMN
+from .result_writers import ParquetResultWriter
+from .results_store import ResultsStore, content_hash
+from .tracing import get_tracer
+from .metrics import get_metrics, ProgressReporter
+from .run_logging import get_logger, note_context, transcript_callbacks
+from .retry import RetryPolicy, RetryQueue, DeadLetterWriter, ModelOutputParseError, is_transient
+from .hedging import HedgedCaller
+from .cascade import CascadeStats, DeploymentUsage, DEFAULT_CASCADE_STAGES, CASCADABLE_STAGES
+from .stage_validation import StagingValidator
+from .onnx_classifiers import (OnnxTextClassifier, NoteTriage, CategoryClassifier, LocalClassifiers,
+                               NotePrediction, TRIAGE_SKIPPED)
+from .tnm_utils import find_tnm, normalize_stage
+from .staging_systems import (STAGING_SYSTEMS, SYSTEM_AJCC8, SYSTEM_TORONTO, POPULATION_PEDIATRIC,
+                              get_staging_registry, fix_json_syntax, route_population)
+from .cancer_type_normalizer import CancerTypeNormalizer
+from .memory_monitor import MemoryProfiler, MemoryBudget
+from .staging_result import (StagingResult, ResultRow, RowSpool, write_results_csv, CRITERIA_ANALYSIS_COLUMN,
+                             STAGE_NOT_RUN)
+from .artifact_store import (ArtifactStore, fingerprint, template_version, MEMOIZED_STAGES, ARTIFACT_CACHED,
+                             ARTIFACT_RECOMPUTE)
+
+logger = get_logger("pipeline")
 
 class AdultCancerStaging:
     """
@@ -16,7 +42,50 @@ class AdultCancerStaging:
     using the AJCC 8th Edition system for all cancer types.
     """
     
-    def __init__(self, staging_data_path: str, model: str = "gpt-4o-mini", mapping_csv_path: str = "disease_mappings.csv"):
+    # How each stage's output is referred to in extraction warnings
+    STAGE_OUTPUT_LABELS = {
+        "identify": "task result",
+        "analyze": "criteria analysis",
+        "calculate": "stage calculation",
+        "correct": "stage correction",
+        "report": "report"
+    }
+    
+    # The AdultCancerStagingAgents method creating each stage's agent
+    STAGE_AGENT_FACTORIES = {
+        "identify": "create_cancer_identifier_agent",
+        "analyze": "create_criteria_analyzer_agent",
+        "calculate": "create_stage_calculator_agent",
+        "correct": "create_stage_calculator_agent",
+        "report": "create_report_generator_agent"
+    }
+    
+    # Staging system of the pipeline (see staging_systems.STAGING_SYSTEMS), its task builders
+    # and the local checker of its results
+    SYSTEM = SYSTEM_AJCC8
+    TASKS = AdultCancerStagingTasks
+    VALIDATOR = StagingValidator
+    
+    # The TASKS methods whose templates each memoized stage depends on
+    STAGE_TEMPLATES = {
+        "identify": ("identify_cancer_type",),
+        "analyze": ("analyze_staging_criteria",),
+        "calculate": ("calculate_stage", "correct_stage"),
+        "report": ("generate_report",)
+    }
+    
+    def __init__(self, staging_data_path: str, model: str = "gpt-4o-mini", mapping_csv_path: str = "disease_mappings.csv",
+                 results_db_path: Optional[str] = None, verbose: bool = False, capture_transcripts: bool = False,
+                 stage_timeouts: Optional[Dict[str, float]] = None, hedging: bool = False, max_hedge_ratio: float = 0.05,
+                 stage_deployments: Optional[Dict[str, str]] = None, cascade_deployment: Optional[str] = None,
+                 cascade_stages: Iterable[str] = DEFAULT_CASCADE_STAGES,
+                 model_prices: Optional[Dict[str, Tuple[float, float]]] = None, stage_correction: bool = True,
+                 triage_model: Optional[str] = None, triage_threshold: float = 0.5,
+                 triage_label: Optional[str] = "relevant", category_model: Optional[str] = None,
+                 category_threshold: float = 0.8, classifier_batch_size: int = 32,
+                 artifact_db_path: Optional[str] = None, pediatric_staging_data_path: Optional[str] = None,
+                 stop_after: str = "report", memory_budget: Optional[int] = None,
+                 memory_profile_every: int = 0):
         """
         Initialize the staging module.
         
@@ -24,34 +93,99 @@ class AdultCancerStaging:
             staging_data_path: Path to the AJCC staging JSON file
             model: The OpenAI model to use
             mapping_csv_path: Path to the disease mappings CSV file
+            results_db_path: Optional path to the SQLite results database every run is recorded in
+            verbose: Whether agents and crews print their full output to the console
+            capture_transcripts: Whether agent steps and task outputs are logged to the transcript log
+            stage_timeouts: Timeout budget per stage in seconds (defaults to DEFAULT_STAGE_TIMEOUTS)
+            hedging: Whether LLM calls slower than the stage's observed p95 get a duplicate request
+            max_hedge_ratio: Maximum share of LLM calls that may be hedged
+            stage_deployments: Azure deployment per stage (stages not listed use the default deployment)
+            cascade_deployment: Small deployment cascaded stages run on first; results failing
+                local validation are rerun on the stage's regular deployment
+            cascade_stages: Stages that run on cascade_deployment first (identify, analyze, calculate)
+            model_prices: Deployment prices per million (input, output) tokens, for the cascade savings report
+            stage_correction: Whether a stage failing validation against AJCC8.json gets one correction call
+            triage_model: Optional ONNX note classifier; notes scoring below triage_threshold skip the LLM pipeline
+            triage_threshold: Minimum staging relevance score for a note to be staged
+            triage_label: Class of the triage model whose probability is the relevance score
+            category_model: Optional ONNX classifier of AJCC categories; predictions of at least
+                category_threshold replace the identify LLM stage
+            category_threshold: Minimum category probability for skipping the identify LLM stage
+            classifier_batch_size: Number of notes scored per local classifier call
+            artifact_db_path: Optional SQLite file of memoized stage outputs; a rerun only
+                recomputes the stages whose inputs changed
+            pediatric_staging_data_path: Optional Toronto staging data; when given, notes of
+                pediatric patients are routed to a PediatricCancerStaging pipeline
+            stop_after: Last stage to run ("identify", "analyze", "calculate" or "report"); earlier
+                stops give results with only the columns of the stages that ran. With an artifact
+                database, a later full run reuses the completed stages.
+            memory_budget: Optional RSS limit in bytes for multiple-note runs; near it, buffered
+                outputs are spilled to disk and the note intake waits for memory to be freed
+            memory_profile_every: Notes between tracemalloc snapshots of multiple-note runs,
+                reported with the peak RSS and top allocation sites (0: no snapshots)
         """
+        # Keep the settings for the pipelines of other staging systems, created on first use
+        self._settings = {name: value for name, value in locals().items() if name not in ("self", "__class__")}
+        self.spec = STAGING_SYSTEMS[self.SYSTEM]
         self.model = model
         self.mapping_csv_path = mapping_csv_path
+        self.results_db_path = results_db_path
+        self.verbose = verbose
+        self.capture_transcripts = capture_transcripts
+        self.stage_caller = HedgedCaller(stage_timeouts, hedging=hedging, max_hedge_ratio=max_hedge_ratio)
         self.staging_data = self._load_staging_data(staging_data_path)
-        self.agents = AdultCancerStagingAgents(model=model)
+        self.agents = AdultCancerStagingAgents(model=model, verbose=verbose, staging_system=self.spec.title,
+                                               system_short_name=self.spec.short_name)
+        self.stage_deployments = dict(stage_deployments or {})
+        self.cascade_deployment = cascade_deployment
+        self.cascade_stages = tuple(cascade_stages) if cascade_deployment else ()
+        unsupported = set(self.cascade_stages) - set(CASCADABLE_STAGES)
+        if unsupported:
+            raise ValueError(f"Cannot cascade {', '.join(sorted(unsupported))}: only {', '.join(CASCADABLE_STAGES)} are validated")
+        self.model_prices = model_prices or {}
+        self.stage_correction = stage_correction
+        if stop_after not in MEMOIZED_STAGES:
+            raise ValueError(f"Unknown stage '{stop_after}' (known: {', '.join(MEMOIZED_STAGES)})")
+        self.stop_after = stop_after
+        self.memory_budget = memory_budget
+        self.memory_profile_every = memory_profile_every
+        self.triage = None
+        if triage_model:
+            self.triage = NoteTriage(OnnxTextClassifier(triage_model), threshold=triage_threshold,
+                                     relevant_label=triage_label, batch_size=classifier_batch_size)
+        self.category_classifier = None
+        if category_model:
+            self.category_classifier = CategoryClassifier(OnnxTextClassifier(category_model), threshold=category_threshold,
+                                                          batch_size=classifier_batch_size)
+        self.local_classifiers = LocalClassifiers(self.triage, self.category_classifier, batch_size=classifier_batch_size)
+        self.cascade_stats = CascadeStats()
+        self.usage = DeploymentUsage()
+        self.normalizer = CancerTypeNormalizer(self.disease_mapping, self.spec.not_stageable)
+        self.validator = self.VALIDATOR(self.staging_data, self.available_categories, self.spec.not_stageable)
+        self._agents_by_deployment = {self.agents.deployment_name: self.agents}
+        self.artifacts = ArtifactStore(artifact_db_path) if artifact_db_path else None
+        self._template_versions = {stage: template_version(*(getattr(self.TASKS, name) for name in names))
+                                   for stage, names in self.STAGE_TEMPLATES.items()}
+        self._mapping_version = fingerprint([self.available_categories, self.disease_mapping])
+        self.pediatric_staging_data_path = pediatric_staging_data_path
+        self._pipelines: Dict[str, "AdultCancerStaging"] = {self.SYSTEM: self}
+        self._pipelines_lock = threading.Lock()
         
-    def _load_staging_data(self, staging_data_path: str) -> Dict[str, Any]:
+    def _load_staging_data(self, staging_data_path: str) -> Mapping:
         """
-        Load the AJCC staging data from a JSON file.
+        Load the staging data of the pipeline's system through the staging system registry,
+        which compiles the JSON file on first use and shares the tables read-only.
         
         Args:
-            staging_data_path: Path to the AJCC staging JSON file
+            staging_data_path: Path to the staging data JSON file
             
         Returns:
-            Dict: The staging data as a dictionary
+            Mapping: Category name to staging entry
         """
         try:
-            with open(staging_data_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-            # Load the JSON data
-            try:
-                data = json.loads(content)
-            except json.JSONDecodeError as e:
-                print(f"JSON decode error: {e}")
-                # Attempt to fix common JSON syntax errors
-                content = self._fix_json_syntax(content)
-                data = json.loads(content)
+            registry = get_staging_registry()
+            registry.register(self.SYSTEM, staging_data_path)
+            data = registry.get(self.SYSTEM)
             
             # Create disease mapping for better matching
             self._create_disease_mapping(data)
@@ -72,20 +206,7 @@ class AdultCancerStaging:
         Returns:
             str: Fixed JSON content
         """
-        # Fix specific JSON issues in AJCC8.json
-        # Property keys must be doublequoted
-        content = content.replace("{ N:", '{ "N":')
-        content = content.replace("{ M:", '{ "M":')
-        content = content.replace("{ T:", '{ "T":')
-        
-        # Fix trailing commas
-        content = content.replace(",\n        },", "\n        },")
-        
-        # Remove trailing commas before closing brackets
-        content = content.replace("},}", "}}")
-        content = content.replace("},]", "}]")
-        
-        return content
+        return fix_json_syntax(content)
     
     def _create_disease_mapping(self, data: List[Dict[str, Any]]) -> None:
         """
@@ -105,8 +226,8 @@ class AdultCancerStaging:
                 if isinstance(item, dict) and 'name' in item:
                     disease_name = item['name']
                     self.available_categories.append(disease_name)
-        elif isinstance(data, dict):
-            # Handle data as a dictionary
+        elif isinstance(data, Mapping):
+            # Handle data as a mapping of category names (e.g. a compiled staging system)
             for category in data.keys():
                 self.available_categories.append(category)
         
@@ -192,57 +313,23 @@ class AdultCancerStaging:
             cancer_type: The cancer type identified by the agent
             
         Returns:
-            str: The matched category or "Not in AJCC 8th Edition" if not found
-        """
-        # First, try direct matching
-        cancer_lower = cancer_type.lower()
-        
-        # Try direct lookup in disease_mapping
-        if cancer_lower in self.disease_mapping:
-            return self.disease_mapping[cancer_lower]
-        
-        # Try partial matches
-        for disease_name, category in self.disease_mapping.items():
-            if disease_name in cancer_lower or cancer_lower in disease_name:
-                # Calculate match score based on overlap
-                overlap_score = len(set(disease_name.split()) & set(cancer_lower.split())) / max(len(disease_name.split()), len(cancer_lower.split()))
-                if overlap_score > 0.5:  # If more than 50% of words match
-                    return category
-        
-        # Look for keyword-based matches with common cancer terms
-        keywords = {
-            "breast": ["mammary", "ductal", "lobular"],
-            "lung": ["pulmonary", "bronch", "respiratory"],
-            "colon": ["colorectal", "rectal", "bowel", "intestinal"],
-            "stomach": ["gastric", "gastroesophageal"],
-            "liver": ["hepatic", "hepatocellular", "hepato"],
-            "pancreas": ["pancreatic", "islet cell"],
-            "kidney": ["renal", "nephro"],
-            "prostate": ["prostatic", "psa"],
-            "bladder": ["urothelial", "transitional cell"],
-            "brain": ["cerebral", "glio", "neural", "cns"],
-            "lymphoma": ["lymphatic", "hodgkin", "non-hodgkin"],
-            "leukemia": ["myeloid", "lymphoblastic", "hematologic"],
-            "melanoma": ["skin cancer", "dermal", "cutaneous"],
-            "thyroid": ["thyroidal", "papillary", "follicular"]
-        }
-        
-        # Check for keyword matches
-        for key_term, related_terms in keywords.items():
-            if key_term in cancer_lower or any(term in cancer_lower for term in related_terms):
-                # Find categories that might match this keyword
-                matching_categories = []
-                for disease_name, category in self.disease_mapping.items():
-                    if key_term in disease_name.lower() or any(term in disease_name.lower() for term in related_terms):
-                        matching_categories.append(category)
-                
-                if matching_categories:
-                    # Return the most common category
-                    from collections import Counter
-                    return Counter(matching_categories).most_common(1)[0][0]
+            str: The matched category or the system's not-stageable category if not found
+        """
+        return self.normalizer.match(cancer_type)[0]
+    
+    def normalize_cancer_types(self, cancer_types: Any) -> Any:
+        """
+        Map many free-text cancer types (e.g. tumor registry diagnoses) to categories with
+        the same exact, partial and keyword rules as the pipeline, without any LLM call.
         
-        # If no match found
-        return "Not in AJCC 8th Edition"
+        Args:
+            cancer_types: A pandas Series, a pyarrow Array or ChunkedArray, or a sequence of strings
+            
+        Returns:
+            A DataFrame (a pyarrow Table for pyarrow input) with the "category" and the "rule"
+            that matched ("exact", "partial", "keyword" or "none") for each value
+        """
+        return self.normalizer.normalize(cancer_types)
     
     def _read_medical_note(self, note_path: str) -> str:
         """
@@ -255,13 +342,14 @@ class AdultCancerStaging:
             str: The content of the medical note
         """
         try:
-            with open(note_path, 'r', encoding='utf-8') as f:
-                return f.read()
+            with get_tracer().span("read_note", note_id=os.path.basename(note_path)):
+                with open(note_path, 'r', encoding='utf-8') as f:
+                    return f.read()
         except Exception as e:
-            print(f"Error reading medical note: {e}")
+            logger.error(f"Error reading medical note {note_path}: {e}")
             raise
     
-    def process_medical_note(self, note_path: str) -> Tuple[str, str, str, str, str, str, bool]:
+    def process_medical_note(self, note_path: str) -> StagingResult:
         """
         Process a single medical note to determine cancer type and stage.
         
@@ -269,254 +357,892 @@ class AdultCancerStaging:
             note_path: Path to the medical note file
             
         Returns:
-            Tuple: (cancer_type, cancer_category, clinical_stage, pathologic_stage, tnm_values, explanation, report, proceed_with_staging)
+            StagingResult: The cancer type, category, stages, TNM values, explanation, report and whether it was staged
         """
         # Read the medical note
         medical_note = self._read_medical_note(note_path)
         
-        # Create agents
-        cancer_identifier = self.agents.create_cancer_identifier_agent()
-        criteria_analyzer = self.agents.create_criteria_analyzer_agent()
-        stage_calculator = self.agents.create_stage_calculator_agent()
-        report_generator = self.agents.create_report_generator_agent()
-        
-        # Create tasks with improved category information
-        identify_task = AdultCancerStagingTasks.identify_cancer_type(
-            agent=cancer_identifier,
-            medical_note=medical_note,
-            staging_data=self.staging_data,
-            available_categories=self.available_categories,
-            disease_mapping=self.disease_mapping
-        )
+        return self.process_note_text(medical_note, note_id=os.path.basename(note_path))
+    
+    def process_note_text(self, medical_note: str, note_id: Optional[str] = None,
+                          prediction: Optional[NotePrediction] = None) -> StagingResult:
+        """
+        Process the content of a medical note to determine cancer type and stage.
         
-        # Create a crew for the first task
-        identify_crew = Crew(
-            agents=[cancer_identifier],
-            tasks=[identify_task],
-            process=Process.sequential,
-            verbose=True
-        )
+        Args:
+            medical_note: The medical note content
+            note_id: Optional note identifier, attached to the trace spans of the note
+            prediction: Local classifier outputs from a batched run (computed here when local
+                classifiers are configured and no prediction is given)
+            
+        Returns:
+            StagingResult: The cancer type, category, stages, TNM values, explanation, report and whether it was staged
+        """
+        with get_tracer().span("note", note_id=note_id), note_context(note_id=note_id):
+            if prediction is None and self.local_classifiers.enabled:
+                prediction = self.classify_notes([medical_note])[0]
+            skipped = self.triage_result(prediction)
+            if skipped is not None:
+                return skipped
+            pipeline = self.pipeline_for(medical_note)
+            if pipeline is not self:
+                # The local category classifier only knows this pipeline's categories
+                get_metrics().inc("staging_routed_notes_total", system=pipeline.SYSTEM)
+                return pipeline._run_staging_pipeline(medical_note)
+            if self.pediatric_staging_data_path:
+                get_metrics().inc("staging_routed_notes_total", system=self.SYSTEM)
+            return self._run_staging_pipeline(medical_note, prediction)
+    
+    def triage_result(self, prediction: Optional[NotePrediction]) -> Optional[StagingResult]:
+        """
+        Result of a note the triage classifier skips.
         
-        # Execute the first task to identify the cancer type
-        identify_result = identify_crew.kickoff()
-
-        # Get the result using the raw attribute (with minimal debugging)
-        cancer_type_result = identify_result.raw
-
-        # Check if raw is None or not a string, and handle accordingly
-        if cancer_type_result is None:
-            print("Warning: Using alternative methods to extract task result")
-            try:
-                # Try tasks_output if it exists
-                if hasattr(identify_result, 'tasks_output') and identify_result.tasks_output:
-                    cancer_type_result = identify_result.tasks_output[0].raw
-                else:
-                    # Last resort: try to get anything we can from the result
-                    cancer_type_result = str(identify_result)
-            except Exception as e:
-                print(f"Error extracting task output: {e}")
-                cancer_type_result = "Error extracting result"
-
-        # Ensure cancer_type_result is a string
-        if not isinstance(cancer_type_result, str):
-            cancer_type_result = str(cancer_type_result)
-
-        # Parse the cancer type result
-        try:
-            cancer_type_lines = cancer_type_result.split('\n')
-            cancer_type = None
-            cancer_category = "Not in AJCC 8th Edition"
-            tnm_values = "Not provided"
-            proceed_with_staging = False
-            
-            for line in cancer_type_lines:
-                if line.startswith("Cancer Type:"):
-                    cancer_type = line.replace("Cancer Type:", "").strip()
-                elif line.startswith("Cancer Category:"):
-                    cancer_category = line.replace("Cancer Category:", "").strip()
-                elif line.startswith("TNM Values:"):
-                    tnm_values = line.replace("TNM Values:", "").strip()
-                elif line.startswith("Proceed with Staging:"):
-                    proceed_with_staging = line.replace("Proceed with Staging:", "").strip().lower() == "yes"
-            
-            if not cancer_type:
-                raise ValueError("Cancer type not identified in the result")
-
-            # Apply additional matching logic if cancer was not categorized properly
-            if cancer_category == "Not in AJCC 8th Edition" and cancer_type:
-                # Try our custom matching logic
-                matched_category = self._match_cancer_to_category(cancer_type)
-                if matched_category != "Not in AJCC 8th Edition":
-                    print(f"Successfully matched '{cancer_type}' to category '{matched_category}' using custom logic")
-                    cancer_category = matched_category
-                    proceed_with_staging = True
-
-            # If the cancer does not exist in AJCC 8th Edition or we should not proceed with staging,
-            # return with default values and don't proceed with further staging
-            if not proceed_with_staging or cancer_category == "Not in AJCC 8th Edition":
-                return (cancer_type, cancer_category, "Not applicable", "Not applicable", tnm_values, 
-                        "This cancer type is not included in the AJCC 8th Edition staging system.", 
-                        "Staging not applicable for this cancer type.", False)
-                
-        except Exception as e:
-            print(f"Error parsing cancer identifier result: {e}")
-            print(f"Original result: {cancer_type_result}")
-            raise
+        Args:
+            prediction: The note's local classifier outputs
             
-        # Create analyze criteria task
-        analyze_task = AdultCancerStagingTasks.analyze_staging_criteria(
-            agent=criteria_analyzer,
-            medical_note=medical_note,
-            cancer_type=cancer_type,
-            cancer_category=cancer_category,
-            tnm_values=tnm_values,
-            staging_data=self.staging_data
-        )
+        Returns:
+            Optional[StagingResult]: The not-staged result, or None when the note is to be staged
+        """
+        if self.triage is None or prediction is None or prediction.triage_score is None:
+            return None
+        triage_score = prediction.triage_score
+        if self.triage.decision(triage_score) != TRIAGE_SKIPPED:
+            return None
+        logger.info(f"Skipped by triage (score {triage_score:.2f})")
+        return StagingResult.not_staged(
+            "Not assessed", "Not applicable", "Not provided",
+            f"Skipped by triage: staging relevance score {triage_score:.2f} is below the threshold "
+            f"{self.triage.threshold:.2f}.",
+            "Staging not applicable: no staging-relevant cancer content detected.")
+    
+    def route(self, medical_note: str) -> str:
+        """
+        Staging system a note is staged with: the pediatric system for notes of children
+        when pediatric staging data is configured, this pipeline's system otherwise.
         
-        # Create a crew for the analyze task
-        analyze_crew = Crew(
-            agents=[criteria_analyzer],
-            tasks=[analyze_task],
-            process=Process.sequential,
-            verbose=True
-        )
+        Args:
+            medical_note: The medical note content
+            
+        Returns:
+            str: A key of STAGING_SYSTEMS
+        """
+        if not self.pediatric_staging_data_path or route_population(medical_note) != POPULATION_PEDIATRIC:
+            return self.SYSTEM
+        return SYSTEM_TORONTO
+    
+    def pipeline_for(self, medical_note: str) -> "AdultCancerStaging":
+        """
+        Pipeline of the staging system a note is routed to. The pediatric pipeline is only
+        created (and its staging data loaded) when the first pediatric note arrives.
         
-        # Execute the analysis task
-        analyze_result = analyze_crew.kickoff()
-        criteria_analysis = analyze_result.raw
+        Args:
+            medical_note: The medical note content
+            
+        Returns:
+            AdultCancerStaging: This pipeline, or the pipeline of the other staging system
+        """
+        return self.system_pipeline(self.route(medical_note))
+    
+    def system_pipeline(self, system: str) -> "AdultCancerStaging":
+        """
+        Pipeline of a staging system, created on first use.
         
-        # Check if raw is None or not a string, and handle accordingly
-        if criteria_analysis is None:
-            print("Warning: Using alternative methods to extract criteria analysis")
-            try:
-                # Try tasks_output if it exists
-                if hasattr(analyze_result, 'tasks_output') and analyze_result.tasks_output:
-                    criteria_analysis = analyze_result.tasks_output[0].raw
-                else:
-                    # Last resort: try to get anything we can from the result
-                    criteria_analysis = str(analyze_result)
-            except Exception as e:
-                print(f"Error extracting criteria analysis output: {e}")
-                criteria_analysis = "Error extracting criteria analysis"
-
-        # Ensure criteria_analysis is a string
-        if not isinstance(criteria_analysis, str):
-            criteria_analysis = str(criteria_analysis)
-
-        # Create stage calculation task
-        calculate_task = AdultCancerStagingTasks.calculate_stage(
-            agent=stage_calculator,
-            medical_note=medical_note,
-            cancer_type=cancer_type,
-            cancer_category=cancer_category,
-            tnm_values=tnm_values,
-            criteria_analysis=criteria_analysis,
-            staging_data=self.staging_data
-        )
+        Args:
+            system: SYSTEM_TORONTO, or this pipeline's system
+            
+        Returns:
+            AdultCancerStaging: The pipeline of the system
+        """
+        pipeline = self._pipelines.get(system)
+        if pipeline is None:
+            with self._pipelines_lock:
+                pipeline = self._pipelines.get(system)
+                if pipeline is None:
+                    # Imported here because the pediatric pipeline subclasses this one
+                    from .pediatric_staging_module import PediatricCancerStaging
+                    settings = dict(self._settings, staging_data_path=self.pediatric_staging_data_path,
+                                    pediatric_staging_data_path=None, results_db_path=None, triage_model=None,
+                                    category_model=None)
+                    logger.info(f"Loading the {STAGING_SYSTEMS[system].title} pipeline")
+                    pipeline = self._pipelines[system] = PediatricCancerStaging(**settings)
+                    # Calls of routed notes count towards this pipeline's usage
+                    pipeline.usage = self.usage
+        return pipeline
+    
+    def classify_notes(self, medical_notes: List[str]) -> List[Optional[NotePrediction]]:
+        """
+        Run the local classifiers (triage and category) on notes in batches.
         
-        # Create a crew for the calculate task
-        calculate_crew = Crew(
-            agents=[stage_calculator],
-            tasks=[calculate_task],
-            process=Process.sequential,
-            verbose=True
-        )
+        Args:
+            medical_notes: Note contents
+            
+        Returns:
+            List: One prediction per note, or None for every note without local classifiers
+        """
+        if not self.local_classifiers.enabled:
+            return [None] * len(medical_notes)
+        return self.local_classifiers.predict(medical_notes)
+    
+    def _local_identification(self, medical_note: str, prediction: Optional[NotePrediction]) -> Optional[Tuple[str, str, str, bool]]:
+        """
+        Identification from the local category classifier, replacing the identify LLM stage
+        when the prediction is confident and names a known category.
         
-        # Execute the calculation task
-        calculate_result = calculate_crew.kickoff()
-        stage_result = calculate_result.raw
-        
-        # Check if raw is None or not a string, and handle accordingly
-        if stage_result is None:
-            print("Warning: Using alternative methods to extract stage calculation")
-            try:
-                # Try tasks_output if it exists
-                if hasattr(calculate_result, 'tasks_output') and calculate_result.tasks_output:
-                    stage_result = calculate_result.tasks_output[0].raw
-                else:
-                    # Last resort: try to get anything we can from the result
-                    stage_result = str(calculate_result)
-            except Exception as e:
-                print(f"Error extracting stage calculation output: {e}")
-                stage_result = "Error extracting stage calculation"
-
-        # Ensure stage_result is a string
-        if not isinstance(stage_result, str):
-            stage_result = str(stage_result)
+        Args:
+            medical_note: The medical note content
+            prediction: Local classifier outputs for the note
+            
+        Returns:
+            Optional[Tuple]: (cancer_type, cancer_category, tnm_values, proceed_with_staging), or None
+            when the note should go to the LLM identifier
+        """
+        if self.category_classifier is None or prediction is None or prediction.category is None:
+            return None
+        category = prediction.category
+        known = category in self.available_categories or category == self.spec.not_stageable
+        if not known or prediction.category_confidence < self.category_classifier.threshold:
+            get_metrics().inc("staging_category_predictions_total", outcome="fallback")
+            return None
+        get_metrics().inc("staging_category_predictions_total", outcome="accepted")
+        logger.info(f"Category '{category}' from the local classifier ({prediction.category_confidence:.2f})")
+        tnm_values = find_tnm(medical_note) or "Not provided"
+        return category, category, tnm_values, category != self.spec.not_stageable
+    
+    def _stage_agents(self, stage: str, tier: Optional[str] = None) -> AdultCancerStagingAgents:
+        """
+        Agent creator for the deployment a stage runs on.
+        
+        Args:
+            stage: Pipeline stage name
+            tier: "small" for the cascade deployment; otherwise the stage's regular deployment
+            
+        Returns:
+            AdultCancerStagingAgents: The agent creator, shared by all notes using the deployment
+        """
+        deployment = self.cascade_deployment if tier == "small" else self.stage_deployments.get(stage)
+        if deployment is None:
+            return self.agents
+        agents = self._agents_by_deployment.get(deployment)
+        if agents is None:
+            agents = self._agents_by_deployment.setdefault(
+                deployment, AdultCancerStagingAgents(model=self.model, verbose=self.verbose, deployment_name=deployment,
+                                                     staging_system=self.spec.title,
+                                                     system_short_name=self.spec.short_name))
+        return agents
+    
+    def _first_tier(self, stage: str) -> Optional[str]:
+        """
+        "small" when a stage is cascaded, None when it always runs on its regular deployment.
+        """
+        return "small" if stage in self.cascade_stages else None
+    
+    def _run_stage(self, stage: str, tier: Optional[str], build_task: Callable[[Any], Any]) -> str:
+        """
+        Run one stage on the deployment of the given tier.
+        
+        Args:
+            stage: Pipeline stage name
+            tier: "small", "large" (escalated cascade call) or None (stage is not cascaded)
+            build_task: Function building the task for a given agent
+            
+        Returns:
+            str: The raw task output
+        """
+        agents = self._stage_agents(stage, tier)
+        create_agent = getattr(agents, self.STAGE_AGENT_FACTORIES[stage])
+        return self._run_crew(stage, create_agent, build_task, tier=tier, deployment=agents.deployment_name)
+    
+    def _run_crew(self, stage: str, create_agent: Callable[[], Any], build_task: Callable[[Any], Any],
+                  tier: Optional[str] = None, deployment: Optional[str] = None) -> str:
+        """
+        Run a single-task crew for one stage and return its raw output. The call runs
+        within the stage timeout budget and may be hedged (see HedgedCaller), so every
+        attempt builds its own agent, task and crew.
+        
+        Args:
+            stage: Pipeline stage name ("identify", "analyze", "calculate" or "report")
+            create_agent: Function creating the agent executing the task
+            build_task: Function building the task for a given agent
+            tier: Cascade tier of the call ("small" or "large"), recorded in the cascade stats
+            deployment: Deployment of the agent, recorded in the usage by deployment
+            
+        Returns:
+            str: The raw task output
+        """
+        def attempt(hedge: bool) -> str:
+            agent = create_agent()
+            with get_tracer().span(f"build_task:{stage}", hedge=hedge):
+                task = build_task(agent)
+            
+            # Agent transcripts are only collected when requested
+            callbacks = transcript_callbacks() if self.capture_transcripts else {}
+            crew = Crew(
+                agents=[agent],
+                tasks=[task],
+                process=Process.sequential,
+                verbose=self.verbose,
+                **callbacks
+            )
+            
+            metrics = get_metrics()
+            with note_context(stage=stage):
+                logger.debug("Starting hedge crew" if hedge else "Starting crew")
+                started = time.monotonic()
+                with get_tracer().span(f"kickoff:{stage}", stage=stage, hedge=hedge, tier=tier), metrics.llm_call(stage):
+                    crew_result = crew.kickoff()
+                metrics.record_token_usage(crew_result)
+                self.usage.record(deployment or self.agents.deployment_name, crew_result)
+                if tier is not None:
+                    self.cascade_stats.record_call(stage, tier, time.monotonic() - started, crew_result)
+                
+                # Get the result using the raw attribute
+                output = crew_result.raw
+                
+                # Check if raw is None or not a string, and handle accordingly
+                if output is None:
+                    label = self.STAGE_OUTPUT_LABELS[stage]
+                    logger.warning(f"Using alternative methods to extract {label}")
+                    try:
+                        # Try tasks_output if it exists
+                        if hasattr(crew_result, 'tasks_output') and crew_result.tasks_output:
+                            output = crew_result.tasks_output[0].raw
+                        else:
+                            # Last resort: try to get anything we can from the result
+                            output = str(crew_result)
+                    except Exception as e:
+                        logger.error(f"Error extracting {label} output: {e}")
+                        output = f"Error extracting {label}"
+            
+            # Ensure the output is a string
+            if not isinstance(output, str):
+                output = str(output)
+            return output
+        
+        return self.stage_caller.call(stage, attempt)
+    
+    def _parse_identification(self, cancer_type_result: str, log_errors: bool = True) -> Tuple[str, str, str, bool]:
+        """
+        Parse the output of the identify stage.
+        
+        Args:
+            cancer_type_result: The raw identify output
+            log_errors: Whether a parsing error is logged before it is raised
+            
+        Returns:
+            Tuple: (cancer_type, cancer_category, tnm_values, proceed_with_staging)
+        """
+        try:
+            with get_tracer().span("parse:identify"):
+                cancer_type_lines = cancer_type_result.split('\n')
+                cancer_type = None
+                cancer_category = self.spec.not_stageable
+                tnm_values = "Not provided"
+                proceed_with_staging = False
+                
+                for line in cancer_type_lines:
+                    if line.startswith("Cancer Type:"):
+                        cancer_type = line.replace("Cancer Type:", "").strip()
+                    elif line.startswith("Cancer Category:"):
+                        cancer_category = line.replace("Cancer Category:", "").strip()
+                    elif line.startswith("TNM Values:"):
+                        tnm_values = line.replace("TNM Values:", "").strip()
+                    elif line.startswith("Proceed with Staging:"):
+                        proceed_with_staging = line.replace("Proceed with Staging:", "").strip().lower() == "yes"
+                
+                if not cancer_type:
+                    raise ModelOutputParseError("Cancer type not identified in the result")
 
-        # Parse the stage result
+                # Apply additional matching logic if cancer was not categorized properly
+                if cancer_category == self.spec.not_stageable and cancer_type:
+                    # Try our custom matching logic
+                    matched_category = self._match_cancer_to_category(cancer_type)
+                    if matched_category != self.spec.not_stageable:
+                        logger.info(f"Matched '{cancer_type}' to category '{matched_category}' using custom logic")
+                        cancer_category = matched_category
+                        proceed_with_staging = True
+            
+            return cancer_type, cancer_category, tnm_values, proceed_with_staging
+                
+        except Exception as e:
+            if log_errors:
+                logger.error(f"Error parsing cancer identifier result: {e}", extra={"original_result": cancer_type_result})
+            if isinstance(e, ModelOutputParseError):
+                raise
+            raise ModelOutputParseError(f"Cannot parse the cancer identifier result: {e}") from e
+    
+    def _parse_stage_result(self, stage_result: str) -> Tuple[str, str, str]:
+        """
+        Parse the output of the calculate stage.
+        
+        Args:
+            stage_result: The raw calculate output
+            
+        Returns:
+            Tuple: (clinical_stage, pathologic_stage, explanation)
+        """
         try:
-            stage_lines = stage_result.split('\n')
-            clinical_stage = "Not determined"
-            pathologic_stage = "Not determined"
-            explanation = ""
-            
-            for i, line in enumerate(stage_lines):
-                if line.startswith("Clinical Stage:"):
-                    clinical_stage = line.replace("Clinical Stage:", "").strip()
-                elif line.startswith("Pathologic Stage:"):
-                    pathologic_stage = line.replace("Pathologic Stage:", "").strip()
-                elif line.startswith("Explanation:"):
-                    # Get all the remaining lines as the explanation
-                    explanation = '\n'.join(stage_lines[i:]).replace("Explanation:", "").strip()
-                    break
+            with get_tracer().span("parse:calculate"):
+                stage_lines = stage_result.split('\n')
+                clinical_stage = "Not determined"
+                pathologic_stage = "Not determined"
+                explanation = ""
+                
+                for i, line in enumerate(stage_lines):
+                    if line.startswith("Clinical Stage:"):
+                        clinical_stage = line.replace("Clinical Stage:", "").strip()
+                    elif line.startswith("Pathologic Stage:"):
+                        pathologic_stage = line.replace("Pathologic Stage:", "").strip()
+                    elif line.startswith("Explanation:"):
+                        # Get all the remaining lines as the explanation
+                        explanation = '\n'.join(stage_lines[i:]).replace("Explanation:", "").strip()
+                        break
+            
+            return clinical_stage, pathologic_stage, explanation
                     
         except Exception as e:
-            print(f"Error parsing stage calculation result: {e}")
-            print(f"Original result: {stage_result}")
-            raise
+            logger.error(f"Error parsing stage calculation result: {e}", extra={"original_result": stage_result})
+            raise ModelOutputParseError(f"Cannot parse the stage calculation result: {e}") from e
+    
+    def _correct_stage(self, medical_note: str, cancer_type: str, cancer_category: str, tnm_values: str,
+                       criteria_analysis: str, stage_result: str, problems: List[str],
+                       current: Tuple[str, str, str]) -> Tuple[str, str, str]:
+        """
+        Make one targeted correction call for a stage result that failed validation.
+        The corrected result is only kept when it has fewer problems than the original.
+        
+        Args:
+            medical_note: The medical note content
+            cancer_type: The identified cancer type
+            cancer_category: The AJCC category
+            tnm_values: TNM values from the note
+            criteria_analysis: The criteria analysis the stage was calculated from
+            stage_result: The raw calculate output that failed validation
+            problems: The inconsistencies found
+            current: The parsed (clinical_stage, pathologic_stage, explanation) of stage_result
             
-        # Create report generation task
-        report_task = AdultCancerStagingTasks.generate_report(
-            agent=report_generator,
-            medical_note=medical_note,
-            cancer_type=cancer_type,
-            cancer_category=cancer_category,
-            clinical_stage=clinical_stage,
-            pathologic_stage=pathologic_stage,
-            tnm_values=tnm_values,
-            criteria_analysis=criteria_analysis,
-            explanation=explanation
+        Returns:
+            Tuple: (clinical_stage, pathologic_stage, explanation)
+        """
+        logger.info(f"Requesting stage correction: {'; '.join(problems)}")
+        tnm_categories, stage_groupings = self.validator.reference(cancer_category)
+        corrected_result = self._run_stage(
+            "correct",
+            None,
+            lambda agent: self.TASKS.correct_stage(
+                agent=agent,
+                medical_note=medical_note,
+                cancer_type=cancer_type,
+                cancer_category=cancer_category,
+                tnm_values=tnm_values,
+                criteria_analysis=criteria_analysis,
+                previous_result=stage_result,
+                problems=problems,
+                tnm_categories=tnm_categories,
+                stage_groupings=stage_groupings
+            )
         )
+        return self._accept_correction(cancer_category, tnm_values, problems, current, corrected_result)
+    
+    def _accept_correction(self, cancer_category: str, tnm_values: str, problems: List[str],
+                           current: Tuple[str, str, str], corrected_result: str) -> Tuple[str, str, str]:
+        """
+        Validate the output of a correction call and keep it only if it has fewer problems than the
+        original, so a correction that fixes nothing does not replace the model's first answer.
+        
+        Args:
+            cancer_category: The AJCC category
+            tnm_values: TNM values from the note
+            problems: The inconsistencies of the original stage result
+            current: The parsed (clinical_stage, pathologic_stage, explanation) of the original
+            corrected_result: The raw correction output
+            
+        Returns:
+            Tuple: (clinical_stage, pathologic_stage, explanation)
+        """
+        corrected = self._parse_stage_result(corrected_result)
+        remaining = self.validator.validate_stage_result(cancer_category, tnm_values, corrected[0], corrected[1])
+        # A stage that cannot be read passes validation, so a reply that lost a stage is not a fix
+        for label, original_stage, corrected_stage in (("Clinical", current[0], corrected[0]),
+                                                       ("Pathologic", current[1], corrected[1])):
+            if normalize_stage(original_stage)["code"] and not normalize_stage(corrected_stage)["code"]:
+                remaining.append(f"{label} stage: the correction has no stage (was '{original_stage}')")
+        get_metrics().inc("staging_stage_corrections_total", outcome="unresolved" if remaining else "fixed")
+        if remaining:
+            logger.warning(f"Stage still inconsistent after correction: {'; '.join(remaining)}")
+        if len(remaining) < len(problems):
+            return corrected
+        return current
+    
+    def _identify(self, identify_task: Callable[[Any], Any]) -> Tuple[str, str, str, bool]:
+        """
+        Run the identify stage, on the cascade deployment first when it is cascaded.
+        
+        Args:
+            identify_task: Function building the identify task for a given agent
+            
+        Returns:
+            Tuple: (cancer_type, cancer_category, tnm_values, proceed_with_staging)
+        """
+        identify_tier = self._first_tier("identify")
+        cancer_type_result = self._run_stage("identify", identify_tier, identify_task)
+        if identify_tier is None:
+            return self._parse_identification(cancer_type_result)
+        
+        # Escalate to the regular deployment when the small model's answer does not
+        # parse or names an unknown category or TNM code
+        try:
+            identification = self._parse_identification(cancer_type_result, log_errors=False)
+            problems = self.validator.validate_identification(identification[1], identification[2])
+        except ModelOutputParseError as e:
+            problems = [str(e)]
+        self.cascade_stats.record_outcome("identify", escalated=bool(problems))
+        if problems:
+            logger.info(f"Escalating identify: {'; '.join(problems)}")
+            cancer_type_result = self._run_stage("identify", "large", identify_task)
+            identification = self._parse_identification(cancer_type_result)
+        return identification
+    
+    def _artifact_key(self, stage: str, medical_note: str, **inputs) -> str:
+        """
+        Key of a stage artifact: the hash of the note, the stage's task templates, the
+        deployments the stage may run on and its other inputs.
+        
+        Args:
+            stage: Memoized stage ("identify", "analyze", "calculate" or "report")
+            medical_note: The medical note content
+            **inputs: The stage's other inputs (upstream outputs, AJCC8 category versions)
+            
+        Returns:
+            str: The artifact key
+        """
+        deployments = [self.model, self.stage_deployments.get(stage, self.agents.deployment_name)]
+        if stage in self.cascade_stages:
+            deployments.append(self.cascade_deployment)
+        if stage == "calculate":
+            # Failed validation may be answered by the correction stage
+            deployments += [self.stage_deployments.get("correct", self.agents.deployment_name), self.stage_correction]
+        return fingerprint({"stage": stage, "note": content_hash(medical_note), "template": self._template_versions[stage],
+                            "deployments": deployments, "inputs": inputs})
+    
+    def _category_version(self, cancer_category: str) -> str:
+        """
+        Hash of the AJCC8.json entry of a category, so correcting one category only
+        invalidates the artifacts of notes in that category.
+        """
+        return fingerprint(self.validator.entries.get(cancer_category))
+    
+    def _memoized(self, stage: str, key: str, compute: Callable[[], Any], medical_note: str,
+                  category: Optional[str] = None) -> Any:
+        """
+        Return a stored stage artifact, or compute and store it.
+        
+        Args:
+            stage: Memoized stage
+            key: The artifact key (see _artifact_key)
+            compute: Function running the stage
+            medical_note: The medical note content
+            category: AJCC category the artifact belongs to
+            
+        Returns:
+            Any: The stage output (tuples come back from the store as lists)
+        """
+        if self.artifacts is None:
+            return compute()
+        value = self.artifacts.get(stage, key)
+        if value is None:
+            value = compute()
+            self.artifacts.put(stage, key, value, category=category, note_hash=content_hash(medical_note))
+        else:
+            logger.info(f"Reusing the stored {stage} artifact")
+        return value
+    
+    def identify_note(self, medical_note: str, prediction: Optional[NotePrediction] = None) -> Tuple[str, str, str, bool]:
+        """
+        Identify the cancer type, AJCC category and TNM values of a note (or of a merged
+        evidence digest).
+        
+        Args:
+            medical_note: The medical note content
+            prediction: Local classifier outputs; a confident category prediction replaces the identify LLM stage
+            
+        Returns:
+            Tuple: (cancer_type, cancer_category, tnm_values, proceed_with_staging)
+        """
+        # Execute the first task, with improved category information, to identify the cancer type
+        def identify_task(agent):
+            return self.TASKS.identify_cancer_type(
+                agent=agent,
+                medical_note=medical_note,
+                staging_data=self.staging_data,
+                available_categories=self.available_categories,
+                disease_mapping=self.disease_mapping
+            )
         
-        # Create a crew for the report task
-        report_crew = Crew(
-            agents=[report_generator],
-            tasks=[report_task],
-            process=Process.sequential,
-            verbose=True
+        # A confident local category prediction replaces the identify LLM stage
+        identification = self._local_identification(medical_note, prediction)
+        if identification is None:
+            key = self._artifact_key("identify", medical_note, mapping=self._mapping_version)
+            identification = tuple(self._memoized("identify", key, lambda: self._identify(identify_task), medical_note))
+        return identification
+    
+    def _analyze_key(self, medical_note: str, cancer_type: str, cancer_category: str, tnm_values: str,
+                     category_version: str) -> str:
+        """
+        Artifact key of the analyze stage of an identified cancer.
+        """
+        return self._artifact_key("analyze", medical_note, cancer_type=cancer_type, cancer_category=cancer_category,
+                                  tnm_values=tnm_values, category_version=category_version)
+    
+    def _calculate_key(self, medical_note: str, cancer_type: str, cancer_category: str, tnm_values: str,
+                       category_version: str, criteria_analysis: str) -> str:
+        """
+        Artifact key of the calculate stage, which follows from its criteria analysis.
+        """
+        return self._artifact_key("calculate", medical_note, cancer_type=cancer_type, cancer_category=cancer_category,
+                                  tnm_values=tnm_values, category_version=category_version,
+                                  criteria_analysis=content_hash(criteria_analysis))
+    
+    def _report_key(self, medical_note: str, cancer_type: str, cancer_category: str, clinical_stage: str,
+                    pathologic_stage: str, tnm_values: str, criteria_analysis: str, explanation: str) -> str:
+        """
+        Artifact key of the report stage.
+        """
+        return self._artifact_key("report", medical_note, cancer_type=cancer_type, cancer_category=cancer_category,
+                                  clinical_stage=clinical_stage, pathologic_stage=pathologic_stage,
+                                  tnm_values=tnm_values, criteria_analysis=content_hash(criteria_analysis),
+                                  explanation=explanation)
+    
+    def _run_analyze(self, medical_note: str, cancer_type: str, cancer_category: str, tnm_values: str,
+                     tier: Optional[str]) -> str:
+        """
+        Run the analyze stage on the deployment of the given tier.
+        """
+        return self._run_stage(
+            "analyze",
+            tier,
+            lambda agent: self.TASKS.analyze_staging_criteria(
+                agent=agent,
+                medical_note=medical_note,
+                cancer_type=cancer_type,
+                cancer_category=cancer_category,
+                tnm_values=tnm_values,
+                staging_data=self.staging_data
+            )
         )
+    
+    def analyze_criteria(self, medical_note: str, cancer_type: str, cancer_category: str, tnm_values: str) -> str:
+        """
+        Run the analyze stage alone, for runs that stop after it. The criteria analysis is
+        stored under the same artifact key calculate_stages looks up, so a later full run
+        continues from it.
         
-        # Execute the report task
-        report_result = report_crew.kickoff()
-        report = report_result.raw
-        
-        # Check if raw is None or not a string, and handle accordingly
-        if report is None:
-            print("Warning: Using alternative methods to extract report")
-            try:
-                # Try tasks_output if it exists
-                if hasattr(report_result, 'tasks_output') and report_result.tasks_output:
-                    report = report_result.tasks_output[0].raw
-                else:
-                    # Last resort: try to get anything we can from the result
-                    report = str(report_result)
-            except Exception as e:
-                print(f"Error extracting report output: {e}")
-                report = "Error extracting report"
-
-        # Ensure report is a string
-        if not isinstance(report, str):
-            report = str(report)
+        Args:
+            medical_note: The medical note content
+            cancer_type: The identified cancer type
+            cancer_category: The AJCC category
+            tnm_values: TNM values from the note
+            
+        Returns:
+            str: The criteria analysis
+        """
+        key = self._analyze_key(medical_note, cancer_type, cancer_category, tnm_values,
+                                self._category_version(cancer_category))
+        # Without a calculate stage to validate against, the analysis is not cascaded
+        return self._memoized("analyze", key, lambda: self._run_analyze(
+            medical_note, cancer_type, cancer_category, tnm_values, None), medical_note, category=cancer_category)
+    
+    def calculate_stages(self, medical_note: str, cancer_type: str, cancer_category: str,
+                         tnm_values: str) -> Tuple[str, str, str, str]:
+        """
+        Run the analyze and calculate stages for an identified cancer, with cascade
+        escalation and local validation.
+        
+        Args:
+            medical_note: The medical note content
+            cancer_type: The identified cancer type
+            cancer_category: The AJCC category
+            tnm_values: TNM values from the note
+            
+        Returns:
+            Tuple: (criteria_analysis, clinical_stage, pathologic_stage, explanation)
+        """
+        category_version = self._category_version(cancer_category)
+        analyze_key = self._analyze_key(medical_note, cancer_type, cancer_category, tnm_values, category_version)
+        
+        def calculate_key(criteria_analysis: str) -> str:
+            return self._calculate_key(medical_note, cancer_type, cancer_category, tnm_values, category_version,
+                                       criteria_analysis)
+        
+        # Stored artifacts are reused as far down the chain as their inputs are unchanged
+        stored_criteria = self.artifacts.get("analyze", analyze_key) if self.artifacts is not None else None
+        if stored_criteria is not None:
+            stored_stage = self.artifacts.get("calculate", calculate_key(stored_criteria))
+            if stored_stage is not None:
+                logger.info("Reusing the stored analyze and calculate artifacts")
+                return (stored_criteria, *stored_stage)
+        
+        def analyze_and_calculate(analyze_tier: Optional[str], calculate_tier: Optional[str],
+                                  criteria_analysis: Optional[str] = None) -> Tuple[str, str, str, str]:
+            # Execute the analyze criteria task, unless its output is already known
+            if criteria_analysis is None:
+                criteria_analysis = self._run_analyze(medical_note, cancer_type, cancer_category, tnm_values,
+                                                      analyze_tier)
+            
+            # Execute the stage calculation task
+            stage_result = self._run_stage(
+                "calculate",
+                calculate_tier,
+                lambda agent: self.TASKS.calculate_stage(
+                    agent=agent,
+                    medical_note=medical_note,
+                    cancer_type=cancer_type,
+                    cancer_category=cancer_category,
+                    tnm_values=tnm_values,
+                    criteria_analysis=criteria_analysis,
+                    staging_data=self.staging_data
+                )
+            )
+            return (criteria_analysis, stage_result, *self._parse_stage_result(stage_result))
+        
+        # A stored criteria analysis is reused as is, so it is not cascaded either
+        analyze_tier = self._first_tier("analyze") if stored_criteria is None else None
+        calculate_tier = self._first_tier("calculate")
+        criteria_analysis, stage_result, clinical_stage, pathologic_stage, explanation = analyze_and_calculate(
+            analyze_tier, calculate_tier, stored_criteria)
+        
+        # Check the TNM codes and stages locally against AJCC8.json; the LLM is only asked again on a mismatch
+        problems = self.validator.validate_stage_result(cancer_category, tnm_values, clinical_stage, pathologic_stage)
+        
+        # An inconsistent stage sends the cascaded stages to the regular deployment, once
+        cascaded = [stage for stage, tier in (("analyze", analyze_tier), ("calculate", calculate_tier)) if tier == "small"]
+        if cascaded:
+            for stage in cascaded:
+                self.cascade_stats.record_outcome(stage, escalated=bool(problems))
+            if problems:
+                logger.info(f"Escalating {' and '.join(cascaded)}: {'; '.join(problems)}")
+                # Criteria analysis is only rerun when it was cascaded
+                criteria_analysis, stage_result, clinical_stage, pathologic_stage, explanation = analyze_and_calculate(
+                    analyze_tier and "large", calculate_tier and "large",
+                    None if "analyze" in cascaded else criteria_analysis)
+                problems = self.validator.validate_stage_result(cancer_category, tnm_values, clinical_stage, pathologic_stage)
+        
+        if problems and self.stage_correction:
+            clinical_stage, pathologic_stage, explanation = self._correct_stage(
+                medical_note, cancer_type, cancer_category, tnm_values, criteria_analysis, stage_result, problems,
+                (clinical_stage, pathologic_stage, explanation))
+        elif problems:
+            logger.warning(f"Stage result is inconsistent with AJCC 8th Edition: {'; '.join(problems)}")
+        
+        if self.artifacts is not None:
+            note_hash = content_hash(medical_note)
+            self.artifacts.put("analyze", analyze_key, criteria_analysis, category=cancer_category, note_hash=note_hash)
+            self.artifacts.put("calculate", calculate_key(criteria_analysis), [clinical_stage, pathologic_stage, explanation],
+                               category=cancer_category, note_hash=note_hash)
+        return criteria_analysis, clinical_stage, pathologic_stage, explanation
+    
+    def generate_report(self, medical_note: str, cancer_type: str, cancer_category: str, clinical_stage: str,
+                        pathologic_stage: str, tnm_values: str, criteria_analysis: str, explanation: str) -> str:
+        """
+        Run the report stage.
+        
+        Args:
+            medical_note: The medical note content
+            cancer_type: The identified cancer type
+            cancer_category: The AJCC category
+            clinical_stage: The clinical stage
+            pathologic_stage: The pathologic stage
+            tnm_values: TNM values from the note
+            criteria_analysis: The criteria analysis
+            explanation: The stage explanation
+            
+        Returns:
+            str: The staging report
+        """
+        key = self._report_key(medical_note, cancer_type, cancer_category, clinical_stage, pathologic_stage, tnm_values,
+                               criteria_analysis, explanation)
+        return self._memoized("report", key, lambda: self._run_stage(
+            "report",
+            None,
+            lambda agent: self.TASKS.generate_report(
+                agent=agent,
+                medical_note=medical_note,
+                cancer_type=cancer_type,
+                cancer_category=cancer_category,
+                clinical_stage=clinical_stage,
+                pathologic_stage=pathologic_stage,
+                tnm_values=tnm_values,
+                criteria_analysis=criteria_analysis,
+                explanation=explanation
+            )
+        ), medical_note, category=cancer_category)
+    
+    def _run_staging_pipeline(self, medical_note: str, prediction: Optional[NotePrediction] = None) -> StagingResult:
+        """
+        Run the identify, analyze, calculate and report stages on a medical note, or the
+        stages up to stop_after.
+        
+        Args:
+            medical_note: The medical note content
+            prediction: Local classifier outputs; a confident category prediction replaces the identify stage
+            
+        Returns:
+            StagingResult: The cancer type, category, stages, TNM values, explanation, report and whether it was staged
+        """
+        cancer_type, cancer_category, tnm_values, proceed_with_staging = self.identify_note(medical_note, prediction)
+        
+        # If the cancer does not exist in the staging system or we should not proceed with staging,
+        # return with default values and don't proceed with further staging
+        if not proceed_with_staging or cancer_category == self.spec.not_stageable:
+            return self._not_stageable_result(cancer_type, cancer_category, tnm_values)
+        
+        if self.stop_after == "identify":
+            return StagingResult.partial(cancer_type, cancer_category, tnm_values)
+        if self.stop_after == "analyze":
+            return StagingResult.partial(cancer_type, cancer_category, tnm_values, criteria_analysis=self.analyze_criteria(
+                medical_note, cancer_type, cancer_category, tnm_values))
+        
+        criteria_analysis, clinical_stage, pathologic_stage, explanation = self.calculate_stages(
+            medical_note, cancer_type, cancer_category, tnm_values)
+        if self.stop_after == "calculate":
+            return StagingResult.partial(cancer_type, cancer_category, tnm_values, criteria_analysis, clinical_stage,
+                                         pathologic_stage, explanation)
+        
+        # Execute the report generation task
+        report = self.generate_report(medical_note, cancer_type, cancer_category, clinical_stage, pathologic_stage,
+                                      tnm_values, criteria_analysis, explanation)
 
-        return cancer_type, cancer_category, clinical_stage, pathologic_stage, tnm_values, explanation, report, True
+        return StagingResult(cancer_type, cancer_category, clinical_stage, pathologic_stage, tnm_values, explanation,
+                             report, True)
+    
+    def _not_stageable_result(self, cancer_type: str, cancer_category: str, tnm_values: str) -> StagingResult:
+        """
+        Result of a note whose cancer the staging system does not cover.
+        """
+        return StagingResult.not_staged(cancer_type, cancer_category, tnm_values,
+                                        f"This cancer type is not included in the {self.spec.title} staging system.",
+                                        "Staging not applicable for this cancer type.")
     
-    def _generate_markdown_report(self, data: List[Dict], medical_note_content: str) -> str:
+    def plan_note(self, medical_note: str, prediction: Optional[NotePrediction] = None) -> Tuple[Dict[str, str], Optional[str]]:
+        """
+        Work out which stages a run would recompute for a note, without any LLM call.
+        
+        A stage is cached when its artifact is stored. Once a stage has to be recomputed,
+        every stage downstream of it is too, because its inputs are not known yet. Stages
+        after stop_after are "not run".
+        
+        Args:
+            medical_note: The medical note content
+            prediction: Local classifier outputs for the note
+            
+        Returns:
+            Tuple: ({stage: "cached", "recompute", "local", "skipped", "not applicable" or "not run"},
+            the note's AJCC category when known)
+        """
+        plan, category = self._plan_stages(medical_note, prediction)
+        for stage in MEMOIZED_STAGES[MEMOIZED_STAGES.index(self.stop_after) + 1:]:
+            if plan[stage] in (ARTIFACT_CACHED, ARTIFACT_RECOMPUTE):
+                plan[stage] = "not run"
+        return plan, category
+    
+    def _plan_stages(self, medical_note: str, prediction: Optional[NotePrediction] = None) -> Tuple[Dict[str, str], Optional[str]]:
+        """
+        Plan of a full run of a note (see plan_note).
+        """
+        plan = {stage: ARTIFACT_RECOMPUTE for stage in MEMOIZED_STAGES}
+        if prediction is not None and self.triage is not None and prediction.triage_score is not None \
+                and prediction.triage_score < self.triage.threshold:
+            return {stage: "skipped" for stage in MEMOIZED_STAGES}, None
+        pipeline = self.pipeline_for(medical_note)
+        if pipeline is not self:
+            return pipeline.plan_note(medical_note)
+        
+        identification = self._local_identification(medical_note, prediction)
+        if identification is not None:
+            plan["identify"] = "local"
+        else:
+            identification = self.artifacts.peek(self._artifact_key("identify", medical_note, mapping=self._mapping_version))
+            if identification is None:
+                return plan, None
+            plan["identify"] = ARTIFACT_CACHED
+        
+        cancer_type, cancer_category, tnm_values, proceed_with_staging = identification
+        if not proceed_with_staging or cancer_category == self.spec.not_stageable:
+            plan.update(analyze="not applicable", calculate="not applicable", report="not applicable")
+            return plan, cancer_category
+        
+        category_version = self._category_version(cancer_category)
+        criteria_analysis = self.artifacts.peek(self._analyze_key(medical_note, cancer_type, cancer_category,
+                                                                  tnm_values, category_version))
+        if criteria_analysis is None:
+            return plan, cancer_category
+        plan["analyze"] = ARTIFACT_CACHED
+        
+        stage = self.artifacts.peek(self._calculate_key(medical_note, cancer_type, cancer_category, tnm_values,
+                                                        category_version, criteria_analysis))
+        if stage is None:
+            return plan, cancer_category
+        plan["calculate"] = ARTIFACT_CACHED
+        
+        clinical_stage, pathologic_stage, explanation = stage
+        report_key = self._report_key(medical_note, cancer_type, cancer_category, clinical_stage, pathologic_stage,
+                                      tnm_values, criteria_analysis, explanation)
+        if self.artifacts.peek(report_key) is not None:
+            plan["report"] = ARTIFACT_CACHED
+        return plan, cancer_category
+    
+    def dry_run(self, source: str, id_column: str = DEFAULT_ID_COLUMN,
+                text_column: str = DEFAULT_TEXT_COLUMN) -> Dict[str, Dict[str, int]]:
+        """
+        Print which stages a run over a note source would recompute, without any LLM call.
+        
+        Args:
+            source: A single note file, a directory of notes, or a JSONL/CSV/Parquet file of notes
+            id_column: Field or column holding the note ID (JSONL/CSV/Parquet sources only)
+            text_column: Field or column holding the note text (JSONL/CSV/Parquet sources only)
+            
+        Returns:
+            Dict: {"stages": {stage: {status: notes}}, "categories": {category: notes with recomputed stages}}
+        """
+        if self.artifacts is None:
+            raise ValueError("A dry run needs an artifact database (artifact_db_path)")
+        
+        if Path(source).suffix.lower() == ".txt":
+            notes = iter([(Path(source).name, self._read_medical_note(source))])
+        else:
+            notes = iter_notes(source, id_column, text_column)
+        classified = (self.local_classifiers.predict_stream(notes) if self.local_classifiers.enabled
+                      else ((note_id, note_text, None) for note_id, note_text in notes))
+        
+        stages: Dict[str, Dict[str, int]] = {stage: {} for stage in MEMOIZED_STAGES}
+        categories: Dict[str, int] = {}
+        total = 0
+        print(f"{'Medical Note':<40} " + " ".join(f"{stage:<15}" for stage in MEMOIZED_STAGES) + "Category")
+        for note_id, note_text, prediction in classified:
+            total += 1
+            plan, cancer_category = self.plan_note(note_text, prediction)
+            for stage, status in plan.items():
+                stages[stage][status] = stages[stage].get(status, 0) + 1
+            if ARTIFACT_RECOMPUTE in plan.values():
+                category = cancer_category or "Unknown (identify not stored)"
+                categories[category] = categories.get(category, 0) + 1
+                print(f"{str(note_id):<40} " + " ".join(f"{plan[stage]:<15}" for stage in MEMOIZED_STAGES) + category)
+        
+        print(f"\nDry run over {total} note(s); only notes with recomputed stages are listed above")
+        for stage in MEMOIZED_STAGES:
+            counts = ", ".join(f"{count} {status}" for status, count in sorted(stages[stage].items()))
+            print(f"  {stage}: {counts or 'no notes'}")
+        if categories:
+            print("Notes with recomputed stages by category:")
+            for category, count in sorted(categories.items(), key=lambda item: -item[1]):
+                print(f"  {category}: {count}")
+        return {"stages": stages, "categories": categories}
+    
+    def _generate_markdown_report(self, data: List[Mapping], medical_note_content: str) -> str:
         """
         Generate a markdown report from the staging results.
         
         Args:
-            data: List of dictionaries containing staging results
+            data: Result rows of the note
             medical_note_content: Content of the medical note
             
         Returns:
@@ -543,21 +1269,17 @@ class AdultCancerStaging:
             markdown += f"**System:** {item['System']}\n\n"
             markdown += f"**TNM Values:** {item['TNM Values']}\n\n"
             markdown += f"**Extracted Stage:** {item['Extracted Stage']}\n\n"
-            markdown += f"**AI Stage Determination:**\n\n"
-            markdown += f"- Clinical Stage: {item['Clinical Stage']}\n"
-            markdown += f"- Pathologic Stage: {item['Pathologic Stage']}\n\n"
-            markdown += f"**Detailed Explanation:**\n\n{item['Explanation']}\n\n"
-            
-            # Process the report to remove the signature block
-            report = item['Report']
-            signature_block_text = "This report is generated for inclusion in the patient's medical records and should be reviewed in conjunction with all other clinical information available for comprehensive care planning."
-            if signature_block_text in report:
-                # Find the position where the signature block starts
-                pos = report.find(signature_block_text)
-                # Trim the report to exclude the signature block
-                report = report[:pos].strip()
-            
-            markdown += f"**Staging Report:**\n\n{report}\n\n"
+            # Runs stopped before the calculate or report stage have no such columns
+            if CRITERIA_ANALYSIS_COLUMN in item:
+                markdown += f"**Criteria Analysis:**\n\n{item[CRITERIA_ANALYSIS_COLUMN]}\n\n"
+            if 'Clinical Stage' in item:
+                markdown += f"**AI Stage Determination:**\n\n"
+                markdown += f"- Clinical Stage: {item['Clinical Stage']}\n"
+                markdown += f"- Pathologic Stage: {item['Pathologic Stage']}\n\n"
+                markdown += f"**Detailed Explanation:**\n\n{item['Explanation']}\n\n"
+            
+            if 'Report' in item:
+                markdown += f"**Staging Report:**\n\n{item['Report']}\n\n"
         
         markdown += "## Complete Medical Note\n\n"
         markdown += "```\n"
@@ -566,221 +1288,388 @@ class AdultCancerStaging:
         
         return markdown
 
-    def process_single_note(self, note_path: str, output_csv: str) -> None:
+    @staticmethod
+    def _timestamped_output_paths(output_csv: str) -> Tuple[str, str]:
+        """
+        Build the timestamped CSV and markdown output paths for a run.
+        
+        Args:
+            output_csv: Path to save the CSV output
+            
+        Returns:
+            Tuple: (csv_output, md_output)
+        """
+        # Create results directory if it doesn't exist
+        results_dir = os.path.dirname(output_csv)
+        if results_dir and not os.path.exists(results_dir):
+            os.makedirs(results_dir)
+        
+        # Get current timestamp for filenames
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        
+        # Adjust output paths to include timestamp
+        output_base = os.path.splitext(output_csv)[0]
+        return f"{output_base}_{timestamp}.csv", f"{output_base}_{timestamp}.md"
+    
+    def _build_result_row(self, note_name: str, extraction_date: str, result: StagingResult,
+                          prediction: Optional[NotePrediction] = None,
+                          medical_note: Optional[str] = None) -> ResultRow:
+        """
+        Build the output row for one processed medical note.
+        
+        Args:
+            note_name: Name of the medical note file
+            extraction_date: Date of extraction (YYYY-MM-DD)
+            result: The result returned by process_note_text
+            prediction: The note's local classifier outputs (recorded when local classifiers are configured)
+            medical_note: The medical note content, for the staging system it was routed to
+            
+        Returns:
+            ResultRow: The result row, deriving its display columns from the result
+        """
+        row = ResultRow(note_name, extraction_date,
+                        STAGING_SYSTEMS[self.route(medical_note) if medical_note is not None else self.SYSTEM].label,
+                        result, stop_after=self.stop_after)
+        if prediction is not None and self.triage is not None:
+            row.triage_score = round(prediction.triage_score, 4)
+            row.triage_decision = "Skipped" if prediction.triage_score < self.triage.threshold else "Staged"
+        if prediction is not None and self.category_classifier is not None:
+            row.predicted_category = prediction.category
+            row.category_confidence = round(prediction.category_confidence, 4)
+        return row
+    
+    @staticmethod
+    def _format_note_block(note_name: str, note_content: str) -> str:
+        """
+        Format one medical note for the "Complete Medical Notes" markdown section.
+        
+        Args:
+            note_name: Name of the medical note
+            note_content: Full content of the medical note
+            
+        Returns:
+            str: Markdown block for the note
+        """
+        return f"### {note_name}\n\n```\n{note_content}\n```\n\n"
+    
+    def cascade_summary(self) -> Optional[str]:
+        """
+        Summarize the model cascade of the calls made so far: escalation rates and the
+        estimated cost and latency saved compared with running every cascaded stage
+        on its regular deployment.
+        
+        Returns:
+            Optional[str]: Markdown section, or None when no stage is cascaded
+        """
+        if not self.cascade_stages:
+            return None
+        large_deployments = {stage: self._stage_agents(stage).deployment_name for stage in self.cascade_stages}
+        return self.cascade_stats.summary(self.cascade_deployment, large_deployments, self.model_prices)
+    
+    @staticmethod
+    def _write_multiple_notes_outputs(all_data: Iterable[Mapping], note_blocks: Iterable[str],
+                                      extraction_date: str, csv_output: str, md_output: str,
+                                      run_summary: Optional[str] = None) -> None:
+        """
+        Save the results of a multiple-note run to CSV and markdown files.
+        
+        Args:
+            all_data: Result rows (ResultRow objects, or dicts read back from partial outputs or a
+                RowSpool), in processing order; iterated several times
+            note_blocks: Markdown blocks of the complete medical notes (see _format_note_block),
+                consumed lazily so the note contents never need to be held in memory together
+            extraction_date: Date of extraction (YYYY-MM-DD)
+            csv_output: Path to save the CSV output
+            md_output: Path to save the markdown output
+            run_summary: Optional markdown section about the run (e.g. the cascade summary)
+        """
+        write_results_csv(all_data, csv_output)
+        print(f"CSV results saved to: {csv_output}")
+        
+        # Write the comprehensive markdown report section by section
+        with open(md_output, 'w', encoding='utf-8') as md:
+            md.write("# Cancer Staging Report - Multiple Notes\n\n")
+            md.write(f"**Date of Extraction:** {extraction_date}\n\n")
+            md.write(f"**Number of Notes Processed:** {len(all_data)}\n\n")
+            
+            # Add explanation of cancer staging terminology
+            md.write("## Understanding Cancer Staging Terminology\n\n")
+            md.write("This report uses the following terms for cancer staging:\n\n")
+            md.write("- **TNM Values**: The raw TNM classification notation (T=Tumor size/extent, N=Node involvement, M=Metastasis) directly extracted from the medical note. Prefixes like 'c' indicate clinical staging, 'p' indicates pathologic staging.\n\n")
+            md.write("- **Extracted Stage**: The exact staging information as written in the original medical note, representing how the healthcare provider documented the stage.\n\n")
+            md.write("- **AI Stage Determination**: The system's interpretation based on AJCC 8th Edition guidelines, consisting of:\n")
+            md.write("  - **Clinical Stage**: Full stage interpretation including TNM values and formal stage grouping based on examinations and imaging\n")
+            md.write("  - **Pathologic Stage**: Stage determination based on surgical/pathological findings (when available)\n\n")
+            
+            # Add summary section
+            md.write("## Summary of Results\n\n")
+            md.write("| Medical Note | Disease | Category | Clinical Stage | Pathologic Stage |\n")
+            md.write("|-------------|---------|----------|----------------|------------------|\n")
+            
+            for item in all_data:
+                md.write(f"| {item['Medical Note']} | {item['Disease']} | {item['Category']} | "
+                         f"{item.get('Clinical Stage', STAGE_NOT_RUN)} | {item.get('Pathologic Stage', STAGE_NOT_RUN)} |\n")
+            
+            md.write("\n## Detailed Results\n\n")
+            
+            # Add detailed section for each note
+            for item in all_data:
+                md.write(f"### Medical Note: {item['Medical Note']}\n\n")
+                md.write(f"**Disease:** {item['Disease']}\n\n")
+                md.write(f"**Category:** {item['Category']}\n\n")
+                md.write(f"**System:** {item['System']}\n\n")
+                md.write(f"**TNM Values:** {item['TNM Values']}\n\n")
+                if item.get('Triage Decision'):
+                    md.write(f"**Triage:** {item['Triage Decision']} (relevance score {item['Triage Score']})\n\n")
+                md.write(f"**Extracted Stage:** {item['Extracted Stage']}\n\n")
+                # Runs stopped before the calculate or report stage have no such columns
+                if CRITERIA_ANALYSIS_COLUMN in item:
+                    md.write(f"**Criteria Analysis:**\n\n{item[CRITERIA_ANALYSIS_COLUMN]}\n\n")
+                if 'Clinical Stage' in item:
+                    md.write(f"**AI Stage Determination:**\n\n")
+                    md.write(f"- Clinical Stage: {item['Clinical Stage']}\n")
+                    md.write(f"- Pathologic Stage: {item['Pathologic Stage']}\n\n")
+                    md.write(f"**Detailed Explanation:**\n\n{item['Explanation']}\n\n")
+                
+                if 'Report' in item:
+                    md.write(f"**Staging Report:**\n\n{item['Report']}\n\n")
+            
+            if run_summary:
+                md.write(run_summary)
+            
+            # Add complete medical notes section
+            md.write("## Complete Medical Notes\n\n")
+            for block in note_blocks:
+                md.write(block)
+        
+        print(f"Markdown report saved to: {md_output}")
+
+    def _open_results_store(self, source: str) -> Tuple[Optional[ResultsStore], Optional[str]]:
+        """
+        Open the results database and register a run, if a database is configured.
+        
+        Args:
+            source: The note, directory or file being processed
+            
+        Returns:
+            Tuple: (results store, run ID), or (None, None) without a results database
+        """
+        if not self.results_db_path:
+            return None, None
+        results_store = ResultsStore(self.results_db_path)
+        run_id = results_store.start_run(model=self.model, source=str(source))
+        return results_store, run_id
+    
+    def process_single_note(self, note_path: str, output_csv: str, output_format: str = "csv") -> None:
         """
         Process a single medical note and save the results to CSV and markdown files.
         
         Args:
             note_path: Path to the medical note file
             output_csv: Path to save the CSV output
+            output_format: "csv" (CSV and markdown), "parquet" (columnar files) or "both"
         """
         try:
-            # Create results directory if it doesn't exist
-            results_dir = os.path.dirname(output_csv)
-            if results_dir and not os.path.exists(results_dir):
-                os.makedirs(results_dir)
-            
-            # Get current timestamp for filenames
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            # Adjust output paths to include timestamp
-            output_base = os.path.splitext(output_csv)[0]
-            csv_output = f"{output_base}_{timestamp}.csv"
-            md_output = f"{output_base}_{timestamp}.md"
+            # Create results directory and timestamped output paths
+            csv_output, md_output = self._timestamped_output_paths(output_csv)
             
             # Get current date for extraction date
             extraction_date = datetime.datetime.now().strftime("%Y-%m-%d")
             
-            # Read the full medical note content
-            with open(note_path, 'r', encoding='utf-8') as f:
-                medical_note_content = f.read()
-            
-            # Process the medical note
-            cancer_type, cancer_category, clinical_stage, pathologic_stage, tnm_values, explanation, report, proceed_with_staging = self.process_medical_note(note_path)
+            # Read the full medical note content once and process it
+            medical_note_content = self._read_medical_note(note_path)
+            note_name = os.path.basename(note_path)
+            prediction = self.classify_notes([medical_note_content])[0]
+            result = self.process_note_text(medical_note_content, note_id=note_name, prediction=prediction)
             
-            # Remove signature block from report
-            signature_block_text = "This report is generated for inclusion in the patient's medical records and should be reviewed in conjunction with all other clinical information available for comprehensive care planning."
-            if signature_block_text in report:
-                # Find the position where the signature block starts
-                pos = report.find(signature_block_text)
-                # Trim the report to exclude the signature block
-                report = report[:pos].strip()
+            get_metrics().inc("staging_notes_total", status="done")
             
             # Create a list for the CSV
-            data = [
-                {
-                    'Medical Note': os.path.basename(note_path),
-                    'Date of Extraction': extraction_date,
-                    'Disease': cancer_type,
-                    'Category': cancer_category,
-                    'System': 'AJCC8 system',
-                    'TNM Values': tnm_values,
-                    'Extracted Stage': tnm_values,  # The TNM values from the note
-                    'Clinical Stage': clinical_stage,
-                    'Pathologic Stage': pathologic_stage,
-                    'AI Stage': f"Clinical: {clinical_stage}, Pathologic: {pathologic_stage}",
-                    'Proceed with Staging': "Yes" if proceed_with_staging else "No",
-                    'Explanation': explanation,
-                    'Report': report
-                }
-            ]
-            
-            # Create a DataFrame
-            df = pd.DataFrame(data)
-            
-            # Save to CSV
-            df.to_csv(csv_output, index=False)
-            print(f"CSV results saved to: {csv_output}")
-            
-            # Generate and save markdown report
-            markdown_content = self._generate_markdown_report(data, medical_note_content)
-            with open(md_output, 'w', encoding='utf-8') as f:
-                f.write(markdown_content)
-            print(f"Markdown report saved to: {md_output}")
+            data = [self._build_result_row(note_name, extraction_date, result, prediction,
+                                           medical_note_content)]
+            
+            with get_tracer().span("write_outputs", note_id=note_name, output_format=output_format):
+                results_store, run_id = self._open_results_store(note_path)
+                if results_store is not None:
+                    results_store.record(run_id, data[0], content_hash(medical_note_content), self.model)
+                    results_store.close()
+                    print(f"Results recorded in {self.results_db_path} (run {run_id})")
+                
+                if output_format in ("parquet", "both"):
+                    parquet_writer = ParquetResultWriter(os.path.splitext(csv_output)[0])
+                    parquet_writer.write_row(data[0])
+                    parquet_writer.close()
+                
+                if output_format in ("csv", "both"):
+                    write_results_csv(data, csv_output)
+                    print(f"CSV results saved to: {csv_output}")
+                    
+                    # Generate and save markdown report
+                    markdown_content = self._generate_markdown_report(data, medical_note_content)
+                    with open(md_output, 'w', encoding='utf-8') as f:
+                        f.write(markdown_content)
+                    print(f"Markdown report saved to: {md_output}")
             
         except Exception as e:
             print(f"Error processing note {note_path}: {e}")
             raise
     
-    def process_multiple_notes(self, note_dir: str, output_csv: str) -> None:
+    def process_multiple_notes(self, note_dir: str, output_csv: str, id_column: str = DEFAULT_ID_COLUMN,
+                               text_column: str = DEFAULT_TEXT_COLUMN, output_format: str = "csv",
+                               retry_policy: Optional[RetryPolicy] = None, retry_queue_size: int = 100) -> None:
         """
         Process multiple medical notes and save the results to CSV and markdown files.
+        A note that fails does not stop the batch: transient failures are retried with
+        backoff, and notes that still fail are written to a dead-letter JSONL file.
         
         Args:
-            note_dir: Directory containing medical notes
+            note_dir: Directory containing medical notes, or a JSONL/CSV/Parquet file of notes
             output_csv: Path to save the CSV output
+            id_column: Field or column holding the note ID (file sources only)
+            text_column: Field or column holding the note text (file sources only)
+            output_format: "csv" (CSV and markdown), "parquet" (columnar files written
+                in row groups during the run) or "both"
+            retry_policy: Attempt limit and backoff for failed notes (defaults to RetryPolicy())
+            retry_queue_size: Maximum number of failed notes waiting for a retry
         """
+        tracer = get_tracer()
+        metrics = get_metrics()
+        parquet_writer = None
+        results_store = None
+        progress = None
+        dead_letter = None
+        memory_profiler = None
+        all_data = RowSpool()
         try:
-            # Create results directory if it doesn't exist
-            results_dir = os.path.dirname(output_csv)
-            if results_dir and not os.path.exists(results_dir):
-                os.makedirs(results_dir)
-            
-            # Get current timestamp for filenames
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            # Adjust output paths to include timestamp
-            output_base = os.path.splitext(output_csv)[0]
-            csv_output = f"{output_base}_{timestamp}.csv"
-            md_output = f"{output_base}_{timestamp}.md"
+            # Create results directory and timestamped output paths
+            csv_output, md_output = self._timestamped_output_paths(output_csv)
+            write_csv = output_format in ("csv", "both")
+            if output_format in ("parquet", "both"):
+                parquet_writer = ParquetResultWriter(os.path.splitext(csv_output)[0])
+            results_store, run_id = self._open_results_store(note_dir)
+            dead_letter = DeadLetterWriter(f"{os.path.splitext(csv_output)[0]}_dead_letter.jsonl")
+            retry_queue = RetryQueue(retry_policy, max_size=retry_queue_size)
             
-            # Find all text files in the directory
-            note_files = list(Path(note_dir).glob('*.txt'))
-            
-            if not note_files:
-                print(f"No .txt files found in {note_dir}")
-                return
-                
             # Get current date for extraction date
             extraction_date = datetime.datetime.now().strftime("%Y-%m-%d")
                 
-            # Process each note and collect results
-            all_data = []
-            all_notes_content = {}
+            # Process each note and collect results; the complete notes are spooled
+            # to a temporary file instead of being kept in memory
+            notes_processed = 0
+            progress = ProgressReporter(total=count_notes(note_dir))
+            if self.memory_budget or self.memory_profile_every:
+                memory_profiler = MemoryProfiler(snapshot_every=self.memory_profile_every)
+                memory_profiler.start()
+            budget = MemoryBudget(self.memory_budget) if self.memory_budget else None
             
-            for note_file in note_files:
-                print(f"Processing {note_file.name}...")
-                
-                # Read the full medical note content
-                with open(note_file, 'r', encoding='utf-8') as f:
-                    medical_note_content = f.read()
-                all_notes_content[note_file.name] = medical_note_content
+            # A note file that cannot be read fails on its own, like a note that fails staging
+            def unreadable_note(note_name: str, error: Exception) -> None:
+                with note_context(note_id=note_name):
+                    dead_letter.write(note_name, "", error, 1)
+                    progress.note_finished(failed=True)
+                    if memory_profiler is not None:
+                        memory_profiler.note_finished()
+                    logger.error(f"Cannot read note: {error}")
+            
+            with tempfile.TemporaryFile(mode='w+', encoding='utf-8') as notes_spool:
+                notes = iter_notes(note_dir, id_column, text_column, on_error=unreadable_note)
                 
-                cancer_type, cancer_category, clinical_stage, pathologic_stage, tnm_values, explanation, report, proceed_with_staging = self.process_medical_note(str(note_file))
+                # Near the memory budget, buffered outputs go to disk and new notes wait for room
+                if budget is not None:
+                    budget.on_pressure(all_data.spill)
+                    budget.on_pressure(notes_spool.flush)
+                    if parquet_writer is not None:
+                        budget.on_pressure(parquet_writer.flush)
+                    if results_store is not None:
+                        budget.on_pressure(results_store.commit)
+                    notes = budget.throttle(notes)
                 
-                # Remove signature block from report
-                signature_block_text = "This report is generated for inclusion in the patient's medical records and should be reviewed in conjunction with all other clinical information available for comprehensive care planning."
-                if signature_block_text in report:
-                    # Find the position where the signature block starts
-                    pos = report.find(signature_block_text)
-                    # Trim the report to exclude the signature block
-                    report = report[:pos].strip()
+                # Run the local classifiers in batches as notes are read; predictions are
+                # kept until the note is done so retries don't classify it again
+                predictions: Dict[str, NotePrediction] = {}
+                if self.local_classifiers.enabled:
+                    def remember_predictions(classified):
+                        for note_id, note_text, prediction in classified:
+                            predictions[note_id] = prediction
+                            yield note_id, note_text
+                    notes = remember_predictions(self.local_classifiers.predict_stream(notes))
                 
-                # Add to data list
-                all_data.append({
-                    'Medical Note': note_file.name,
-                    'Date of Extraction': extraction_date,
-                    'Disease': cancer_type,
-                    'Category': cancer_category,
-                    'System': 'AJCC8 system',
-                    'TNM Values': tnm_values,
-                    'Extracted Stage': tnm_values,  # The TNM values from the note
-                    'Clinical Stage': clinical_stage,
-                    'Pathologic Stage': pathologic_stage,
-                    'AI Stage': f"Clinical: {clinical_stage}, Pathologic: {pathologic_stage}",
-                    'Proceed with Staging': "Yes" if proceed_with_staging else "No",
-                    'Explanation': explanation,
-                    'Report': report
-                })
+                for note_name, medical_note_content, attempt in retry_queue.schedule(notes):
+                    prediction = predictions.get(note_name)
+                    with note_context(note_id=note_name):
+                        logger.info("Processing note", extra={"attempt": attempt})
+                        try:
+                            result = self.process_note_text(medical_note_content, note_id=note_name,
+                                                            prediction=prediction)
+                        except Exception as e:
+                            # Isolate the failure: retry transient errors, dead-letter the rest
+                            if attempt < retry_queue.policy.max_attempts and is_transient(e):
+                                delay = retry_queue.push(note_name, medical_note_content, attempt)
+                                metrics.inc("staging_retries_total")
+                                logger.warning(f"Attempt {attempt} failed, retrying in {delay:.1f}s: {e}")
+                            else:
+                                dead_letter.write(note_name, medical_note_content, e, attempt)
+                                predictions.pop(note_name, None)
+                                progress.note_finished(failed=True)
+                                if memory_profiler is not None:
+                                    memory_profiler.note_finished()
+                                logger.error(f"Giving up after {attempt} attempt(s): {e}")
+                            continue
+                    
+                    predictions.pop(note_name, None)
+                    if write_csv:
+                        notes_spool.write(self._format_note_block(note_name, medical_note_content))
+                    
+                    row = self._build_result_row(note_name, extraction_date, result, prediction, medical_note_content)
+                    notes_processed += 1
+                    progress.note_finished()
+                    if memory_profiler is not None:
+                        memory_profiler.note_finished()
+                    
+                    # Columnar rows and database records are written as the run progresses
+                    with tracer.span("write_row", note_id=note_name):
+                        if parquet_writer is not None:
+                            parquet_writer.write_row(row)
+                        if results_store is not None:
+                            results_store.record(run_id, row, content_hash(medical_note_content), self.model)
+                    
+                    # Add to data list
+                    if write_csv:
+                        all_data.append(row)
                 
-            # Create a DataFrame
-            df = pd.DataFrame(all_data)
-            
-            # Save to CSV
-            df.to_csv(csv_output, index=False)
-            print(f"CSV results saved to: {csv_output}")
-            
-            # Generate a comprehensive markdown report
-            markdown = "# Cancer Staging Report - Multiple Notes\n\n"
-            markdown += f"**Date of Extraction:** {extraction_date}\n\n"
-            markdown += f"**Number of Notes Processed:** {len(all_data)}\n\n"
-            
-            # Add explanation of cancer staging terminology
-            markdown += "## Understanding Cancer Staging Terminology\n\n"
-            markdown += "This report uses the following terms for cancer staging:\n\n"
-            markdown += "- **TNM Values**: The raw TNM classification notation (T=Tumor size/extent, N=Node involvement, M=Metastasis) directly extracted from the medical note. Prefixes like 'c' indicate clinical staging, 'p' indicates pathologic staging.\n\n"
-            markdown += "- **Extracted Stage**: The exact staging information as written in the original medical note, representing how the healthcare provider documented the stage.\n\n"
-            markdown += "- **AI Stage Determination**: The system's interpretation based on AJCC 8th Edition guidelines, consisting of:\n"
-            markdown += "  - **Clinical Stage**: Full stage interpretation including TNM values and formal stage grouping based on examinations and imaging\n"
-            markdown += "  - **Pathologic Stage**: Stage determination based on surgical/pathological findings (when available)\n\n"
-            
-            # Add summary section
-            markdown += "## Summary of Results\n\n"
-            markdown += "| Medical Note | Disease | Category | Clinical Stage | Pathologic Stage |\n"
-            markdown += "|-------------|---------|----------|----------------|------------------|\n"
-            
-            for item in all_data:
-                markdown += f"| {item['Medical Note']} | {item['Disease']} | {item['Category']} | {item['Clinical Stage']} | {item['Pathologic Stage']} |\n"
-            
-            markdown += "\n## Detailed Results\n\n"
-            
-            # Add detailed section for each note
-            for item in all_data:
-                markdown += f"### Medical Note: {item['Medical Note']}\n\n"
-                markdown += f"**Disease:** {item['Disease']}\n\n"
-                markdown += f"**Category:** {item['Category']}\n\n"
-                markdown += f"**System:** {item['System']}\n\n"
-                markdown += f"**TNM Values:** {item['TNM Values']}\n\n"
-                markdown += f"**Extracted Stage:** {item['Extracted Stage']}\n\n"
-                markdown += f"**AI Stage Determination:**\n\n"
-                markdown += f"- Clinical Stage: {item['Clinical Stage']}\n"
-                markdown += f"- Pathologic Stage: {item['Pathologic Stage']}\n\n"
-                markdown += f"**Detailed Explanation:**\n\n{item['Explanation']}\n\n"
+                if not notes_processed:
+                    if dead_letter.count:
+                        print(f"All {dead_letter.count} notes in {note_dir} failed")
+                    else:
+                        print(f"No notes found in {note_dir}")
+                    return
                 
-                # Process the report to remove the signature block
-                report = item['Report']
-                signature_block_text = "This report is generated for inclusion in the patient's medical records and should be reviewed in conjunction with all other clinical information available for comprehensive care planning."
-                if signature_block_text in report:
-                    # Find the position where the signature block starts
-                    pos = report.find(signature_block_text)
-                    # Trim the report to exclude the signature block
-                    report = report[:pos].strip()
+                sections = [self.cascade_summary(), memory_profiler.summary(budget) if memory_profiler else None]
+                run_summary = "".join(section for section in sections if section) or None
+                if run_summary:
+                    print(run_summary)
                 
-                markdown += f"**Staging Report:**\n\n{report}\n\n"
-            
-            # Add complete medical notes section
-            markdown += "## Complete Medical Notes\n\n"
-            for note_name, note_content in all_notes_content.items():
-                markdown += f"### {note_name}\n\n"
-                markdown += "```\n"
-                markdown += note_content
-                markdown += "\n```\n\n"
-            
-            # Save markdown report
-            with open(md_output, 'w', encoding='utf-8') as f:
-                f.write(markdown)
-            print(f"Markdown report saved to: {md_output}")
+                if write_csv:
+                    notes_spool.seek(0)
+                    note_blocks = iter(lambda: notes_spool.read(1 << 20), '')
+                    with tracer.span("write_outputs", notes=notes_processed):
+                        self._write_multiple_notes_outputs(all_data, note_blocks, extraction_date, csv_output, md_output,
+                                                           run_summary=run_summary)
             
         except Exception as e:
             print(f"Error processing notes in {note_dir}: {e}")
-            raise 
\ No newline at end of file
+            raise
+        finally:
+            if progress is not None:
+                progress.close()
+            if dead_letter is not None:
+                dead_letter.close()
+            if memory_profiler is not None:
+                memory_profiler.stop()
+            all_data.close()
+            # Keep the row groups and records written so far even if the run fails
+            if parquet_writer is not None:
+                parquet_writer.close()
+            if results_store is not None:
+                results_store.close()
+                print(f"Results recorded in {self.results_db_path} (run {run_id})")
@@ -202,6 +202,67 @@ class AdultCancerStagingTasks:
             agent=agent
         )
     
+    @staticmethod
+    def correct_stage(agent, medical_note: str, cancer_type: str, cancer_category: str, tnm_values: str,
+                      criteria_analysis: str, previous_result: str, problems: List[str],
+                      tnm_categories: Dict[str, Any], stage_groupings: Dict[str, str]) -> Task:
+        """
+        Creates a task to correct a stage calculation that failed validation against AJCC 8th Edition data.
+        
+        Args:
+            agent: The agent to assign this task to
+            medical_note: The medical note content
+            cancer_type: The identified cancer type
+            cancer_category: The AJCC category the cancer belongs to
+            tnm_values: TNM values extracted from the note
+            criteria_analysis: The detailed analysis of present staging criteria
+            previous_result: The stage calculation that failed validation
+            problems: The inconsistencies found in the previous result
+            tnm_categories: The category's T, N and M codes ({"T": {code: description}, ...})
+            stage_groupings: The category's stage groupings ({"Stage I": "T1, N0, M0", ...})
+            
+        Returns:
+            Task: A CrewAI task for stage correction
+        """
+        valid_codes = "\n".join(f"{axis}: {', '.join(codes)}" for axis, codes in tnm_categories.items() if codes)
+        groupings = "\n".join(f"{stage}: {rule}" for stage, rule in stage_groupings.items())
+        issues = "\n".join(f"- {problem}" for problem in problems)
+        
+        return Task(
+            description=f"""
+            A stage calculation for {cancer_type} (in the {cancer_category} category) is inconsistent
+            with the AJCC 8th Edition data. Correct it.
+            
+            Medical Note:
+            {medical_note}
+            
+            TNM Values (if provided): {tnm_values}
+            
+            Criteria Analysis:
+            {criteria_analysis}
+            
+            Previous Stage Calculation:
+            {previous_result}
+            
+            Inconsistencies Found:
+            {issues}
+            
+            Valid TNM Codes for {cancer_category}:
+            {valid_codes}
+            
+            Stage Groupings for {cancer_category}:
+            {groupings}
+            
+            Use only the valid TNM codes and assign the stage whose grouping matches them.
+            Your response should follow this format:
+            Clinical Stage: [Determined stage with TNM, or 'Insufficient information']
+            Pathologic Stage: [Determined stage with TNM, or 'Insufficient information']
+            Explanation: [Detailed explanation of how you determined the stage and what was corrected]
+            """,
+            expected_output="Corrected clinical and pathologic stages consistent with the AJCC 8th Edition stage groupings",
+            agent=agent
+        )
+    
     @staticmethod
     def generate_report(agent, medical_note: str, cancer_type: str, cancer_category: str, clinical_stage: str, 
                          pathologic_stage: str, tnm_values: str, criteria_analysis: str, explanation: str) -> Task:
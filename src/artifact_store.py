@@ -0,0 +1,148 @@
+"""
+Memoized stage artifacts.
+
+The output of each pipeline stage is stored under a key that hashes
+everything the stage depends on:
+
+- identify: the note, the AJCC category list and disease mapping, the task template and the deployment
+- analyze: the note, the identification, the AJCC8 entry of the category, the task template and the deployment
+- calculate: the same as analyze plus the criteria analysis (and the correction template)
+- report: the note, the stage results, the task template and the deployment
+
+Because every key includes the outputs of the stages upstream of it, a rerun
+recomputes only the stages whose inputs changed. Editing the report template
+reruns only the report stage. Correcting one AJCC8.json category reruns
+analyze, calculate and report only for notes of that category.
+"""
+
+import os
+import json
+import inspect
+import hashlib
+import sqlite3
+import datetime
+import threading
+from typing import Any, Callable, Optional
+
+from .metrics import get_metrics
+
+# Memoized stages in pipeline order
+MEMOIZED_STAGES = ("identify", "analyze", "calculate", "report")
+
+ARTIFACT_CACHED = "cached"
+ARTIFACT_RECOMPUTE = "recompute"
+
+
+def fingerprint(value: Any) -> str:
+    """
+    Hash a JSON-serializable value.
+
+    Args:
+        value: The value (dict keys are sorted, so key order does not matter)
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def template_version(*functions: Callable) -> str:
+    """
+    Version of task templates, taken from the source code of the functions that build them.
+
+    Args:
+        *functions: The task builder functions
+
+    Returns:
+        str: Hex SHA-256 digest of their source (or of their names when the source is unavailable)
+    """
+    sources = []
+    for function in functions:
+        try:
+            sources.append(inspect.getsource(function))
+        except (OSError, TypeError):
+            sources.append(getattr(function, "__qualname__", repr(function)))
+    return fingerprint(sources)
+
+
+class ArtifactStore:
+    """
+    Thread-safe SQLite store of stage outputs keyed by the hash of their inputs.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Open (and create if needed) the artifact database.
+
+        Args:
+            db_path: Path to the SQLite database file
+        """
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=60.0, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS artifacts (
+                key TEXT PRIMARY KEY,
+                stage TEXT NOT NULL,
+                category TEXT,
+                note_hash TEXT,
+                value TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_note ON artifacts (note_hash, stage)")
+        self.conn.commit()
+
+    def peek(self, key: str) -> Optional[Any]:
+        """
+        Read an artifact without counting a cache lookup.
+
+        Args:
+            key: The artifact key
+
+        Returns:
+            Optional[Any]: The stored value, or None
+        """
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM artifacts WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get(self, stage: str, key: str) -> Optional[Any]:
+        """
+        Read an artifact, counting a cache hit or miss.
+
+        Args:
+            stage: Pipeline stage (metric label)
+            key: The artifact key
+
+        Returns:
+            Optional[Any]: The stored value, or None
+        """
+        value = self.peek(key)
+        get_metrics().inc("staging_cache_hits_total" if value is not None else "staging_cache_misses_total", stage=stage)
+        return value
+
+    def put(self, stage: str, key: str, value: Any, category: Optional[str] = None,
+            note_hash: Optional[str] = None) -> None:
+        """
+        Store an artifact.
+
+        Args:
+            stage: Pipeline stage
+            key: The artifact key
+            value: JSON-serializable stage output
+            category: AJCC category the artifact belongs to
+            note_hash: Content hash of the note
+        """
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?)",
+                              (key, stage, category, note_hash, json.dumps(value),
+                               datetime.datetime.now().isoformat()))
+            self.conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
@@ -1,18 +1,134 @@
 """
 Configuration module for Azure OpenAI integration.
+
+All Azure OpenAI calls in a process share one keep-alive, connection-pooled
+HTTP client, and each model/deployment pair gets one LLM instance. Agents
+and concurrent notes therefore reuse warm connections instead of opening new
+TLS sessions. Connection reuse is counted in the run metrics.
 """
 
 import os
+import threading
+import httpx
 from langchain.chat_models.azure_openai import AzureChatOpenAI
 
+from .metrics import get_metrics
+
+# Pool limits of the shared client; change them with configure_http_client before the first call
+HTTP_POOL_SETTINGS = {
+    "max_connections": 20,
+    "max_keepalive_connections": 20,
+    "keepalive_expiry": 120.0,
+    "timeout": 600.0
+}
+
+_lock = threading.Lock()
+_http_client = None
+_llm_cache = {}
+_environment_configured = False
+
+
+def configure_http_client(max_connections=None, max_keepalive_connections=None, keepalive_expiry=None, timeout=None):
+    """
+    Set the pool limits of the shared HTTP client. Has no effect once the client exists.
+
+    Args:
+        max_connections (int, optional): Maximum number of open connections
+        max_keepalive_connections (int, optional): Maximum number of idle connections kept alive
+        keepalive_expiry (float, optional): Seconds an idle connection is kept alive
+        timeout (float, optional): Request timeout in seconds
+    """
+    with _lock:
+        if _http_client is not None:
+            print("Warning: the shared HTTP client already exists; new pool limits are ignored")
+            return
+        for key, value in (("max_connections", max_connections),
+                           ("max_keepalive_connections", max_keepalive_connections),
+                           ("keepalive_expiry", keepalive_expiry), ("timeout", timeout)):
+            if value is not None:
+                HTTP_POOL_SETTINGS[key] = value
+
+
+def _trace_request(request):
+    """
+    httpx request hook: watch the connection events of the request so new
+    connections and TLS handshakes can be told apart from reused connections.
+    """
+    metrics = get_metrics()
+
+    def trace(event_name, info):
+        if event_name == "connection.connect_tcp.started":
+            request.extensions["staging_new_connection"] = True
+            metrics.inc("staging_http_connections_opened_total")
+        elif event_name == "connection.start_tls.started":
+            metrics.inc("staging_http_tls_handshakes_total")
+
+    request.extensions["trace"] = trace
+
+
+def _count_response(response):
+    """
+    httpx response hook: count the request and whether it reused a pooled connection.
+    """
+    metrics = get_metrics()
+    metrics.inc("staging_http_requests_total")
+    if not response.request.extensions.get("staging_new_connection"):
+        metrics.inc("staging_http_connections_reused_total")
+
+
+def get_http_client():
+    """
+    Return the process-wide keep-alive HTTP client, creating it on first use.
+
+    Returns:
+        httpx.Client: The shared client
+    """
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            settings = HTTP_POOL_SETTINGS
+            _http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=settings["max_connections"],
+                    max_keepalive_connections=settings["max_keepalive_connections"],
+                    keepalive_expiry=settings["keepalive_expiry"]
+                ),
+                timeout=settings["timeout"],
+                event_hooks={"request": [_trace_request], "response": [_count_response]}
+            )
+            # Route LiteLLM (used by CrewAI for llm_config models) through the same pool
+            try:
+                import litellm
+                litellm.client_session = _http_client
+            except ImportError:
+                pass
+        return _http_client
+
+
+def _configure_environment(api_key, endpoint, api_version):
+    """
+    Set the OpenAI environment variables CrewAI expects, once per process.
+    """
+    global _environment_configured
+    if _environment_configured:
+        return
+    # For CrewAI compatibility, also set OpenAI environment variables
+    os.environ["OPENAI_API_KEY"] = api_key
+    os.environ["OPENAI_API_BASE"] = endpoint
+    os.environ["OPENAI_API_VERSION"] = api_version
+    os.environ["OPENAI_API_TYPE"] = "azure"
+    _environment_configured = True
+
+
 def get_azure_openai_llm(model_name="gpt-4o-mini", deployment_name=None):
     """
-    Configure and return an Azure OpenAI LLM instance.
-    
+    Configure and return an Azure OpenAI LLM instance. Instances are cached per
+    model and deployment and share the process-wide HTTP client.
+
     Args:
         model_name (str): The name of the model to use
         deployment_name (str, optional): The deployment name to use. If None, will use AZURE_GPT4O_DEPLOYMENT.
-    
+
     Returns:
         AzureChatOpenAI: The configured Azure OpenAI LLM
     """
@@ -20,27 +136,34 @@ def get_azure_openai_llm(model_name="gpt-4o-mini", deployment_name=None):
     api_key = os.getenv("AZURE_API_KEY")
     api_version = os.getenv("AZURE_API_VERSION")
     endpoint = os.getenv("AZURE_ENDPOINT")
-    
+
     if not deployment_name:
         deployment_name = os.getenv("AZURE_GPT4O_DEPLOYMENT")
-    
+
     if not deployment_name:
         deployment_name = model_name
-    
-    # For CrewAI compatibility, also set OpenAI environment variables
-    os.environ["OPENAI_API_KEY"] = api_key
-    os.environ["OPENAI_API_BASE"] = endpoint
-    os.environ["OPENAI_API_VERSION"] = api_version
-    os.environ["OPENAI_API_TYPE"] = "azure"
-    
-    # Create Azure OpenAI LLM with the appropriate configuration
-    llm = AzureChatOpenAI(
-        model=model_name,
-        api_version=api_version,
-        api_key=api_key,
-        base_url=endpoint,
-        deployment_name=deployment_name,
-        azure_deployment=deployment_name,  # Added for backward compatibility
-    )
-    
-    return llm 
\ No newline at end of file
+
+    key = (model_name, deployment_name)
+    llm = _llm_cache.get(key)
+    if llm is not None:
+        return llm
+
+    http_client = get_http_client()
+    with _lock:
+        llm = _llm_cache.get(key)
+        if llm is None:
+            _configure_environment(api_key, endpoint, api_version)
+
+            # Create Azure OpenAI LLM with the appropriate configuration
+            llm = AzureChatOpenAI(
+                model=model_name,
+                api_version=api_version,
+                api_key=api_key,
+                base_url=endpoint,
+                deployment_name=deployment_name,
+                azure_deployment=deployment_name,  # Added for backward compatibility
+                http_client=http_client
+            )
+            _llm_cache[key] = llm
+
+    return llm
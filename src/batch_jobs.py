@@ -0,0 +1,632 @@
+"""
+Offline batch jobs for provider batch APIs.
+
+A batch job stages a corpus in rounds instead of calling the LLM note by note.
+Each round writes the pending stage requests of all notes to a chat-completions
+batch JSONL file, one request per line in the format of the OpenAI and Azure
+OpenAI batch endpoints. When the provider returns the results file, the job
+ingests it. Each answer goes through the pipeline's own parsing and validation,
+each note moves on to its next stage, and the job writes the next round's
+request file. A stage result failing validation gets a correction request in
+the next round. Once no note has a pending stage, the usual CSV, markdown,
+Parquet and results database outputs are written.
+
+The job state (notes, stage outputs, current round) is kept in a SQLite file in
+the job directory, so rounds can be hours apart and run from different
+processes. Stages stored in the pipeline's artifact database are reused without
+a request. LocalBatchRunner stands in for the provider: it turns a request file
+into a results file by answering each request with a callable.
+"""
+
+import os
+import json
+import sqlite3
+import datetime
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
+
+from .adult_staging_module import AdultCancerStaging
+from .note_sources import iter_notes, DEFAULT_ID_COLUMN, DEFAULT_TEXT_COLUMN
+from .onnx_classifiers import NotePrediction
+from .staging_result import StagingResult
+from .result_writers import ParquetResultWriter
+from .results_store import content_hash
+from .retry import DeadLetterWriter, ModelOutputParseError
+from .metrics import get_metrics
+from .run_logging import get_logger, note_context
+
+logger = get_logger("batch")
+
+# Endpoint of every request line
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# Stage values of notes without a pending request
+BATCH_DONE = "done"
+BATCH_FAILED = "failed"
+
+JOB_DB_NAME = "batch_job.db"
+
+
+class BatchRequestError(RuntimeError):
+    """
+    A note's request kept failing in the provider results (error lines, or answers that do not parse).
+    """
+
+
+@dataclass
+class BatchNoteState:
+    """
+    Progress of one note through the stages of a batch job.
+    """
+
+    note_id: str
+    system: str
+    stage: str = "identify"
+    attempts: int = 0
+    error: Optional[str] = None
+    triage_score: Optional[float] = None
+    predicted_category: Optional[str] = None
+    category_confidence: Optional[float] = None
+    cancer_type: Optional[str] = None
+    cancer_category: Optional[str] = None
+    tnm_values: Optional[str] = None
+    criteria_analysis: Optional[str] = None
+    stage_result: Optional[str] = None
+    stages: Optional[List[str]] = None
+    problems: List[str] = field(default_factory=list)
+    result: Optional[List[Any]] = None
+
+    @property
+    def prediction(self) -> Optional[NotePrediction]:
+        if self.triage_score is None and self.category_confidence is None:
+            return None
+        return NotePrediction(self.triage_score, self.predicted_category, self.category_confidence)
+
+    def staging_result(self) -> StagingResult:
+        """
+        The final result of a finished note.
+        """
+        result = StagingResult(*self.result[:len(StagingResult.FIELDS)])
+        result.criteria_analysis = self.criteria_analysis
+        return result
+
+
+def chat_messages(agent: Any, task: Any) -> List[Dict[str, str]]:
+    """
+    Render a stage's agent and task as chat messages, in the layout CrewAI prompts an
+    agent with: the agent's role, backstory and goal as the system message, and the task
+    with its expected output as the user message.
+
+    Args:
+        agent: The CrewAI agent of the stage
+        task: The CrewAI task of the stage
+
+    Returns:
+        List[Dict]: The system and user messages
+    """
+    return [
+        {"role": "system", "content": f"You are {agent.role}. {agent.backstory}\nYour personal goal is: {agent.goal}"},
+        {"role": "user", "content": f"Current Task: {task.description}\n\n"
+                                    f"This is the expected criteria for your final answer: {task.expected_output}\n"
+                                    "you MUST return the actual complete content as the final answer, not a summary."}
+    ]
+
+
+def read_batch_results(results_path: str) -> Dict[str, Tuple[Optional[str], Optional[str], Dict[str, int]]]:
+    """
+    Read a provider batch results file.
+
+    Args:
+        results_path: Path to the results JSONL file
+
+    Returns:
+        Dict: custom_id to (answer, error, token usage); the answer is None when the request failed
+    """
+    results = {}
+    with open(results_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            body = response.get("body") or {}
+            error = item.get("error")
+            answer = None
+            if error:
+                error = (error.get("message") or str(error)) if isinstance(error, dict) else str(error)
+            elif response.get("status_code", 200) != 200:
+                error = f"HTTP {response.get('status_code')}: {(body.get('error') or {}).get('message', '')}".strip()
+            else:
+                try:
+                    answer = body["choices"][0]["message"]["content"]
+                except (KeyError, IndexError, TypeError):
+                    error = "No answer in the response"
+            results[item["custom_id"]] = (answer, error, body.get("usage") or {})
+    return results
+
+
+class LocalBatchRunner:
+    """
+    Local stand-in for a provider batch endpoint: answers every request of a request
+    file with a callable and writes the results file the provider would return.
+    """
+
+    def __init__(self, respond: Callable[[Dict[str, Any]], str]):
+        """
+        Args:
+            respond: Function returning the answer text for a request body
+                (a chat-completions request with "model" and "messages")
+        """
+        self.respond = respond
+
+    def run(self, requests_path: str, results_path: Optional[str] = None) -> str:
+        """
+        Turn a request file into a results file. A request whose answer raises an
+        exception gets an error line instead of a response.
+
+        Args:
+            requests_path: Path to the batch request JSONL file
+            results_path: Path of the results file (defaults to the request file name with
+                "requests" replaced by "results")
+
+        Returns:
+            str: Path to the results file
+        """
+        if results_path is None:
+            directory, name = os.path.split(requests_path)
+            results_path = os.path.join(directory, name.replace("requests", "results", 1))
+        with open(requests_path, 'r', encoding='utf-8') as requests, \
+                open(results_path, 'w', encoding='utf-8') as results:
+            for number, line in enumerate(requests, 1):
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                item = {"id": f"batch_req_{number}", "custom_id": request["custom_id"], "response": None, "error": None}
+                try:
+                    answer = self.respond(request["body"])
+                    item["response"] = {"status_code": 200, "request_id": f"local-{number}", "body": {
+                        "object": "chat.completion",
+                        "model": request["body"].get("model"),
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": answer},
+                                     "finish_reason": "stop"}]
+                    }}
+                except Exception as e:
+                    item["error"] = {"code": type(e).__name__, "message": str(e)}
+                results.write(json.dumps(item) + "\n")
+        return results_path
+
+
+def llm_responder(model: str) -> Callable[[Dict[str, Any]], str]:
+    """
+    Answer batch requests with live calls to the configured Azure OpenAI deployments,
+    for running a batch job without the provider's batch endpoint.
+
+    Args:
+        model: The model name
+
+    Returns:
+        Callable: A respond function for LocalBatchRunner
+    """
+    from .azure_openai_config import get_azure_openai_llm
+
+    def respond(body: Dict[str, Any]) -> str:
+        llm = get_azure_openai_llm(model_name=model, deployment_name=body["model"])
+        return llm.invoke([(message["role"], message["content"]) for message in body["messages"]]).content
+
+    return respond
+
+
+class BatchStagingJob:
+    """
+    Stages a corpus through provider batch request and results files, one stage per round.
+    """
+
+    def __init__(self, staging: AdultCancerStaging, job_dir: str, max_attempts: int = 3):
+        """
+        Open (or create) a batch job.
+
+        Args:
+            staging: The staging pipeline whose prompts, parsing, validation and outputs are used
+            job_dir: Directory of the job state and the request and results files
+            max_attempts: Rounds a note's stage may fail before the note is given up
+        """
+        self.staging = staging
+        self.job_dir = job_dir
+        self.max_attempts = max_attempts
+        os.makedirs(job_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(job_dir, JOB_DB_NAME), timeout=60.0)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS batch_notes (position INTEGER PRIMARY KEY, note_id TEXT NOT NULL, "
+                          "note_text TEXT NOT NULL, stage TEXT NOT NULL, state TEXT NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS batch_notes_stage ON batch_notes (stage)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS batch_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.commit()
+        self._agents: Dict[Tuple[str, str], Any] = {}
+
+    def _meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM batch_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key: str, value: Any) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO batch_meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    @property
+    def round(self) -> int:
+        return int(self._meta("round", "0"))
+
+    @property
+    def prepared(self) -> bool:
+        """
+        Whether notes have been added to the job.
+        """
+        return self.conn.execute("SELECT 1 FROM batch_notes LIMIT 1").fetchone() is not None
+
+    def pending(self) -> int:
+        """
+        Number of notes with a pending stage request.
+        """
+        return self.conn.execute("SELECT COUNT(*) FROM batch_notes WHERE stage NOT IN (?, ?)",
+                                 (BATCH_DONE, BATCH_FAILED)).fetchone()[0]
+
+    def requests_path(self) -> Optional[str]:
+        """
+        Request file of the current round, or None when no stage is pending.
+        """
+        if not self.round or not self.pending():
+            return None
+        return os.path.join(self.job_dir, f"requests_{self.round:03d}.jsonl")
+
+    def prepare(self, source: str, id_column: str = DEFAULT_ID_COLUMN,
+                text_column: str = DEFAULT_TEXT_COLUMN) -> Optional[str]:
+        """
+        Add the notes of a source to the job and write the first request file. Notes
+        skipped by triage, identified by the local category classifier or whose stages
+        are stored in the artifact database need no request.
+
+        Args:
+            source: Directory of notes, or a JSONL/CSV/Parquet file of notes
+            id_column: Field or column holding the note ID (file sources only)
+            text_column: Field or column holding the note text (file sources only)
+
+        Returns:
+            Optional[str]: Path to the first request file, or None when no note needs a request
+        """
+        if self.prepared:
+            raise ValueError(f"The batch job in {self.job_dir} already has notes")
+        staging = self.staging
+        notes = iter_notes(source, id_column, text_column)
+        classified = (staging.local_classifiers.predict_stream(notes) if staging.local_classifiers.enabled
+                      else ((note_id, note_text, None) for note_id, note_text in notes))
+        for position, (note_id, note_text, prediction) in enumerate(classified):
+            with note_context(note_id=note_id):
+                state = BatchNoteState(note_id=note_id, system=staging.route(note_text))
+                if prediction is not None:
+                    state.triage_score = prediction.triage_score
+                    if staging.category_classifier is not None:
+                        state.predicted_category = prediction.category
+                        state.category_confidence = prediction.category_confidence
+                skipped = staging.triage_result(prediction)
+                pipeline = staging.system_pipeline(state.system)
+                if skipped is not None:
+                    self._finish(state, skipped)
+                elif pipeline is staging:
+                    identification = staging._local_identification(note_text, prediction)
+                    if identification is not None:
+                        self._identified(pipeline, state, identification)
+                self._reuse_artifacts(pipeline, state, note_text)
+                self._save(position, note_text, state)
+        self._set_meta("source", source)
+        self._set_meta("extraction_date", datetime.datetime.now().strftime("%Y-%m-%d"))
+        self.conn.commit()
+        return self._write_requests()
+
+    def ingest(self, results_path: str) -> Optional[str]:
+        """
+        Apply a results file to the notes of the current round and write the next request file.
+        Requests that failed, or whose answer does not parse, are requested again in the
+        next round, up to max_attempts.
+
+        Args:
+            results_path: Path to the provider results JSONL file of the current round
+
+        Returns:
+            Optional[str]: Path to the next request file, or None when every note is finished
+        """
+        results = read_batch_results(results_path)
+        metrics = get_metrics()
+        rows = self.conn.execute("SELECT position, note_text, state FROM batch_notes WHERE stage NOT IN (?, ?)",
+                                 (BATCH_DONE, BATCH_FAILED)).fetchall()
+        for position, note_text, state_json in rows:
+            state = BatchNoteState(**json.loads(state_json))
+            pipeline = self.staging.system_pipeline(state.system)
+            stage = state.stage
+            answer, error, usage = results.get(f"{position}-{stage}", (None, "No result for the request", {}))
+            if usage:
+                metrics.inc("staging_tokens_total", usage.get("prompt_tokens", 0), kind="prompt")
+                metrics.inc("staging_tokens_total", usage.get("completion_tokens", 0), kind="completion")
+            with note_context(note_id=state.note_id, stage=stage):
+                if answer is not None:
+                    try:
+                        self._apply_answer(pipeline, state, note_text, answer)
+                        state.attempts, state.error = 0, None
+                        self._reuse_artifacts(pipeline, state, note_text)
+                    except ModelOutputParseError as e:
+                        error = str(e)
+                if error is not None:
+                    metrics.inc("staging_errors_total", stage=stage)
+                    state.attempts += 1
+                    state.error = error
+                    if state.attempts >= self.max_attempts:
+                        logger.error(f"Giving up after {state.attempts} failed {stage} request(s): {error}")
+                        state.stage = BATCH_FAILED
+                    else:
+                        logger.warning(f"{stage} request failed, requesting it again: {error}")
+                metrics.inc("staging_batch_results_total", stage=stage, outcome="failed" if error else "done")
+            self._save(position, note_text, state)
+        self.conn.commit()
+        return self._write_requests()
+
+    def _save(self, position: int, note_text: str, state: BatchNoteState) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO batch_notes (position, note_id, note_text, stage, state) "
+                          "VALUES (?, ?, ?, ?, ?)",
+                          (position, state.note_id, note_text, state.stage, json.dumps(asdict(state))))
+
+    def _write_requests(self) -> Optional[str]:
+        """
+        Write the request file of the next round, with one request per note with a pending stage.
+        """
+        if not self.pending():
+            print(f"Batch job finished: no pending requests in {self.job_dir}")
+            return None
+        next_round = self.round + 1
+        path = os.path.join(self.job_dir, f"requests_{next_round:03d}.jsonl")
+        metrics = get_metrics()
+        count = 0
+        with open(path, 'w', encoding='utf-8') as f:
+            for position, note_text, state_json in self.conn.execute(
+                    "SELECT position, note_text, state FROM batch_notes WHERE stage NOT IN (?, ?) ORDER BY position",
+                    (BATCH_DONE, BATCH_FAILED)):
+                state = BatchNoteState(**json.loads(state_json))
+                f.write(json.dumps(self._request(position, state, note_text)) + "\n")
+                metrics.inc("staging_batch_requests_total", stage=state.stage)
+                count += 1
+        self._set_meta("round", next_round)
+        self.conn.commit()
+        print(f"Round {next_round}: {count} requests written to {path}")
+        return path
+
+    def _agent(self, pipeline: AdultCancerStaging, stage: str) -> Any:
+        """
+        The agent of a stage, created once per staging system (its prompt does not depend on the note).
+        """
+        key = (pipeline.SYSTEM, stage)
+        agent = self._agents.get(key)
+        if agent is None:
+            agent = self._agents[key] = getattr(pipeline._stage_agents(stage), pipeline.STAGE_AGENT_FACTORIES[stage])()
+        return agent
+
+    def _request(self, position: int, state: BatchNoteState, note_text: str) -> Dict[str, Any]:
+        """
+        The batch request line of a note's pending stage.
+        """
+        pipeline = self.staging.system_pipeline(state.system)
+        stage = state.stage
+        agent = self._agent(pipeline, stage)
+        tasks = pipeline.TASKS
+        if stage == "identify":
+            task = tasks.identify_cancer_type(agent=agent, medical_note=note_text, staging_data=pipeline.staging_data,
+                                              available_categories=pipeline.available_categories,
+                                              disease_mapping=pipeline.disease_mapping)
+        elif stage == "analyze":
+            task = tasks.analyze_staging_criteria(agent=agent, medical_note=note_text, cancer_type=state.cancer_type,
+                                                  cancer_category=state.cancer_category, tnm_values=state.tnm_values,
+                                                  staging_data=pipeline.staging_data)
+        elif stage == "calculate":
+            task = tasks.calculate_stage(agent=agent, medical_note=note_text, cancer_type=state.cancer_type,
+                                         cancer_category=state.cancer_category, tnm_values=state.tnm_values,
+                                         criteria_analysis=state.criteria_analysis, staging_data=pipeline.staging_data)
+        elif stage == "correct":
+            tnm_categories, stage_groupings = pipeline.validator.reference(state.cancer_category)
+            task = tasks.correct_stage(agent=agent, medical_note=note_text, cancer_type=state.cancer_type,
+                                       cancer_category=state.cancer_category, tnm_values=state.tnm_values,
+                                       criteria_analysis=state.criteria_analysis, previous_result=state.stage_result,
+                                       problems=state.problems, tnm_categories=tnm_categories,
+                                       stage_groupings=stage_groupings)
+        else:
+            clinical_stage, pathologic_stage, explanation = state.stages
+            task = tasks.generate_report(agent=agent, medical_note=note_text, cancer_type=state.cancer_type,
+                                         cancer_category=state.cancer_category, clinical_stage=clinical_stage,
+                                         pathologic_stage=pathologic_stage, tnm_values=state.tnm_values,
+                                         criteria_analysis=state.criteria_analysis, explanation=explanation)
+        return {
+            "custom_id": f"{position}-{stage}",
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": {"model": pipeline._stage_agents(stage).deployment_name, "messages": chat_messages(agent, task)}
+        }
+
+    def _artifact_key(self, pipeline: AdultCancerStaging, state: BatchNoteState, note_text: str) -> Optional[str]:
+        """
+        Artifact key of a note's pending stage (None for the correction stage, which is not memoized).
+        """
+        if state.stage == "identify":
+            return pipeline._artifact_key("identify", note_text, mapping=pipeline._mapping_version)
+        if state.stage not in ("analyze", "calculate", "report"):
+            return None
+        category_version = pipeline._category_version(state.cancer_category)
+        if state.stage == "analyze":
+            return pipeline._analyze_key(note_text, state.cancer_type, state.cancer_category, state.tnm_values,
+                                         category_version)
+        if state.stage == "calculate":
+            return pipeline._calculate_key(note_text, state.cancer_type, state.cancer_category, state.tnm_values,
+                                           category_version, state.criteria_analysis)
+        return pipeline._report_key(note_text, state.cancer_type, state.cancer_category, *state.stages[:2],
+                                    state.tnm_values, state.criteria_analysis, state.stages[2])
+
+    def _store(self, pipeline: AdultCancerStaging, state: BatchNoteState, note_text: str, value: Any) -> None:
+        """
+        Store the output of a note's pending stage in the artifact database, if there is one.
+        """
+        if pipeline.artifacts is not None:
+            pipeline.artifacts.put(state.stage, self._artifact_key(pipeline, state, note_text), value,
+                                   category=state.cancer_category, note_hash=content_hash(note_text))
+
+    def _reuse_artifacts(self, pipeline: AdultCancerStaging, state: BatchNoteState, note_text: str) -> None:
+        """
+        Move a note past the stages whose outputs are stored in the artifact database.
+        """
+        while pipeline.artifacts is not None:
+            key = self._artifact_key(pipeline, state, note_text)
+            value = pipeline.artifacts.get(state.stage, key) if key is not None else None
+            if value is None:
+                return
+            logger.info(f"Reusing the stored {state.stage} artifact")
+            if state.stage == "identify":
+                self._identified(pipeline, state, tuple(value))
+            elif state.stage == "analyze":
+                self._analyzed(pipeline, state, value)
+            elif state.stage == "calculate":
+                self._calculated(pipeline, state, tuple(value))
+            else:
+                self._finish(state, StagingResult(state.cancer_type, state.cancer_category, state.stages[0],
+                                                  state.stages[1], state.tnm_values, state.stages[2], value, True))
+
+    def _apply_answer(self, pipeline: AdultCancerStaging, state: BatchNoteState, note_text: str, answer: str) -> None:
+        """
+        Parse and validate the answer to a note's pending stage, and move the note to its next stage.
+
+        Raises:
+            ModelOutputParseError: When the answer does not parse
+        """
+        stage = state.stage
+        if stage == "identify":
+            identification = pipeline._parse_identification(answer)
+            self._store(pipeline, state, note_text, identification)
+            self._identified(pipeline, state, identification)
+        elif stage == "analyze":
+            self._store(pipeline, state, note_text, answer)
+            self._analyzed(pipeline, state, answer)
+        elif stage == "calculate":
+            stages = pipeline._parse_stage_result(answer)
+            problems = pipeline.validator.validate_stage_result(state.cancer_category, state.tnm_values,
+                                                                stages[0], stages[1])
+            if problems and pipeline.stage_correction:
+                # The correction is requested in the next round
+                logger.info(f"Requesting stage correction: {'; '.join(problems)}")
+                state.stage_result, state.stages, state.problems = answer, list(stages), problems
+                state.stage = "correct"
+                return
+            if problems:
+                logger.warning(f"Stage result is inconsistent with {pipeline.spec.title}: {'; '.join(problems)}")
+            self._store(pipeline, state, note_text, list(stages))
+            self._calculated(pipeline, state, stages)
+        elif stage == "correct":
+            stages = pipeline._accept_correction(state.cancer_category, state.tnm_values, state.problems,
+                                                 tuple(state.stages), answer)
+            state.stage = "calculate"
+            self._store(pipeline, state, note_text, list(stages))
+            self._calculated(pipeline, state, stages)
+        else:
+            self._store(pipeline, state, note_text, answer)
+            clinical_stage, pathologic_stage, explanation = state.stages
+            self._finish(state, StagingResult(state.cancer_type, state.cancer_category, clinical_stage,
+                                              pathologic_stage, state.tnm_values, explanation, answer, True))
+
+    def _identified(self, pipeline: AdultCancerStaging, state: BatchNoteState,
+                    identification: Tuple[str, str, str, bool]) -> None:
+        state.cancer_type, state.cancer_category, state.tnm_values, proceed_with_staging = identification
+        if not proceed_with_staging or state.cancer_category == pipeline.spec.not_stageable:
+            self._finish(state, pipeline._not_stageable_result(state.cancer_type, state.cancer_category,
+                                                               state.tnm_values))
+        elif pipeline.stop_after == "identify":
+            self._finish(state, StagingResult.partial(state.cancer_type, state.cancer_category, state.tnm_values))
+        else:
+            state.stage = "analyze"
+
+    def _analyzed(self, pipeline: AdultCancerStaging, state: BatchNoteState, criteria_analysis: str) -> None:
+        state.criteria_analysis = criteria_analysis
+        if pipeline.stop_after == "analyze":
+            self._finish(state, StagingResult.partial(state.cancer_type, state.cancer_category, state.tnm_values,
+                                                      criteria_analysis=criteria_analysis))
+        else:
+            state.stage = "calculate"
+
+    def _calculated(self, pipeline: AdultCancerStaging, state: BatchNoteState, stages: Tuple[str, str, str]) -> None:
+        state.stages = list(stages)
+        if pipeline.stop_after == "calculate":
+            self._finish(state, StagingResult.partial(state.cancer_type, state.cancer_category, state.tnm_values,
+                                                      state.criteria_analysis, *stages))
+        else:
+            state.stage = "report"
+
+    @staticmethod
+    def _finish(state: BatchNoteState, result: StagingResult) -> None:
+        state.result = list(result)
+        state.stage = BATCH_DONE
+
+    def _finished_notes(self) -> Iterator[Tuple[str, str, BatchNoteState]]:
+        for note_id, note_text, state_json in self.conn.execute(
+                "SELECT note_id, note_text, state FROM batch_notes ORDER BY position"):
+            yield note_id, note_text, BatchNoteState(**json.loads(state_json))
+
+    def write_outputs(self, output_csv: str, output_format: str = "csv") -> None:
+        """
+        Write the results of a finished job like a multiple-note run: CSV and markdown
+        and/or Parquet files, the results database, and a dead-letter file of the notes
+        whose requests kept failing.
+
+        Args:
+            output_csv: Path to save the CSV output
+            output_format: "csv" (CSV and markdown), "parquet" (columnar files) or "both"
+        """
+        pending = self.pending()
+        if pending:
+            raise ValueError(f"{pending} notes of the batch job still have pending requests")
+        staging = self.staging
+        csv_output, md_output = staging._timestamped_output_paths(output_csv)
+        extraction_date = self._meta("extraction_date")
+        parquet_writer = ParquetResultWriter(os.path.splitext(csv_output)[0]) if output_format in ("parquet", "both") else None
+        results_store, run_id = staging._open_results_store(self._meta("source", self.job_dir))
+        dead_letter = DeadLetterWriter(f"{os.path.splitext(csv_output)[0]}_dead_letter.jsonl")
+        rows = []
+        try:
+            for note_id, note_text, state in self._finished_notes():
+                if state.stage == BATCH_FAILED:
+                    dead_letter.write(note_id, note_text, BatchRequestError(state.error), state.attempts)
+                    get_metrics().inc("staging_notes_total", status="failed")
+                    continue
+                get_metrics().inc("staging_notes_total", status="done")
+                row = staging._build_result_row(note_id, extraction_date, state.staging_result(), state.prediction,
+                                                note_text)
+                if parquet_writer is not None:
+                    parquet_writer.write_row(row)
+                if results_store is not None:
+                    results_store.record(run_id, row, content_hash(note_text), staging.model)
+                rows.append(row)
+        finally:
+            dead_letter.close()
+            if parquet_writer is not None:
+                parquet_writer.close()
+            if results_store is not None:
+                results_store.close()
+                print(f"Results recorded in {staging.results_db_path} (run {run_id})")
+        if not rows:
+            print(f"No staged notes in the batch job {self.job_dir}")
+            return
+        if output_format in ("csv", "both"):
+            note_blocks = (staging._format_note_block(note_id, note_text)
+                           for note_id, note_text, state in self._finished_notes() if state.stage == BATCH_DONE)
+            staging._write_multiple_notes_outputs(rows, note_blocks, extraction_date, csv_output, md_output)
+
+    def run_locally(self, runner: LocalBatchRunner) -> None:
+        """
+        Run the pending rounds of the job through a local stand-in until every note is finished.
+
+        Args:
+            runner: The local batch runner answering the requests
+        """
+        requests_path = self.requests_path()
+        while requests_path is not None:
+            requests_path = self.ingest(runner.run(requests_path))
+
+    def close(self) -> None:
+        self.conn.close()
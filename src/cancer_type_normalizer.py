@@ -0,0 +1,197 @@
+"""
+Normalization of free-text cancer types to staging categories.
+
+The rules are those of the pipeline's category matching, applied in order:
+
+- exact: the lowercased text is a disease variation of the mapping
+- partial: the text contains a disease variation, or is contained in one, and
+  more than half of their words match (the first such variation in mapping order wins)
+- keyword: the text contains a common cancer term (e.g. "renal"), and the
+  category most of the variations with that term map to is used
+- none: the system's not-stageable category
+
+The tables behind the rules are built once per disease mapping: a word index
+of the variations for partial matches, and one category per keyword. For bulk
+input (a pandas Series or a pyarrow array), normalize() first de-duplicates the
+values. It then applies the exact and keyword rules to all distinct values with
+vectorized string operations, and only checks partial matches for the distinct
+values that have no exact match.
+"""
+
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+RULE_EXACT = "exact"
+RULE_PARTIAL = "partial"
+RULE_KEYWORD = "keyword"
+RULE_NONE = "none"
+
+# Common cancer terms and related words, in the order they are tried
+CATEGORY_KEYWORDS = {
+    "breast": ["mammary", "ductal", "lobular"],
+    "lung": ["pulmonary", "bronch", "respiratory"],
+    "colon": ["colorectal", "rectal", "bowel", "intestinal"],
+    "stomach": ["gastric", "gastroesophageal"],
+    "liver": ["hepatic", "hepatocellular", "hepato"],
+    "pancreas": ["pancreatic", "islet cell"],
+    "kidney": ["renal", "nephro"],
+    "prostate": ["prostatic", "psa"],
+    "bladder": ["urothelial", "transitional cell"],
+    "brain": ["cerebral", "glio", "neural", "cns"],
+    "lymphoma": ["lymphatic", "hodgkin", "non-hodgkin"],
+    "leukemia": ["myeloid", "lymphoblastic", "hematologic"],
+    "melanoma": ["skin cancer", "dermal", "cutaneous"],
+    "thyroid": ["thyroidal", "papillary", "follicular"]
+}
+
+
+class CancerTypeNormalizer:
+    """
+    Maps cancer type text to staging categories, one value at a time or in bulk.
+    """
+
+    def __init__(self, disease_mapping: Dict[str, str], not_stageable: str):
+        """
+        Build the matching tables.
+
+        Args:
+            disease_mapping: Lowercase disease variation to category, in priority order
+            not_stageable: Category of cancers the staging system does not cover
+        """
+        self.disease_mapping = disease_mapping
+        self.not_stageable = not_stageable
+
+        # Partial matches need a shared word, so only variations sharing a word are candidates
+        self._variations: List[Tuple[str, int, str]] = []
+        self._word_index: Dict[str, List[int]] = {}
+        for position, (variation, category) in enumerate(disease_mapping.items()):
+            words = variation.split()
+            self._variations.append((variation, len(words), category))
+            for word in set(words):
+                self._word_index.setdefault(word, []).append(position)
+
+        # The category of each keyword does not depend on the text, only on the mapping
+        self._keywords: List[Tuple[Tuple[str, ...], str]] = []
+        for key_term, related_terms in CATEGORY_KEYWORDS.items():
+            terms = (key_term, *related_terms)
+            matching_categories = [category for variation, category in disease_mapping.items()
+                                   if any(term in variation.lower() for term in terms)]
+            if matching_categories:
+                self._keywords.append((terms, Counter(matching_categories).most_common(1)[0][0]))
+
+    def _partial(self, cancer_lower: str) -> Optional[str]:
+        """
+        Category of the first variation that contains the text or is contained in it,
+        with more than half of their words matching.
+        """
+        text_words = cancer_lower.split()
+        words = set(text_words)
+        candidates = set()
+        for word in words:
+            candidates.update(self._word_index.get(word, ()))
+        for position in sorted(candidates):
+            variation, variation_words, category = self._variations[position]
+            if variation in cancer_lower or cancer_lower in variation:
+                overlap = len(set(variation.split()) & words) / max(variation_words, len(text_words))
+                if overlap > 0.5:
+                    return category
+        return None
+
+    def match(self, cancer_type: str) -> Tuple[str, str]:
+        """
+        Normalize one cancer type.
+
+        Args:
+            cancer_type: Free-text cancer type
+
+        Returns:
+            Tuple: (category, rule), the rule being "exact", "partial", "keyword" or "none"
+        """
+        cancer_lower = cancer_type.lower()
+        category = self.disease_mapping.get(cancer_lower)
+        if category is not None:
+            return category, RULE_EXACT
+        category = self._partial(cancer_lower)
+        if category is not None:
+            return category, RULE_PARTIAL
+        for terms, category in self._keywords:
+            if any(term in cancer_lower for term in terms):
+                return category, RULE_KEYWORD
+        return self.not_stageable, RULE_NONE
+
+    def _normalize_unique(self, values: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Normalize distinct, non-null values.
+
+        Args:
+            values: Distinct cancer types
+
+        Returns:
+            Tuple: (categories, rules) as object arrays aligned with values
+        """
+        lower = values.astype(str).str.lower()
+        exact = lower.map(self.disease_mapping)
+        categories = exact.to_numpy(dtype=object)
+        rules = np.where(exact.notna().to_numpy(), RULE_EXACT, RULE_NONE).astype(object)
+        remaining = exact.isna().to_numpy().copy()
+
+        lower_values = lower.to_numpy(dtype=object)
+        for i in np.flatnonzero(remaining):
+            category = self._partial(lower_values[i])
+            if category is not None:
+                categories[i] = category
+                rules[i] = RULE_PARTIAL
+                remaining[i] = False
+
+        for terms, category in self._keywords:
+            if not remaining.any():
+                break
+            pattern = "|".join(re.escape(term) for term in terms)
+            matched = remaining & lower.str.contains(pattern, regex=True).to_numpy()
+            categories[matched] = category
+            rules[matched] = RULE_KEYWORD
+            remaining &= ~matched
+
+        categories[remaining] = self.not_stageable
+        return categories, rules
+
+    def normalize(self, values: Any) -> Any:
+        """
+        Normalize many cancer types at once. Each distinct value is matched once.
+
+        Args:
+            values: A pandas Series, a pyarrow Array or ChunkedArray, or any sequence of strings
+
+        Returns:
+            A DataFrame with "category" and "rule" columns on the index of values, or a
+            pyarrow Table with the same columns for pyarrow input. Missing values have
+            no category or rule.
+        """
+        if type(values).__module__.startswith("pyarrow"):
+            return self._normalize_arrow(values)
+        series = values if isinstance(values, pd.Series) else pd.Series(list(values), dtype=object)
+        codes, uniques = pd.factorize(series)
+        categories, rules = self._normalize_unique(pd.Series(uniques, dtype=object))
+        # Code -1 (missing value) takes the trailing None
+        categories = np.append(categories, None)[codes]
+        rules = np.append(rules, None)[codes]
+        return pd.DataFrame({"category": categories, "rule": rules}, index=series.index)
+
+    def _normalize_arrow(self, values: Any) -> Any:
+        """
+        Normalize a pyarrow Array or ChunkedArray through its dictionary encoding.
+        """
+        import pyarrow as pa
+
+        if isinstance(values, pa.ChunkedArray):
+            values = values.combine_chunks()
+        encoded = values.dictionary_encode()
+        categories, rules = self._normalize_unique(pd.Series(encoded.dictionary.to_pylist(), dtype=object))
+        return pa.table({
+            "category": pa.array(categories, type=pa.string()).take(encoded.indices),
+            "rule": pa.array(rules, type=pa.string()).take(encoded.indices)
+        })
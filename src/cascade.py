@@ -0,0 +1,266 @@
+"""
+Per-stage model routing and the cheap-model-first cascade.
+
+Stages can be routed to specific Azure deployments. Cascaded stages (identify
+and analyze by default) first run on a small, fast deployment and are rerun on
+the stage's regular deployment only when the result fails local validation
+(see stage_validation). CascadeStats records calls, tokens and time per tier
+and summarizes the cost and latency saved for the run report. DeploymentUsage
+records the calls and tokens of every stage by deployment, for costing runs.
+"""
+
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+DEFAULT_CASCADE_STAGES = ("identify", "analyze")
+
+# Stages whose results can be checked locally, and so can be escalated
+CASCADABLE_STAGES = ("identify", "analyze", "calculate")
+
+
+def parse_stage_models(text: str) -> Dict[str, str]:
+    """
+    Parse per-stage deployments from the command line.
+
+    Args:
+        text: "identify=gpt-4o-mini,report=gpt-4o"
+
+    Returns:
+        Dict: Mapping of stage to deployment name
+    """
+    try:
+        return {stage.strip(): deployment.strip()
+                for stage, deployment in (part.split("=", 1) for part in text.split(",") if part.strip())}
+    except ValueError:
+        raise ValueError(f"Invalid stage models '{text}'. Expected e.g. 'identify=gpt-4o-mini,report=gpt-4o'")
+
+
+def parse_model_prices(text: str) -> Dict[str, Tuple[float, float]]:
+    """
+    Parse deployment prices from the command line.
+
+    Args:
+        text: "gpt-4o=2.5/10,gpt-4o-mini=0.15/0.6" (USD per million input/output tokens)
+
+    Returns:
+        Dict: Mapping of deployment to (input price, output price) per million tokens
+    """
+    prices = {}
+    try:
+        for part in text.split(","):
+            if not part.strip():
+                continue
+            deployment, price = part.split("=", 1)
+            input_price, output_price = price.split("/", 1)
+            prices[deployment.strip()] = (float(input_price), float(output_price))
+    except ValueError:
+        raise ValueError(f"Invalid model prices '{text}'. Expected e.g. 'gpt-4o=2.5/10,gpt-4o-mini=0.15/0.6'")
+    return prices
+
+
+def _token_usage(crew_result: Any) -> Tuple[int, int]:
+    """
+    (prompt tokens, completion tokens) reported by a crew result.
+    """
+    usage = getattr(crew_result, "token_usage", None)
+    if usage is None:
+        return 0, 0
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens", 0) or 0, usage.get("completion_tokens", 0) or 0
+    return getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
+
+
+class CascadeStats:
+    """
+    Thread-safe per-stage, per-tier accounting of cascaded calls.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, Dict[str, Any]] = {}
+
+    def _stage(self, stage: str) -> Dict[str, Any]:
+        return self.stages.setdefault(stage, {
+            "accepted": 0, "escalated": 0,
+            "small": {"calls": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0},
+            "large": {"calls": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0}
+        })
+
+    def record_call(self, stage: str, tier: str, seconds: float, crew_result: Any) -> None:
+        """
+        Record one call of a cascaded stage.
+
+        Args:
+            stage: Pipeline stage
+            tier: "small" or "large"
+            seconds: Call duration
+            crew_result: The object returned by Crew.kickoff (for token usage)
+        """
+        prompt_tokens, completion_tokens = _token_usage(crew_result)
+        with self._lock:
+            totals = self._stage(stage)[tier]
+            totals["calls"] += 1
+            totals["seconds"] += seconds
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+
+    def record_outcome(self, stage: str, escalated: bool) -> None:
+        """
+        Record whether a small-tier result was accepted or escalated.
+
+        Args:
+            stage: Pipeline stage
+            escalated: True if the result was rerun on the large tier
+        """
+        with self._lock:
+            self._stage(stage)["escalated" if escalated else "accepted"] += 1
+
+    @staticmethod
+    def _cost(totals: Dict[str, Any], price: Optional[Tuple[float, float]]) -> Optional[float]:
+        if price is None:
+            return None
+        return (totals["prompt_tokens"] * price[0] + totals["completion_tokens"] * price[1]) / 1_000_000
+
+    def summary(self, small_deployment: str, large_deployments: Dict[str, str],
+                prices: Optional[Dict[str, Tuple[float, float]]] = None) -> Optional[str]:
+        """
+        Format the cascade section of the run report.
+
+        The baseline is every cascaded call running on the large tier. Accepted
+        small-tier calls are costed at large-tier prices with the same tokens, and
+        timed at the stage's average large-tier latency (when one was observed).
+
+        Args:
+            small_deployment: The cascade (small) deployment
+            large_deployments: Mapping of stage to its regular (large) deployment
+            prices: Deployment prices per million (input, output) tokens
+
+        Returns:
+            Optional[str]: Markdown section, or None when no cascaded call was made
+        """
+        prices = prices or {}
+        with self._lock:
+            stages = {stage: {"accepted": data["accepted"], "escalated": data["escalated"],
+                              "small": dict(data["small"]), "large": dict(data["large"])}
+                      for stage, data in self.stages.items()}
+        if not stages:
+            return None
+
+        lines = ["## Model Cascade\n",
+                 f"Cascaded stages run on `{small_deployment}` first and are escalated when validation fails.\n",
+                 "| Stage | Large deployment | Small calls | Accepted | Escalated | Escalation rate | Avg small (s) | Avg large (s) | Small tokens | Large tokens |",
+                 "|-------|------------------|-------------|----------|-----------|-----------------|---------------|---------------|--------------|--------------|"]
+        actual_cost = baseline_cost = 0.0
+        cost_known = True
+        actual_seconds = baseline_seconds = 0.0
+        latency_known = True
+        for stage, data in stages.items():
+            small, large = data["small"], data["large"]
+            outcomes = data["accepted"] + data["escalated"]
+            avg_small = small["seconds"] / small["calls"] if small["calls"] else None
+            avg_large = large["seconds"] / large["calls"] if large["calls"] else None
+            large_deployment = large_deployments.get(stage, "")
+            escalation_rate = f"{data['escalated'] / outcomes:.0%}" if outcomes else "-"
+            lines.append(
+                f"| {stage} | {large_deployment} | {small['calls']} | {data['accepted']} | {data['escalated']} | "
+                f"{escalation_rate} | {'-' if avg_small is None else f'{avg_small:.1f}'} | "
+                f"{'-' if avg_large is None else f'{avg_large:.1f}'} | "
+                f"{small['prompt_tokens'] + small['completion_tokens']} | {large['prompt_tokens'] + large['completion_tokens']} |"
+            )
+
+            # Share of the small-tier calls whose result was kept
+            accepted_share = data["accepted"] / outcomes if outcomes else 0.0
+            small_cost = self._cost(small, prices.get(small_deployment))
+            large_cost = self._cost(large, prices.get(large_deployment))
+            small_on_large = self._cost(small, prices.get(large_deployment))
+            if None in (small_cost, large_cost, small_on_large):
+                cost_known = False
+            else:
+                actual_cost += small_cost + large_cost
+                # Escalated notes ran on the large tier anyway; accepted ones would have cost
+                # their small-tier tokens at large-tier prices
+                baseline_cost += small_on_large * accepted_share + large_cost
+
+            actual_seconds += small["seconds"] + large["seconds"]
+            if avg_large is None:
+                latency_known = False
+            else:
+                baseline_seconds += small["calls"] * avg_large
+
+        lines.append("")
+        if cost_known and baseline_cost > 0:
+            saved = baseline_cost - actual_cost
+            lines.append(f"**Estimated cost:** ${actual_cost:.4f} (all-large baseline ${baseline_cost:.4f}, "
+                         f"saved ${saved:.4f}, {saved / baseline_cost:.0%})\n")
+        else:
+            lines.append("**Estimated cost:** not available (set prices for both deployments with --model_prices)\n")
+        if latency_known and baseline_seconds > 0:
+            saved_seconds = baseline_seconds - actual_seconds
+            lines.append(f"**LLM time in cascaded stages:** {actual_seconds:.1f}s (all-large baseline {baseline_seconds:.1f}s, "
+                         f"saved {saved_seconds:.1f}s, {saved_seconds / baseline_seconds:.0%})\n")
+        else:
+            lines.append(f"**LLM time in cascaded stages:** {actual_seconds:.1f}s (baseline not available until every "
+                         f"cascaded stage has been escalated at least once)\n")
+        return "\n".join(lines) + "\n"
+
+
+class DeploymentUsage:
+    """
+    Thread-safe accounting of all LLM calls of a pipeline by deployment, for costing runs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.deployments: Dict[str, Dict[str, int]] = {}
+
+    def record(self, deployment: str, crew_result: Any) -> None:
+        """
+        Record one call.
+
+        Args:
+            deployment: The deployment the call ran on
+            crew_result: The object returned by Crew.kickoff (for token usage)
+        """
+        prompt_tokens, completion_tokens = _token_usage(crew_result)
+        with self._lock:
+            totals = self.deployments.setdefault(deployment, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            totals["calls"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        """
+        Copy of the totals so far, by deployment.
+        """
+        with self._lock:
+            return {deployment: dict(totals) for deployment, totals in self.deployments.items()}
+
+    @staticmethod
+    def difference(after: Dict[str, Dict[str, int]], before: Dict[str, Dict[str, int]]) -> Dict[str, Dict[str, int]]:
+        """
+        Usage between two snapshots, by deployment.
+        """
+        return {deployment: {key: value - before.get(deployment, {}).get(key, 0) for key, value in totals.items()}
+                for deployment, totals in after.items()}
+
+    @staticmethod
+    def cost(usage: Dict[str, Dict[str, int]], prices: Optional[Dict[str, Tuple[float, float]]]) -> Optional[float]:
+        """
+        Cost of a usage snapshot (or difference), or None when a deployment that was used has no price.
+
+        Args:
+            usage: Usage by deployment
+            prices: Deployment prices per million (input, output) tokens
+
+        Returns:
+            Optional[float]: The cost in USD
+        """
+        total = 0.0
+        for deployment, totals in usage.items():
+            if not totals["calls"]:
+                continue
+            cost = CascadeStats._cost(totals, (prices or {}).get(deployment))
+            if cost is None:
+                return None
+            total += cost
+        return total
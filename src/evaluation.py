@@ -0,0 +1,358 @@
+"""
+Accuracy-vs-throughput evaluation of pipeline variants on gold-labeled notes.
+
+A gold-label CSV holds one row per note with the expected category, TNM values
+and clinical and pathologic stages (blank cells are not scored). Each variant is
+a set of AdultCancerStaging settings overriding the run's settings, e.g. a
+cheaper deployment for some stages, a cascade, no stage correction or a local
+category classifier. The runner stages every gold note with every variant, one
+note at a time, and records per note:
+
+- whether each field matches the gold label: categories case-insensitively,
+  TNM values by their T, N and M categories, stages by their stage code
+  ("Stage IIIB (T3 N2b M0)" matches "IIIB"; no stage on both sides matches)
+- the tokens and cost of the note's LLM calls, from the pipeline's usage by
+  deployment and the model prices
+- the wall-clock latency of the note
+
+The summary has one row per variant with the accuracy per field, the mean
+accuracy over the fields all variants were scored on, the tokens, cost and
+latency (mean and p95) per note, and whether the variant is on the Pareto
+front: no other variant is at least as accurate, as cheap and as fast while
+better in one of them.
+"""
+
+import os
+import json
+import time
+import datetime
+from dataclasses import dataclass
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .adult_staging_module import AdultCancerStaging
+from .artifact_store import MEMOIZED_STAGES
+from .cascade import DeploymentUsage
+from .note_sources import iter_notes, DEFAULT_ID_COLUMN, DEFAULT_TEXT_COLUMN
+from .staging_result import StagingResult
+from .tnm_utils import split_tnm, normalize_stage
+from .run_logging import get_logger, note_context
+
+logger = get_logger("evaluation")
+
+# Gold-label columns and the StagingResult field each one is scored against
+GOLD_FIELDS = {
+    "category": "cancer_category",
+    "tnm_values": "tnm_values",
+    "clinical_stage": "clinical_stage",
+    "pathologic_stage": "pathologic_stage"
+}
+
+# Stage of the pipeline producing each field (variants stopped earlier are not scored on it)
+FIELD_STAGES = {"category": "identify", "tnm_values": "identify",
+                "clinical_stage": "calculate", "pathologic_stage": "calculate"}
+
+BASELINE_VARIANT = "baseline"
+
+
+@dataclass
+class GoldNote:
+    """
+    A note with its expected staging outputs (only non-blank labels are kept).
+    """
+    note_id: str
+    text: str
+    labels: Dict[str, str]
+
+
+def load_gold_notes(path: str, id_column: str = DEFAULT_ID_COLUMN, text_column: str = DEFAULT_TEXT_COLUMN,
+                    notes_source: Optional[str] = None) -> List[GoldNote]:
+    """
+    Read the gold-label CSV.
+
+    Args:
+        path: CSV with a note ID column, the note text (unless notes_source is given)
+            and any of the category, tnm_values, clinical_stage and pathologic_stage columns
+        id_column: Column holding the note ID
+        text_column: Column holding the note text
+        notes_source: Optional directory or JSONL/CSV/Parquet file the note texts are read
+            from instead, matched to the gold rows by note ID
+
+    Returns:
+        List: The gold notes, in CSV order
+    """
+    gold = pd.read_csv(path, dtype=str, keep_default_na=False)
+    if id_column not in gold.columns:
+        raise ValueError(f"Gold-label file {path} has no '{id_column}' column")
+    label_columns = [column for column in GOLD_FIELDS if column in gold.columns]
+    if not label_columns:
+        raise ValueError(f"Gold-label file {path} has none of the columns {', '.join(GOLD_FIELDS)}")
+
+    if notes_source:
+        texts = dict(iter_notes(notes_source, id_column=id_column, text_column=text_column))
+    elif text_column in gold.columns:
+        texts = dict(zip(gold[id_column], gold[text_column]))
+    else:
+        raise ValueError(f"Gold-label file {path} has no '{text_column}' column and no notes source was given")
+
+    notes = []
+    for record in gold.to_dict("records"):
+        note_id = record[id_column]
+        text = texts.get(note_id)
+        if not text or not text.strip():
+            print(f"Warning: no note text for gold note {note_id}, skipping it")
+            continue
+        labels = {column: record[column].strip() for column in label_columns if record[column].strip()}
+        notes.append(GoldNote(note_id, text, labels))
+    return notes
+
+
+def load_variants(path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Read the pipeline variants to compare.
+
+    Args:
+        path: JSON object of variant name to AdultCancerStaging settings overriding the
+            run's settings, e.g. {"baseline": {}, "mini": {"stage_deployments": {"calculate": "gpt-4o-mini"}}}
+
+    Returns:
+        Dict: Settings overrides by variant name
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        variants = json.load(f)
+    if not isinstance(variants, dict) or not all(isinstance(settings, dict) for settings in variants.values()):
+        raise ValueError(f"Variants file {path} must map variant names to objects of pipeline settings")
+    return variants
+
+
+def field_matches(field: str, predicted: Optional[str], expected: str) -> bool:
+    """
+    Whether a pipeline output matches its gold label.
+
+    Args:
+        field: Gold-label column ("category", "tnm_values", "clinical_stage" or "pathologic_stage")
+        predicted: The pipeline output
+        expected: The gold label
+
+    Returns:
+        bool: True on a match
+    """
+    predicted = predicted or ""
+    if field == "tnm_values":
+        expected_tnm = split_tnm(expected)
+        if any(expected_tnm[category] for category in "TNM"):
+            predicted_tnm = split_tnm(predicted)
+            return all(predicted_tnm[category] == expected_tnm[category] for category in "TNM")
+    elif field in ("clinical_stage", "pathologic_stage"):
+        # Gold stages may be written as codes ("IIIB") or as stage text ("Stage IIIB")
+        expected_code = normalize_stage(expected)["code"] or normalize_stage(f"Stage {expected}")["code"]
+        return normalize_stage(predicted)["code"] == expected_code
+    return predicted.strip().lower() == expected.strip().lower()
+
+
+def pareto_front(summary: pd.DataFrame, objectives: Dict[str, bool]) -> List[bool]:
+    """
+    Flag the rows no other row dominates.
+
+    Args:
+        summary: One row per variant
+        objectives: Column name to True if higher is better, False if lower is better
+
+    Returns:
+        List: True for the rows on the Pareto front
+    """
+    # Orient every objective so that higher is better
+    values = np.column_stack([summary[column].to_numpy(dtype=float) * (1 if higher else -1)
+                              for column, higher in objectives.items()])
+    values = np.nan_to_num(values, nan=-np.inf)
+    return [not any(np.all(other >= row) and np.any(other > row) for other in values) for row in values]
+
+
+class EvaluationRunner:
+    """
+    Runs pipeline variants over gold notes and compares their accuracy, tokens, cost and latency.
+    """
+
+    def __init__(self, settings: Dict[str, Any], create_pipeline: Callable[..., AdultCancerStaging] = AdultCancerStaging):
+        """
+        Initialize the runner.
+
+        Args:
+            settings: Pipeline settings shared by all variants. The artifact and results
+                databases are off unless a variant sets them, so no variant reuses the
+                stage outputs of another.
+            create_pipeline: Builds a pipeline from settings (e.g. create_staging_pipeline)
+        """
+        self.settings = {**settings, "artifact_db_path": None, "results_db_path": None}
+        self.create_pipeline = create_pipeline
+
+    def evaluate_variant(self, name: str, overrides: Dict[str, Any], notes: List[GoldNote]) -> List[Dict[str, Any]]:
+        """
+        Stage the gold notes with one variant.
+
+        Args:
+            name: Variant name
+            overrides: Settings of the variant
+            notes: Gold notes
+
+        Returns:
+            List: One row per note with the outputs, matches, tokens, cost and latency
+        """
+        pipeline = self.create_pipeline(**{**self.settings, **overrides})
+        scored_stages = MEMOIZED_STAGES[:MEMOIZED_STAGES.index(pipeline.stop_after) + 1]
+        rows = []
+        try:
+            for index, note in enumerate(notes, start=1):
+                print(f"[{name}] Staging gold note {index}/{len(notes)}: {note.note_id}")
+                before = pipeline.usage.snapshot()
+                start = time.perf_counter()
+                error = None
+                try:
+                    result = pipeline.process_note_text(note.text, note_id=note.note_id)
+                except Exception as e:
+                    with note_context(note_id=note.note_id):
+                        logger.error("Variant %s failed on note %s: %s", name, note.note_id, e)
+                    result, error = None, str(e)
+                latency = time.perf_counter() - start
+                usage = DeploymentUsage.difference(pipeline.usage.snapshot(), before)
+
+                row = {"variant": name, "note_id": note.note_id}
+                for field, result_field in GOLD_FIELDS.items():
+                    predicted = getattr(result, result_field) if isinstance(result, StagingResult) else None
+                    row[f"{field}_predicted"] = predicted
+                    row[f"{field}_expected"] = note.labels.get(field)
+                    if field in note.labels and FIELD_STAGES[field] in scored_stages:
+                        # A failed note counts as wrong on every labeled field
+                        row[f"{field}_correct"] = error is None and field_matches(field, predicted, note.labels[field])
+                    else:
+                        row[f"{field}_correct"] = None
+                row["calls"] = sum(totals["calls"] for totals in usage.values())
+                row["tokens"] = sum(totals["prompt_tokens"] + totals["completion_tokens"] for totals in usage.values())
+                row["cost"] = DeploymentUsage.cost(usage, pipeline.model_prices)
+                row["latency_seconds"] = latency
+                row["error"] = error
+                rows.append(row)
+        finally:
+            if pipeline.artifacts is not None:
+                pipeline.artifacts.close()
+        return rows
+
+    @staticmethod
+    def summarize(note_rows: pd.DataFrame) -> pd.DataFrame:
+        """
+        Summarize per-note rows to one row per variant, with the Pareto front flagged.
+
+        Args:
+            note_rows: The rows of evaluate_variant for all variants
+
+        Returns:
+            pd.DataFrame: Accuracy per field, mean accuracy, tokens, cost and latency per note
+        """
+        records = []
+        for name, rows in note_rows.groupby("variant", sort=False):
+            record = {"variant": name, "notes": len(rows)}
+            for field in GOLD_FIELDS:
+                scored = rows[f"{field}_correct"].dropna()
+                record[f"{field}_accuracy"] = scored.astype(bool).mean() if len(scored) else None
+            record["mean_accuracy"] = None
+            record["calls_per_note"] = rows["calls"].mean()
+            record["tokens_per_note"] = rows["tokens"].mean()
+            record["cost_per_note"] = rows["cost"].mean() if rows["cost"].notna().all() else None
+            record["mean_latency_seconds"] = rows["latency_seconds"].mean()
+            record["p95_latency_seconds"] = float(np.percentile(rows["latency_seconds"], 95))
+            record["errors"] = int(rows["error"].notna().sum())
+            records.append(record)
+        summary = pd.DataFrame.from_records(records)
+
+        # Only fields every variant was scored on are comparable (variants may stop before calculate)
+        accuracy_columns = [f"{field}_accuracy" for field in GOLD_FIELDS if summary[f"{field}_accuracy"].notna().all()]
+        if accuracy_columns:
+            summary["mean_accuracy"] = summary[accuracy_columns].astype(float).mean(axis=1)
+
+        # Cost needs prices for every deployment used; otherwise compare tokens
+        spend = "cost_per_note" if summary["cost_per_note"].notna().all() else "tokens_per_note"
+        summary["pareto"] = pareto_front(summary, {"mean_accuracy": True, spend: False, "mean_latency_seconds": False})
+        return summary
+
+    def run(self, notes: List[GoldNote], variants: Dict[str, Dict[str, Any]]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Evaluate every variant on the gold notes.
+
+        Args:
+            notes: Gold notes
+            variants: Settings overrides by variant name
+
+        Returns:
+            Tuple: (summary, note_rows) DataFrames
+        """
+        rows = []
+        for name, overrides in variants.items():
+            print(f"Evaluating variant '{name}' on {len(notes)} gold notes")
+            rows.extend(self.evaluate_variant(name, overrides, notes))
+        note_rows = pd.DataFrame.from_records(rows)
+        return self.summarize(note_rows), note_rows
+
+
+def format_summary(summary: pd.DataFrame) -> str:
+    """
+    Render the variant summary as a markdown table, most accurate first.
+
+    Args:
+        summary: The summary of EvaluationRunner.summarize
+
+    Returns:
+        str: Markdown table
+    """
+    def cell(column: str, value: Any) -> str:
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            return "n/a"
+        if column == "pareto":
+            return "yes" if value else ""
+        if column.endswith("_accuracy"):
+            return f"{value:.1%}"
+        if column == "cost_per_note":
+            return f"${value:.4f}"
+        if isinstance(value, float):
+            return f"{value:.2f}" if column.endswith("_seconds") else f"{value:.0f}"
+        return str(value)
+
+    ordered = summary.sort_values("mean_accuracy", ascending=False, na_position="last")
+    columns = list(summary.columns)
+    lines = ["| " + " | ".join(columns) + " |", "|" + "|".join("---" for _ in columns) + "|"]
+    for record in ordered.to_dict("records"):
+        lines.append("| " + " | ".join(cell(column, record[column]) for column in columns) + " |")
+    return "\n".join(lines) + "\n"
+
+
+def write_evaluation(summary: pd.DataFrame, note_rows: pd.DataFrame, output_csv: str) -> Tuple[str, str, str]:
+    """
+    Write the summary (CSV and markdown) and the per-note rows next to the run outputs.
+
+    Args:
+        summary: The summary of EvaluationRunner.summarize
+        note_rows: The per-note rows
+        output_csv: The run's output path; the files are named after it with a timestamp
+
+    Returns:
+        Tuple: (summary_csv, summary_md, notes_csv) paths
+    """
+    results_dir = os.path.dirname(output_csv)
+    if results_dir and not os.path.exists(results_dir):
+        os.makedirs(results_dir)
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_base = os.path.splitext(output_csv)[0]
+    summary_csv = f"{output_base}_evaluation_{timestamp}.csv"
+    summary_md = f"{output_base}_evaluation_{timestamp}.md"
+    notes_csv = f"{output_base}_evaluation_notes_{timestamp}.csv"
+
+    summary.to_csv(summary_csv, index=False)
+    note_rows.to_csv(notes_csv, index=False)
+    with open(summary_md, "w", encoding="utf-8") as f:
+        f.write("# Pipeline Variant Evaluation\n\n")
+        f.write(f"**Gold notes:** {note_rows['note_id'].nunique()}\n\n")
+        f.write(format_summary(summary))
+        f.write("\nVariants marked in the pareto column are not beaten on accuracy, cost "
+                "(or tokens without prices) and latency at once by any other variant.\n")
+    return summary_csv, summary_md, notes_csv
@@ -0,0 +1,234 @@
+"""
+Per-stage timeout budgets and hedged LLM calls.
+
+Each stage call runs on a worker thread and is abandoned with a
+StageTimeoutError once its stage budget is spent, so one hung Crew.kickoff
+cannot stall a note for minutes (the error is transient, so the batch retry
+queue picks the note up again). With hedging enabled, a call that is still
+running after the observed p95 latency of its stage gets a duplicate, and
+whichever finishes first wins. Hedges are capped at a share of all calls.
+
+A stage budget and its latency sample start when the call starts running
+on a worker, so time spent waiting for a free worker does not count. Once a
+call wins or times out, its attempts that have not started are cancelled.
+Python cannot kill a running thread: an abandoned call keeps its worker
+thread until the HTTP client timeout ends it, and its result is discarded.
+"""
+
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Optional, TypeVar
+
+from .metrics import get_metrics
+
+T = TypeVar("T")
+
+# Default timeout budget of each stage in seconds
+DEFAULT_STAGE_TIMEOUTS = {
+    "identify": 120.0,
+    "analyze": 180.0,
+    "calculate": 180.0,
+    "correct": 180.0,
+    "report": 300.0
+}
+
+
+class StageTimeoutError(TimeoutError):
+    """
+    Raised when a stage call exceeds its timeout budget.
+    """
+
+
+def parse_stage_timeouts(text: str) -> Dict[str, float]:
+    """
+    Parse per-stage timeout budgets from the command line.
+
+    Args:
+        text: "identify=90,report=240" (given stages only) or a single number for every stage
+
+    Returns:
+        Dict: Mapping of stage to timeout in seconds
+    """
+    text = text.strip()
+    try:
+        if "=" not in text:
+            return {stage: float(text) for stage in DEFAULT_STAGE_TIMEOUTS}
+        timeouts = {}
+        for part in text.split(","):
+            stage, seconds = part.split("=", 1)
+            timeouts[stage.strip()] = float(seconds)
+        return timeouts
+    except ValueError:
+        raise ValueError(f"Invalid stage timeouts '{text}'. Expected e.g. 'identify=90,report=240' or '180'")
+
+
+class _AttemptStart:
+    """
+    When an attempt started running on a worker; the clock does not run while it waits in the executor queue.
+    """
+
+    def __init__(self):
+        self.time: Optional[float] = None
+        self._event = threading.Event()
+
+    def mark(self) -> None:
+        self.time = time.monotonic()
+        self._event.set()
+
+    def wait(self) -> float:
+        self._event.wait()
+        return self.time
+
+
+class HedgedCaller:
+    """
+    Runs stage calls with timeout budgets and optional hedging.
+    """
+
+    def __init__(self, stage_timeouts: Optional[Dict[str, float]] = None, hedging: bool = False,
+                 max_hedge_ratio: float = 0.05, min_samples: int = 20, window: int = 200,
+                 max_workers: int = 32):
+        """
+        Initialize the caller.
+
+        Args:
+            stage_timeouts: Timeout budget per stage in seconds (stages not listed use
+                DEFAULT_STAGE_TIMEOUTS; a budget of 0 disables the timeout of that stage)
+            hedging: Whether slow calls get a duplicate request
+            max_hedge_ratio: Maximum share of calls that may be hedged
+            min_samples: Calls of a stage observed before its p95 is trusted for hedging
+            window: Number of recent latencies kept per stage
+            max_workers: Maximum number of concurrent stage calls (including abandoned ones)
+        """
+        self.stage_timeouts = dict(DEFAULT_STAGE_TIMEOUTS)
+        self.stage_timeouts.update(stage_timeouts or {})
+        self.hedging = hedging
+        self.max_hedge_ratio = max_hedge_ratio
+        self.min_samples = min_samples
+        self.window = window
+        self._latencies: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._hedges = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stage-call")
+
+    def p95(self, stage: str) -> Optional[float]:
+        """
+        Observed 95th percentile latency of a stage.
+
+        Args:
+            stage: Pipeline stage
+
+        Returns:
+            Optional[float]: Seconds, or None until min_samples calls were observed
+        """
+        with self._lock:
+            samples = sorted(self._latencies.get(stage, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(0.95 * len(samples)))]
+
+    def _record_latency(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+
+    def _reserve_hedge(self) -> bool:
+        """
+        Take a hedge from the budget if the hedged share stays within max_hedge_ratio.
+        """
+        with self._lock:
+            if self._hedges + 1 > self.max_hedge_ratio * self._calls:
+                return False
+            self._hedges += 1
+            return True
+
+    def _submit(self, attempt: Callable[[bool], T], hedge: bool):
+        # Each thread gets a copy of the caller's context (trace span, log context)
+        context = contextvars.copy_context()
+        start = _AttemptStart()
+
+        def run():
+            start.mark()
+            return context.run(attempt, hedge)
+
+        future = self._executor.submit(run)
+        future.start = start
+        return future
+
+    @staticmethod
+    def _cancel(futures) -> None:
+        """
+        Cancel the attempts still waiting for a worker (running ones cannot be stopped).
+        """
+        for future in futures:
+            future.cancel()
+
+    def call(self, stage: str, attempt: Callable[[bool], T]) -> T:
+        """
+        Run one stage call within its timeout budget, hedging it if it is slow.
+
+        Args:
+            stage: Pipeline stage
+            attempt: Function performing the call; receives True for a hedge. It must
+                build its own agent, task and crew, since a hedge runs concurrently
+
+        Returns:
+            The result of the first attempt to succeed
+
+        Raises:
+            StageTimeoutError: If no attempt finished within the stage budget
+        """
+        timeout = self.stage_timeouts.get(stage) or None
+        with self._lock:
+            self._calls += 1
+        if timeout is None and not self.hedging:
+            started = time.monotonic()
+            result = attempt(False)
+            self._record_latency(stage, time.monotonic() - started)
+            return result
+
+        metrics = get_metrics()
+        primary = self._submit(attempt, False)
+        futures = {primary: False}
+        started = primary.start.wait()
+        deadline = started + timeout if timeout else None
+        hedge_at = None
+        if self.hedging:
+            p95 = self.p95(stage)
+            hedge_at = started + p95 if p95 is not None else None
+
+        last_error = None
+        while True:
+            wake_at = deadline
+            if hedge_at is not None:
+                wake_at = hedge_at if wake_at is None else min(wake_at, hedge_at)
+            wait_seconds = None if wake_at is None else max(0.0, wake_at - time.monotonic())
+            done, _ = wait(list(futures), timeout=wait_seconds, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                is_hedge = futures.pop(future)
+                error = future.exception()
+                if error is None:
+                    self._record_latency(stage, time.monotonic() - future.start.time)
+                    if is_hedge:
+                        metrics.inc("staging_hedge_wins_total", stage=stage)
+                    self._cancel(futures)
+                    return future.result()
+                last_error = error
+            if done and not futures:
+                raise last_error
+
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                metrics.inc("staging_stage_timeouts_total", stage=stage)
+                self._cancel(futures)
+                raise StageTimeoutError(f"Stage '{stage}' exceeded its {timeout:.0f}s budget")
+            if hedge_at is not None and now >= hedge_at:
+                # Only one hedge per call, and only within the hedge budget
+                hedge_at = None
+                if self._reserve_hedge():
+                    metrics.inc("staging_hedges_total", stage=stage)
+                    futures[self._submit(attempt, True)] = True
@@ -0,0 +1,338 @@
+"""
+Memory instrumentation and memory budgets for multiple-note runs.
+
+MemoryProfiler samples the process as notes finish: the resident set size (RSS)
+of every sample and, with tracemalloc, a snapshot every N notes. The run report
+gains a "Memory" section with the peak RSS, the samples and the allocation
+sites that grew the most between the first and the last snapshot.
+
+MemoryBudget keeps a run under an RSS limit. Its throttle() wraps the note
+intake. Before each note is read while RSS is above the high-water mark (a
+share of the limit), the budget's spill callbacks move buffered outputs to disk
+and garbage is collected. While RSS stays above the limit, the next note waits
+for memory to be freed (e.g. by abandoned timeout or hedge calls finishing in
+the background), up to max_wait. When waiting does not get RSS under the limit,
+later notes do not wait again until RSS falls below that level; they only spill,
+so every note's outputs go straight to disk.
+"""
+
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+from .metrics import get_metrics
+from .run_logging import get_logger
+
+logger = get_logger("memory")
+
+_SIZE_UNITS = {"": 1, "B": 1, "K": 1024, "KB": 1024, "M": 1024 ** 2, "MB": 1024 ** 2,
+               "G": 1024 ** 3, "GB": 1024 ** 3}
+
+# Allocations of the import machinery and of tracemalloc itself are not of interest
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<unknown>")
+)
+
+
+def parse_memory_size(text: str) -> int:
+    """
+    Parse a memory size from the command line.
+
+    Args:
+        text: "2G", "1500M", "512MB" or a number of bytes
+
+    Returns:
+        int: The size in bytes
+    """
+    value = text.strip().upper()
+    number = value.rstrip("BKMG")
+    unit = value[len(number):]
+    try:
+        size = int(float(number) * _SIZE_UNITS[unit])
+    except (ValueError, KeyError):
+        raise ValueError(f"Invalid memory size '{text}'. Expected e.g. '2G', '1500M' or a number of bytes")
+    if size <= 0:
+        raise ValueError(f"Invalid memory size '{text}'. The size must be positive")
+    return size
+
+
+def format_bytes(size: Optional[float]) -> str:
+    """
+    Format a number of bytes for reports, e.g. "1.5 GiB".
+    """
+    if size is None:
+        return "n/a"
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.2f} GiB"
+
+
+def current_rss() -> Optional[int]:
+    """
+    Resident set size of this process in bytes, from /proc on Linux or psutil when
+    installed. None when neither is available.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def peak_rss() -> Optional[int]:
+    """
+    Peak resident set size of this process in bytes, or None where getrusage is not available.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def release_free_memory() -> None:
+    """
+    Collect garbage and, with glibc, return freed heap pages to the operating system,
+    so RSS reflects what was released.
+    """
+    gc.collect()
+    if sys.platform.startswith("linux"):
+        try:
+            import ctypes
+            ctypes.CDLL("libc.so.6").malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+
+class MemoryProfiler:
+    """
+    Samples RSS as notes finish and, optionally, takes tracemalloc snapshots every N notes.
+    """
+
+    def __init__(self, snapshot_every: int = 0, top: int = 10, frames: int = 1):
+        """
+        Initialize the profiler.
+
+        Args:
+            snapshot_every: Notes between tracemalloc snapshots (0 only samples RSS)
+            top: Number of allocation sites listed in the report
+            frames: Stack frames stored per traced allocation (more frames cost more memory)
+        """
+        self.snapshot_every = snapshot_every
+        self.top = top
+        self.frames = frames
+        self.notes = 0
+        self.samples: List[Tuple[int, Optional[int], Optional[int]]] = []
+        self._first_snapshot = None
+        self._last_snapshot = None
+        self._started_tracing = False
+
+    def start(self) -> None:
+        """
+        Start tracing allocations (when snapshots are enabled) and take the baseline snapshot.
+        """
+        if self.snapshot_every > 0:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+                self._started_tracing = True
+            self._first_snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        self.sample()
+
+    def note_finished(self) -> None:
+        """
+        Count a finished note, sampling every snapshot_every notes (or every 100 without snapshots).
+        """
+        self.notes += 1
+        if self.notes % (self.snapshot_every or 100) == 0:
+            self.sample()
+
+    def sample(self) -> None:
+        """
+        Record the current RSS and traced memory, and take a snapshot when tracing.
+        """
+        rss = current_rss()
+        traced = None
+        if tracemalloc.is_tracing() and self._first_snapshot is not None:
+            traced = tracemalloc.get_traced_memory()[0]
+            self._last_snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        self.samples.append((self.notes, rss, traced))
+
+        metrics = get_metrics()
+        if rss is not None:
+            metrics.set("staging_memory_rss_bytes", rss)
+        if traced is not None:
+            metrics.set("staging_memory_traced_bytes", traced)
+        logger.debug("Memory sample", extra={"notes": self.notes, "rss_bytes": rss, "traced_bytes": traced})
+
+    def top_allocations(self) -> List[Tuple[str, int, int]]:
+        """
+        The allocation sites that grew the most between the first and the last snapshot.
+
+        Returns:
+            List: (file:line, growth in bytes, size in bytes) tuples, largest growth first
+        """
+        if self._first_snapshot is None or self._last_snapshot is None:
+            return []
+        stats = self._last_snapshot.compare_to(self._first_snapshot, "lineno")
+        return [(f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", stat.size_diff, stat.size)
+                for stat in stats[:self.top]]
+
+    def summary(self, budget: Optional["MemoryBudget"] = None) -> str:
+        """
+        Markdown section of the run report, sampling the notes finished since the last sample.
+
+        Args:
+            budget: The run's memory budget, whose spills and waits are reported
+
+        Returns:
+            str: The "Memory" section
+        """
+        if self.samples and self.samples[-1][0] != self.notes:
+            self.sample()
+        lines = ["## Memory\n"]
+        lines.append(f"**Peak RSS:** {format_bytes(peak_rss())}\n")
+        if tracemalloc.is_tracing():
+            lines.append(f"**Peak traced memory:** {format_bytes(tracemalloc.get_traced_memory()[1])}\n")
+        if budget is not None:
+            lines.append(f"**Memory budget:** {format_bytes(budget.limit)} (spills: {budget.spills}, "
+                         f"intake waits: {budget.waits}, {budget.wait_seconds:.1f}s waiting)\n")
+
+        lines.append("| Notes | RSS | Traced |")
+        lines.append("|-------|-----|--------|")
+        for notes, rss, traced in self.samples:
+            lines.append(f"| {notes} | {format_bytes(rss)} | {format_bytes(traced)} |")
+        lines.append("")
+
+        top = self.top_allocations()
+        if top:
+            lines.append("**Top allocation sites (growth since the first snapshot):**\n")
+            lines.append("| Location | Growth | Size |")
+            lines.append("|----------|--------|------|")
+            for location, growth, size in top:
+                lines.append(f"| {location} | {format_bytes(growth)} | {format_bytes(size)} |")
+            lines.append("")
+        return "\n".join(lines) + "\n"
+
+    def stop(self) -> None:
+        """
+        Stop tracing if this profiler started it.
+        """
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+
+class MemoryBudget:
+    """
+    Holds back the note intake and spills buffered outputs when RSS nears a limit.
+    """
+
+    def __init__(self, limit: int, high_water: float = 0.85, max_wait: float = 30.0, poll_interval: float = 0.2):
+        """
+        Initialize the budget.
+
+        Args:
+            limit: RSS limit in bytes
+            high_water: Share of the limit above which buffered outputs are spilled
+            max_wait: Longest the intake waits for RSS to fall under the limit, in seconds
+            poll_interval: Seconds between RSS checks while waiting
+        """
+        self.limit = limit
+        self.high_water = high_water
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.spills = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self._spill_callbacks: List[Callable[[], Any]] = []
+        # RSS a wait could not get under the limit; waiting again only helps once RSS fell below it
+        self._stuck_rss: Optional[int] = None
+        if current_rss() is None:
+            print("Warning: the memory budget needs /proc/self/statm or psutil to read RSS; it has no effect")
+
+    def on_pressure(self, callback: Callable[[], Any]) -> None:
+        """
+        Register a callback that moves buffered outputs to disk.
+
+        Args:
+            callback: Called without arguments when RSS is above the high-water mark
+        """
+        self._spill_callbacks.append(callback)
+
+    def spill(self) -> None:
+        """
+        Run the spill callbacks and release the freed memory.
+        """
+        for callback in self._spill_callbacks:
+            callback()
+        release_free_memory()
+        self.spills += 1
+        get_metrics().inc("staging_memory_spills_total")
+
+    def wait_for_room(self) -> None:
+        """
+        Spill when RSS is above the high-water mark, then wait up to max_wait while RSS
+        is above the limit (unless an earlier wait could not get below the current RSS).
+        """
+        rss = current_rss()
+        if rss is None or rss < self.limit * self.high_water:
+            return
+        self.spill()
+        rss = current_rss()
+        if rss < self.limit:
+            self._stuck_rss = None
+            return
+        if self._stuck_rss is not None and rss >= self._stuck_rss:
+            return
+
+        start = time.monotonic()
+        while time.monotonic() - start < self.max_wait:
+            time.sleep(self.poll_interval)
+            rss = current_rss()
+            if rss < self.limit:
+                break
+        waited = time.monotonic() - start
+        self.waits += 1
+        self.wait_seconds += waited
+        get_metrics().inc("staging_memory_backpressure_seconds_total", waited)
+        if rss >= self.limit:
+            if self._stuck_rss is None:
+                logger.warning(f"RSS {format_bytes(rss)} is above the memory budget of {format_bytes(self.limit)} "
+                               f"after spilling; outputs are spilled after every note until it falls")
+            self._stuck_rss = rss
+        else:
+            self._stuck_rss = None
+
+    def throttle(self, notes: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+        """
+        Read notes only when there is room for them.
+
+        Args:
+            notes: (note ID, note content) pairs
+
+        Yields:
+            Tuple: The same pairs
+        """
+        iterator = iter(notes)
+        while True:
+            self.wait_for_room()
+            try:
+                note = next(iterator)
+            except StopIteration:
+                return
+            yield note
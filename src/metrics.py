@@ -0,0 +1,290 @@
+"""
+Run metrics: a Prometheus-style scrape endpoint and a terminal progress line.
+
+The staging module updates a process-wide registry of counters and gauges
+(notes done/failed, LLM calls in flight, tokens, errors, retries, cache hits).
+The registry is rendered in the Prometheus text exposition format on
+/metrics, and ProgressReporter shows throughput, in-flight calls, token rate,
+errors, retries, cache hit ratio and ETA on one tqdm line.
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional, Tuple
+
+from tqdm import tqdm
+
+# Help text of every metric; metrics ending in _total are counters, the rest are gauges
+METRIC_HELP = {
+    "staging_notes_total": "Notes processed, by status (done or failed)",
+    "staging_notes_expected": "Notes expected in the current batch run (0 when unknown)",
+    "staging_llm_calls_total": "LLM calls (crew kickoffs), by stage",
+    "staging_llm_calls_in_flight": "LLM calls currently in flight",
+    "staging_llm_call_seconds_total": "Time spent in LLM calls, by stage",
+    "staging_tokens_total": "LLM tokens used, by kind (prompt or completion)",
+    "staging_errors_total": "Errors, by stage",
+    "staging_retries_total": "Retried LLM calls and notes",
+    "staging_cache_hits_total": "Cached stage results reused",
+    "staging_cache_misses_total": "Stage results that had to be computed",
+    "staging_system_compilations_total": "Staging data files compiled into memory-mapped tables, by system",
+    "staging_routed_notes_total": "Notes routed by patient age (--staging_system auto), by staging system",
+    "staging_stage_timeouts_total": "LLM calls abandoned after exceeding their stage timeout budget, by stage",
+    "staging_hedges_total": "Duplicate (hedge) LLM requests sent for slow calls, by stage",
+    "staging_hedge_wins_total": "Hedge requests that finished before the original call, by stage",
+    "staging_triage_total": "Notes scored by the local triage classifier, by decision (staged or skipped)",
+    "staging_category_predictions_total": "Local category predictions, by outcome (accepted, or fallback to the LLM identifier)",
+    "staging_patients_total": "Patients staged in longitudinal mode, by status (done or failed)",
+    "staging_patient_notes_total": "Notes read in longitudinal mode, by decision (restaged, no_new_evidence or already_seen)",
+    "staging_stage_corrections_total": "Correction calls for stages failing local validation, by outcome (fixed or unresolved)",
+    "staging_batch_requests_total": "Stage requests written to batch request files, by stage",
+    "staging_batch_results_total": "Batch results ingested, by stage and outcome (done or failed)",
+    "staging_memory_rss_bytes": "Resident set size at the last memory sample",
+    "staging_memory_traced_bytes": "Memory traced by tracemalloc at the last memory sample (--memory_profile)",
+    "staging_memory_spills_total": "Times buffered outputs were spilled to disk near the memory budget",
+    "staging_memory_backpressure_seconds_total": "Time the note intake waited for RSS to fall under the memory budget",
+    "staging_http_requests_total": "HTTP requests sent through the shared LLM client",
+    "staging_http_connections_opened_total": "New connections opened by the shared LLM client",
+    "staging_http_connections_reused_total": "HTTP requests served on a reused keep-alive connection",
+    "staging_http_tls_handshakes_total": "TLS handshakes performed by the shared LLM client"
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and gauges with optional labels.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[str, Dict[LabelKey, float]] = {name: {} for name in METRIC_HELP}
+        self.started_at = time.time()
+
+    @staticmethod
+    def _key(labels: Dict[str, Any]) -> LabelKey:
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Add to a counter (or gauge).
+
+        Args:
+            name: Metric name (see METRIC_HELP)
+            value: Amount to add
+            **labels: Metric labels
+        """
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """
+        Set a gauge.
+
+        Args:
+            name: Metric name (see METRIC_HELP)
+            value: New value
+            **labels: Metric labels
+        """
+        with self._lock:
+            self._values.setdefault(name, {})[self._key(labels)] = value
+
+    def total(self, name: str, **labels) -> float:
+        """
+        Sum a metric over all label sets matching the given labels.
+
+        Args:
+            name: Metric name
+            **labels: Labels that must match
+
+        Returns:
+            float: The summed value
+        """
+        wanted = set(self._key(labels))
+        with self._lock:
+            return sum(value for key, value in self._values.get(name, {}).items() if wanted <= set(key))
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition text
+        """
+        lines = []
+        with self._lock:
+            for name, series in self._values.items():
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+                if not series:
+                    series = {(): 0}
+                for key, value in sorted(series.items()):
+                    label_text = ",".join(f'{label}="{text}"' for label, text in key)
+                    lines.append(f"{name}{{{label_text}}} {value:g}" if label_text else f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    @contextmanager
+    def llm_call(self, stage: str):
+        """
+        Count an LLM call, its time in flight, and its failure if it raises.
+
+        Args:
+            stage: Pipeline stage making the call
+        """
+        self.inc("staging_llm_calls_total", stage=stage)
+        self.inc("staging_llm_calls_in_flight")
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc("staging_errors_total", stage=stage)
+            raise
+        finally:
+            self.inc("staging_llm_calls_in_flight", -1)
+            self.inc("staging_llm_call_seconds_total", time.perf_counter() - started, stage=stage)
+
+    def record_token_usage(self, crew_result: Any) -> None:
+        """
+        Add the token usage reported by a crew result, if any.
+
+        Args:
+            crew_result: The object returned by Crew.kickoff
+        """
+        usage = getattr(crew_result, "token_usage", None)
+        if usage is None:
+            return
+        if isinstance(usage, dict):
+            prompt, completion = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        else:
+            prompt, completion = getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0)
+        if prompt:
+            self.inc("staging_tokens_total", prompt, kind="prompt")
+        if completion:
+            self.inc("staging_tokens_total", completion, kind="completion")
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """
+    Return the process-wide metrics registry.
+
+    Returns:
+        MetricsRegistry: The registry
+    """
+    return _registry
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1",
+                         registry: Optional[MetricsRegistry] = None) -> ThreadingHTTPServer:
+    """
+    Serve the registry on http://<host>:<port>/metrics from a background thread.
+
+    Args:
+        port: TCP port to listen on
+        host: Interface to bind (local only by default)
+        registry: Registry to expose (the process-wide registry by default)
+
+    Returns:
+        ThreadingHTTPServer: The running server
+    """
+    registry = registry or _registry
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?", 1)[0].rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Metrics available at http://{host}:{port}/metrics")
+    return server
+
+
+class ProgressReporter:
+    """
+    One-line tqdm progress display for batch runs, fed from the metrics registry.
+    """
+
+    def __init__(self, total: Optional[int] = None, description: str = "Staging",
+                 registry: Optional[MetricsRegistry] = None):
+        """
+        Start the progress line.
+
+        Args:
+            total: Number of notes expected (None when unknown; no ETA is shown then)
+            description: Label shown before the bar
+            registry: Registry to read from (the process-wide registry by default)
+        """
+        self.registry = registry or _registry
+        self.registry.set("staging_notes_expected", total or 0)
+        self._started = time.time()
+        self._tokens_at_start = self.registry.total("staging_tokens_total")
+        self._bar = tqdm(total=total, desc=description, unit="note", dynamic_ncols=True)
+
+    def note_finished(self, failed: bool = False) -> None:
+        """
+        Count a finished note and refresh the progress line.
+
+        Args:
+            failed: Whether the note failed
+        """
+        self.registry.inc("staging_notes_total", status="failed" if failed else "done")
+        self.advance(1)
+
+    def advance(self, count: int) -> None:
+        """
+        Move the progress line forward without touching the note counters
+        (used when the counts come from elsewhere, e.g. a shared work table).
+
+        Args:
+            count: Number of finished notes to add
+        """
+        if count:
+            self._bar.update(count)
+        self._bar.set_postfix_str(self.summary(), refresh=True)
+
+    def summary(self) -> str:
+        """
+        Format throughput, in-flight calls, token rate, failed notes, call errors,
+        retries and cache hit ratio.
+
+        Returns:
+            str: The progress line postfix
+        """
+        registry = self.registry
+        elapsed = max(time.time() - self._started, 1e-6)
+        tokens = registry.total("staging_tokens_total") - self._tokens_at_start
+        hits = registry.total("staging_cache_hits_total")
+        lookups = hits + registry.total("staging_cache_misses_total")
+        cache = f"{hits / lookups:.0%}" if lookups else "-"
+        return (f"{self._bar.n * 60 / elapsed:.1f} notes/min, "
+                f"{registry.total('staging_llm_calls_in_flight'):.0f} in flight, "
+                f"{tokens / elapsed:.0f} tok/s, "
+                f"{registry.total('staging_notes_total', status='failed'):.0f} failed, "
+                f"{registry.total('staging_errors_total'):.0f} err, "
+                f"{registry.total('staging_retries_total'):.0f} retry, "
+                f"cache {cache}")
+
+    def close(self) -> None:
+        """
+        Finish the progress line.
+        """
+        self._bar.set_postfix_str(self.summary(), refresh=False)
+        self._bar.close()
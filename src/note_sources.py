@@ -0,0 +1,303 @@
+"""
+Streaming input adapters for medical notes.
+
+Every adapter yields (note_id, note_text) pairs lazily, so each note is read
+exactly once and a multi-GB extract never has to fit in memory:
+
+- a directory of .txt files (the note ID is the file name)
+- JSONL files, read line by line through a memory map
+- CSV files, read in chunks of rows
+- Parquet files, read one record batch at a time
+
+For longitudinal runs, iter_patient_notes groups the notes of each patient.
+"""
+
+import os
+import json
+import mmap
+import sqlite3
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+DEFAULT_ID_COLUMN = "note_id"
+DEFAULT_TEXT_COLUMN = "text"
+DEFAULT_PATIENT_COLUMN = "patient_id"
+
+
+def iter_directory_notes(note_dir: str,
+                         on_error: Optional[Callable[[str, Exception], None]] = None) -> Iterator[Tuple[str, str]]:
+    """
+    Iterate over the .txt notes of a directory. A file that cannot be read or
+    decoded as UTF-8 is skipped, so it does not end the iteration.
+
+    Args:
+        note_dir: Directory containing medical notes
+        on_error: Called with the file name and the error for each unreadable file
+            (a warning is printed when not given)
+
+    Yields:
+        Tuple: (file name, note content)
+    """
+    for note_file in Path(note_dir).glob('*.txt'):
+        try:
+            with open(note_file, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            if on_error is None:
+                print(f"Warning: skipping unreadable note {note_file}: {e}")
+            else:
+                on_error(note_file.name, e)
+            continue
+        yield note_file.name, text
+
+
+def iter_jsonl_notes(path: str, id_column: str = DEFAULT_ID_COLUMN,
+                     text_column: str = DEFAULT_TEXT_COLUMN) -> Iterator[Tuple[str, str]]:
+    """
+    Iterate over the notes of a JSONL file through a read-only memory map.
+
+    Args:
+        path: Path to the JSONL file (one JSON object per line)
+        id_column: Field holding the note ID (line number is used when missing)
+        text_column: Field holding the note text
+
+    Yields:
+        Tuple: (note ID, note content)
+    """
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for line_number, line in enumerate(iter(mm.readline, b''), start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Warning: skipping invalid JSON on line {line_number} of {path}: {e}")
+                continue
+            text = record.get(text_column)
+            if not isinstance(text, str) or not text.strip():
+                print(f"Warning: skipping line {line_number} of {path}: no '{text_column}' text")
+                continue
+            note_id = record.get(id_column)
+            yield (str(note_id) if note_id is not None else f"line-{line_number}"), text
+
+
+def iter_csv_notes(path: str, id_column: str = DEFAULT_ID_COLUMN, text_column: str = DEFAULT_TEXT_COLUMN,
+                   chunksize: int = 1000) -> Iterator[Tuple[str, str]]:
+    """
+    Iterate over the notes of a CSV file, reading only the ID and text columns
+    one chunk of rows at a time.
+
+    Args:
+        path: Path to the CSV file
+        id_column: Column holding the note ID
+        text_column: Column holding the note text
+        chunksize: Number of rows read per chunk
+
+    Yields:
+        Tuple: (note ID, note content)
+    """
+    reader = pd.read_csv(path, usecols=[id_column, text_column], dtype=str, chunksize=chunksize,
+                         keep_default_na=False)
+    for chunk in reader:
+        for note_id, text in zip(chunk[id_column], chunk[text_column]):
+            if text.strip():
+                yield note_id, text
+
+
+def iter_parquet_notes(path: str, id_column: str = DEFAULT_ID_COLUMN, text_column: str = DEFAULT_TEXT_COLUMN,
+                       batch_size: int = 1000) -> Iterator[Tuple[str, str]]:
+    """
+    Iterate over the notes of a Parquet file, reading only the ID and text
+    columns one record batch at a time.
+
+    Args:
+        path: Path to the Parquet file
+        id_column: Column holding the note ID
+        text_column: Column holding the note text
+        batch_size: Number of rows read per batch
+
+    Yields:
+        Tuple: (note ID, note content)
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Reading Parquet note sources requires pyarrow (pip install pyarrow)")
+
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=[id_column, text_column]):
+        ids = batch.column(id_column).to_pylist()
+        texts = batch.column(text_column).to_pylist()
+        for note_id, text in zip(ids, texts):
+            if text and text.strip():
+                yield str(note_id), text
+
+
+def iter_notes(source: str, id_column: str = DEFAULT_ID_COLUMN, text_column: str = DEFAULT_TEXT_COLUMN,
+               on_error: Optional[Callable[[str, Exception], None]] = None) -> Iterator[Tuple[str, str]]:
+    """
+    Iterate over the notes of a directory or a JSONL/CSV/Parquet file,
+    choosing the adapter from the file extension.
+
+    Args:
+        source: Directory of .txt notes, or path to a .jsonl, .csv or .parquet file
+        id_column: Field or column holding the note ID (file sources only)
+        text_column: Field or column holding the note text (file sources only)
+        on_error: Called with the note ID and the error for each note file that
+            cannot be read (directory sources only)
+
+    Returns:
+        Iterator: (note ID, note content) pairs
+    """
+    if os.path.isdir(source):
+        return iter_directory_notes(source, on_error)
+
+    suffix = Path(source).suffix.lower()
+    if suffix in (".jsonl", ".ndjson"):
+        return iter_jsonl_notes(source, id_column, text_column)
+    if suffix == ".csv":
+        return iter_csv_notes(source, id_column, text_column)
+    if suffix in (".parquet", ".pq"):
+        return iter_parquet_notes(source, id_column, text_column)
+    raise ValueError(f"Unsupported note source '{source}'. Expected a directory or a .jsonl, .csv or .parquet file")
+
+
+def count_notes(source: str) -> Optional[int]:
+    """
+    Cheaply estimate the number of notes in a source, for progress reporting.
+
+    Directories are globbed, JSONL lines are counted through a memory map and
+    Parquet row counts come from the file metadata. CSV files are not counted
+    because quoted notes may span several lines.
+
+    Args:
+        source: Directory of .txt notes, or path to a .jsonl, .csv or .parquet file
+
+    Returns:
+        Optional[int]: The number of notes, or None when it cannot be known cheaply
+    """
+    if os.path.isdir(source):
+        return sum(1 for _ in Path(source).glob('*.txt'))
+
+    suffix = Path(source).suffix.lower()
+    if suffix in (".jsonl", ".ndjson"):
+        if os.path.getsize(source) == 0:
+            return 0
+        with open(source, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return sum(1 for line in iter(mm.readline, b'') if line.strip())
+    if suffix in (".parquet", ".pq"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            return None
+        return pq.ParquetFile(source).metadata.num_rows
+    return None
+
+
+def _iter_note_records(source: str, columns: List[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Iterate over the records of a JSONL, CSV or Parquet file, reading only the given columns.
+
+    Args:
+        source: Path to a .jsonl, .csv or .parquet file
+        columns: Fields or columns to read (missing JSONL fields are None)
+
+    Yields:
+        Dict: One record per note
+    """
+    suffix = Path(source).suffix.lower()
+    if suffix in (".jsonl", ".ndjson"):
+        if os.path.getsize(source) == 0:
+            return
+        with open(source, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line_number, line in enumerate(iter(mm.readline, b''), start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"Warning: skipping invalid JSON on line {line_number} of {source}: {e}")
+                    continue
+                yield {column: record.get(column) for column in columns}
+    elif suffix == ".csv":
+        for chunk in pd.read_csv(source, usecols=columns, dtype=str, chunksize=1000, keep_default_na=False):
+            yield from chunk.to_dict("records")
+    elif suffix in (".parquet", ".pq"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet note sources requires pyarrow (pip install pyarrow)")
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=1000, columns=columns):
+            yield from batch.to_pylist()
+    else:
+        raise ValueError(f"Unsupported note source '{source}'. Expected a directory or a .jsonl, .csv or .parquet file")
+
+
+def iter_patient_notes(source: str, patient_column: str = DEFAULT_PATIENT_COLUMN, id_column: str = DEFAULT_ID_COLUMN,
+                       text_column: str = DEFAULT_TEXT_COLUMN,
+                       date_column: Optional[str] = None) -> Iterator[Tuple[str, List[Dict[str, str]]]]:
+    """
+    Iterate over the notes of each patient, oldest first.
+
+    A directory holds one subdirectory of .txt notes per patient (ordered by file
+    name). Notes of a file source are spooled to a temporary SQLite table and
+    read back one patient at a time, so the extract never has to fit in memory.
+
+    Args:
+        source: Directory of patient subdirectories, or path to a .jsonl, .csv or .parquet file
+        patient_column: Field or column holding the patient ID (file sources only)
+        id_column: Field or column holding the note ID (file sources only)
+        text_column: Field or column holding the note text (file sources only)
+        date_column: Optional field or column holding the note date (ISO format sorts correctly);
+            notes without dates keep their source order
+
+    Yields:
+        Tuple: (patient ID, notes as {"note_id", "note_date", "text"} dicts)
+    """
+    if os.path.isdir(source):
+        for patient_dir in sorted(path for path in Path(source).iterdir() if path.is_dir()):
+            notes = [{"note_id": note_id, "note_date": "", "text": text}
+                     for note_id, text in sorted(iter_directory_notes(str(patient_dir)))]
+            if notes:
+                yield patient_dir.name, notes
+        return
+
+    columns = [patient_column, id_column, text_column] + ([date_column] if date_column else [])
+    with tempfile.TemporaryDirectory() as spool_dir:
+        db = sqlite3.connect(os.path.join(spool_dir, "patient_notes.db"))
+        try:
+            db.execute("CREATE TABLE notes (seq INTEGER PRIMARY KEY, patient_id TEXT, note_id TEXT, note_date TEXT, text TEXT)")
+            skipped = 0
+            for seq, record in enumerate(_iter_note_records(source, columns), start=1):
+                text = record.get(text_column)
+                patient_id = record.get(patient_column)
+                if not isinstance(text, str) or not text.strip() or patient_id in (None, ""):
+                    skipped += 1
+                    continue
+                note_id = record.get(id_column)
+                db.execute("INSERT INTO notes VALUES (?, ?, ?, ?, ?)",
+                           (seq, str(patient_id), str(note_id) if note_id not in (None, "") else f"row-{seq}",
+                            str(record.get(date_column) or "") if date_column else "", text))
+            db.commit()
+            if skipped:
+                print(f"Warning: skipped {skipped} records of {source} without '{patient_column}' or '{text_column}'")
+
+            db.execute("CREATE INDEX notes_by_patient ON notes (patient_id, note_date, seq)")
+            patient_id, notes = None, []
+            for row_patient, note_id, note_date, text in db.execute(
+                    "SELECT patient_id, note_id, note_date, text FROM notes ORDER BY patient_id, note_date, seq"):
+                if row_patient != patient_id and notes:
+                    yield patient_id, notes
+                    notes = []
+                patient_id = row_patient
+                notes.append({"note_id": note_id, "note_date": note_date, "text": text})
+            if notes:
+                yield patient_id, notes
+        finally:
+            db.close()
@@ -0,0 +1,292 @@
+"""
+Local ONNX text classifiers run on CPU with onnxruntime.
+
+Both classifiers score notes in batches before any LLM call. The triage
+classifier scores notes for staging relevance, and notes below its threshold
+are reported as "Not applicable" without an identify kickoff. The category
+classifier predicts the AJCC category, and a confident prediction replaces
+the identify LLM stage. Any ONNX model that takes a batch of raw strings and
+returns class probabilities can be used, for example a scikit-learn TF-IDF
+and logistic regression pipeline exported with skl2onnx. Models that need a
+tokenizer must include it in the graph (onnxruntime-extensions).
+"""
+
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .metrics import get_metrics
+from .tracing import get_tracer
+
+TRIAGE_STAGED = "staged"
+TRIAGE_SKIPPED = "skipped"
+
+
+def _require_onnxruntime():
+    """
+    Import onnxruntime, which is only needed for local classifiers.
+    """
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        raise ImportError("Local classifiers require onnxruntime (pip install onnxruntime)")
+    return ort
+
+
+class OnnxTextClassifier:
+    """
+    Text classifier backed by an ONNX model with one string input.
+    """
+
+    def __init__(self, model_path: str, labels: Optional[Sequence[str]] = None, threads: Optional[int] = None):
+        """
+        Load the model into a CPU inference session.
+
+        Args:
+            model_path: Path to the .onnx model
+            labels: Class labels in output order (defaults to the model's "labels"
+                metadata, comma-separated, or the keys of a ZipMap output)
+            threads: Number of intra-op threads (defaults to onnxruntime's choice)
+        """
+        ort = _require_onnxruntime()
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.model_path = model_path
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+        inputs = self.session.get_inputs()
+        if len(inputs) != 1 or inputs[0].type != "tensor(string)":
+            raise ValueError(f"{model_path}: expected one string tensor input, got "
+                             f"{', '.join(f'{i.name} ({i.type})' for i in inputs)}")
+        self._input = inputs[0]
+
+        # Class probabilities: a float tensor [batch, classes] or a skl2onnx ZipMap of {label: probability}
+        outputs = self.session.get_outputs()
+        probability_outputs = [o.name for o in outputs if "prob" in o.name.lower()]
+        self._output = probability_outputs[0] if probability_outputs else outputs[-1].name
+
+        metadata_labels = self.session.get_modelmeta().custom_metadata_map.get("labels")
+        if labels is None and metadata_labels:
+            labels = [label.strip() for label in metadata_labels.split(",")]
+        self.labels: Optional[List[str]] = list(labels) if labels is not None else None
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Class probabilities of a batch of texts.
+
+        Args:
+            texts: The texts to classify
+
+        Returns:
+            np.ndarray: Probabilities of shape [len(texts), classes]
+        """
+        batch = np.array(list(texts), dtype=object)
+        if len(self._input.shape) == 2:
+            batch = batch.reshape(-1, 1)
+        (probabilities,) = self.session.run([self._output], {self._input.name: batch})
+
+        if isinstance(probabilities, list):
+            # ZipMap output: one {label: probability} dict per text
+            keys = list(probabilities[0]) if probabilities else []
+            if self.labels is None:
+                self.labels = [str(key) for key in keys]
+            by_label = {str(key): key for key in keys}
+            return np.array([[row[by_label[label]] for label in self.labels] for row in probabilities],
+                            dtype=np.float32)
+        return np.asarray(probabilities, dtype=np.float32)
+
+    def label_index(self, label: str) -> int:
+        """
+        Output column of a class label.
+
+        Args:
+            label: The class label
+
+        Returns:
+            int: Column index in predict_proba output
+        """
+        if self.labels is None:
+            raise ValueError(f"{self.model_path}: class labels are unknown; pass them explicitly")
+        if label not in self.labels:
+            raise ValueError(f"{self.model_path}: no class '{label}' (classes: {', '.join(self.labels)})")
+        return self.labels.index(label)
+
+
+class NoteTriage:
+    """
+    Scores notes for staging relevance so irrelevant notes skip the LLM pipeline.
+    """
+
+    def __init__(self, classifier: OnnxTextClassifier, threshold: float = 0.5,
+                 relevant_label: Optional[str] = "relevant", batch_size: int = 32):
+        """
+        Initialize the triage step.
+
+        Args:
+            classifier: The note classifier
+            threshold: Notes scoring below this relevance are skipped
+            relevant_label: Class whose probability is the relevance score (for a
+                two-class model without labels, None uses the second column)
+            batch_size: Number of notes scored per model call
+        """
+        self.classifier = classifier
+        self.threshold = threshold
+        self.relevant_label = relevant_label
+        self.batch_size = batch_size
+        if relevant_label is not None:
+            # ZipMap models only reveal their labels on a prediction
+            if classifier.labels is None:
+                classifier.predict_proba([""])
+            # Fail at setup rather than on the first batch of a run when the class does not exist
+            if classifier.labels is not None:
+                classifier.label_index(relevant_label)
+
+    def _relevant_column(self, probabilities: np.ndarray) -> int:
+        if self.classifier.labels is None or self.relevant_label is None:
+            return probabilities.shape[1] - 1
+        return self.classifier.label_index(self.relevant_label)
+
+    def score(self, texts: Sequence[str]) -> List[float]:
+        """
+        Staging relevance of each text, computed in batches.
+
+        Args:
+            texts: Note contents
+
+        Returns:
+            List[float]: Relevance scores between 0 and 1
+        """
+        scores: List[float] = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            with get_tracer().span("triage", notes=len(batch)):
+                probabilities = self.classifier.predict_proba(batch)
+            scores.extend(float(p) for p in probabilities[:, self._relevant_column(probabilities)])
+        return scores
+
+    def decision(self, score: float) -> str:
+        """
+        TRIAGE_STAGED when a score reaches the threshold, TRIAGE_SKIPPED otherwise.
+        """
+        decision = TRIAGE_STAGED if score >= self.threshold else TRIAGE_SKIPPED
+        get_metrics().inc("staging_triage_total", decision=decision)
+        return decision
+
+
+class CategoryClassifier:
+    """
+    Predicts the AJCC category of notes; the class labels are category names.
+    """
+
+    def __init__(self, classifier: OnnxTextClassifier, threshold: float = 0.8, batch_size: int = 32):
+        """
+        Initialize the category classifier.
+
+        Args:
+            classifier: Note classifier whose labels are AJCC category names (or "Not in AJCC 8th Edition")
+            threshold: Minimum probability for a prediction to replace the identify LLM stage
+            batch_size: Number of notes classified per model call
+        """
+        self.classifier = classifier
+        self.threshold = threshold
+        self.batch_size = batch_size
+
+    def predict(self, texts: Sequence[str]) -> List[Tuple[str, float]]:
+        """
+        Most likely category of each text, computed in batches.
+
+        Args:
+            texts: Note contents
+
+        Returns:
+            List[Tuple]: (category, probability) per text
+        """
+        predictions: List[Tuple[str, float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            with get_tracer().span("classify_category", notes=len(batch)):
+                probabilities = self.classifier.predict_proba(batch)
+            labels = self.classifier.labels or [str(i) for i in range(probabilities.shape[1])]
+            for row in probabilities:
+                best = int(np.argmax(row))
+                predictions.append((labels[best], float(row[best])))
+        return predictions
+
+
+@dataclass
+class NotePrediction:
+    """
+    Local classifier outputs for one note (None where a classifier is not configured).
+    """
+
+    triage_score: Optional[float] = None
+    category: Optional[str] = None
+    category_confidence: Optional[float] = None
+
+
+class LocalClassifiers:
+    """
+    The local classifiers run ahead of the LLM pipeline, sharing one pass over each batch of notes.
+    """
+
+    def __init__(self, triage: Optional[NoteTriage] = None, categories: Optional[CategoryClassifier] = None,
+                 batch_size: int = 32):
+        """
+        Args:
+            triage: Optional staging relevance classifier
+            categories: Optional AJCC category classifier
+            batch_size: Number of notes read from a stream per batch
+        """
+        self.triage = triage
+        self.categories = categories
+        self.batch_size = batch_size
+
+    @property
+    def enabled(self) -> bool:
+        return self.triage is not None or self.categories is not None
+
+    def predict(self, texts: Sequence[str]) -> List[NotePrediction]:
+        """
+        Run the configured classifiers on a batch of notes.
+
+        Args:
+            texts: Note contents
+
+        Returns:
+            List[NotePrediction]: One prediction per note
+        """
+        predictions = [NotePrediction() for _ in texts]
+        if self.triage is not None:
+            for prediction, score in zip(predictions, self.triage.score(texts)):
+                prediction.triage_score = score
+        if self.categories is not None:
+            for prediction, (category, confidence) in zip(predictions, self.categories.predict(texts)):
+                prediction.category = category
+                prediction.category_confidence = confidence
+        return predictions
+
+    def predict_stream(self, notes: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str, NotePrediction]]:
+        """
+        Classify a stream of notes batch by batch, holding one batch in memory.
+
+        Args:
+            notes: (note ID, note content) pairs
+
+        Yields:
+            Tuple: (note ID, note content, prediction)
+        """
+        batch: List[Tuple[str, str]] = []
+        for note in notes:
+            batch.append(note)
+            if len(batch) >= self.batch_size:
+                yield from self._predict_batch(batch)
+                batch = []
+        if batch:
+            yield from self._predict_batch(batch)
+
+    def _predict_batch(self, batch: List[Tuple[str, str]]) -> Iterator[Tuple[str, str, NotePrediction]]:
+        predictions = self.predict([note_text for _, note_text in batch])
+        for (note_id, note_text), prediction in zip(batch, predictions):
+            yield note_id, note_text, prediction
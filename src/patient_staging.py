@@ -0,0 +1,368 @@
+"""
+Longitudinal staging of patients across many notes.
+
+Notes are grouped by patient and read oldest first. Staging-relevant sentences
+(tumor, nodal, metastasis, pathology and stage mentions) are merged into one
+evidence digest per patient, so text repeated in addenda and copied-forward
+notes counts once. Identification runs once, on the first digest that has
+evidence. A later note triggers the analyze and calculate stages only when it
+adds new evidence, and the report stage runs once per patient at the end. The
+result is a single clinical/pathologic stage timeline per patient.
+
+Patient state can be kept in a SQLite file between runs, so a later extract
+only restages patients with new notes.
+"""
+
+import os
+import re
+import csv
+import json
+import hashlib
+import sqlite3
+import datetime
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Any, List, Optional, Tuple
+
+from .note_sources import iter_patient_notes, DEFAULT_PATIENT_COLUMN, DEFAULT_ID_COLUMN, DEFAULT_TEXT_COLUMN
+from .metrics import get_metrics, ProgressReporter
+from .run_logging import get_logger, note_context
+from .tnm_utils import find_tnm, normalize_stage
+
+logger = get_logger("patients")
+
+# Sentences mentioning any of these terms are kept as staging evidence
+_EVIDENCE_PATTERN = re.compile(
+    r"\b(carcinoma|cancer|malignan\w*|neoplasm|tumou?r|mass|lesion|metasta\w*|lymph\s*nodes?|nodal|adenopathy|"
+    r"lymphadenopathy|extranodal|biopsy|patholog\w*|histolog\w*|margins?|invasion|invasive|invades|extension|"
+    r"resection|excision|laryngectomy|neck dissection|staging|stage|TNM|PET|grade|differentiated|p16|HPV)\b",
+    re.IGNORECASE
+)
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?;])\s+|\n+")
+
+PATIENT_TIMELINE_COLUMNS = ["Patient ID", "Medical Note", "Note Date", "Disease", "Category", "System", "TNM Values",
+                            "Clinical Stage", "Pathologic Stage", "Restaged", "Explanation"]
+
+
+def extract_evidence(note_text: str) -> List[str]:
+    """
+    Extract the staging-relevant sentences of a note.
+
+    Args:
+        note_text: The medical note content
+
+    Returns:
+        List[str]: Sentences mentioning the tumor, nodes, metastases, pathology, TNM or a stage
+    """
+    sentences = []
+    for sentence in _SENTENCE_SPLIT.split(note_text or ""):
+        sentence = " ".join(sentence.split())
+        if sentence and (_EVIDENCE_PATTERN.search(sentence) or find_tnm(sentence)
+                         or normalize_stage(sentence)["code"]):
+            sentences.append(sentence)
+    return sentences
+
+
+def _evidence_key(sentence: str) -> str:
+    """
+    Key of an evidence sentence that ignores case, spacing and punctuation.
+    """
+    normalized = re.sub(r"[^a-z0-9]+", " ", sentence.lower()).strip()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class PatientState:
+    """
+    Staging state of one patient, updated note by note.
+    """
+
+    patient_id: str
+    # Staging system the patient is staged with, routed from their first note
+    staging_system: str = ""
+    notes_seen: List[str] = field(default_factory=list)
+    # Evidence blocks in note order: {"note_id", "note_date", "sentences"}
+    evidence: List[Dict[str, Any]] = field(default_factory=list)
+    evidence_keys: List[str] = field(default_factory=list)
+    identified: bool = False
+    cancer_type: str = "Not assessed"
+    cancer_category: str = "Not applicable"
+    tnm_values: str = "Not provided"
+    proceed_with_staging: bool = False
+    criteria_analysis: str = ""
+    clinical_stage: str = "Not applicable"
+    pathologic_stage: str = "Not applicable"
+    explanation: str = "No staging-relevant evidence found in the patient's notes."
+    report: str = ""
+    timeline: List[Dict[str, str]] = field(default_factory=list)
+
+    def digest(self, max_chars: int = 12000) -> str:
+        """
+        Merge the evidence into one note for the LLM stages.
+
+        When the evidence exceeds max_chars, the first note's evidence (usually the
+        diagnosis) and the most recent notes are kept.
+
+        Args:
+            max_chars: Approximate size limit of the digest
+
+        Returns:
+            str: The evidence digest
+        """
+        blocks = []
+        for entry in self.evidence:
+            header = f"[{entry['note_date']}] {entry['note_id']}" if entry["note_date"] else entry["note_id"]
+            blocks.append(f"{header}:\n" + "\n".join(entry["sentences"]))
+
+        if sum(len(block) + 2 for block in blocks) > max_chars and len(blocks) > 1:
+            kept, size = [], len(blocks[0])
+            for block in reversed(blocks[1:]):
+                if size + len(block) + 2 > max_chars:
+                    break
+                kept.insert(0, block)
+                size += len(block) + 2
+            omitted = len(blocks) - 1 - len(kept)
+            blocks = [blocks[0]] + ([f"[{omitted} intermediate note(s) omitted]"] if omitted else []) + kept
+
+        return (f"Evidence digest for patient {self.patient_id} "
+                f"({len(self.evidence)} note(s) with staging evidence, oldest first):\n\n" + "\n\n".join(blocks))
+
+
+class PatientStateStore:
+    """
+    SQLite store of patient states, so repeated runs only restage patients with new notes.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Open (and create if needed) the patient state database.
+
+        Args:
+            db_path: Path to the SQLite database file
+        """
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=60.0)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS patient_state "
+                          "(patient_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at TEXT NOT NULL)")
+        self.conn.commit()
+
+    def load(self, patient_id: str) -> Optional[PatientState]:
+        """
+        Load the saved state of a patient.
+
+        Args:
+            patient_id: The patient ID
+
+        Returns:
+            Optional[PatientState]: The saved state, or None for a new patient
+        """
+        row = self.conn.execute("SELECT state FROM patient_state WHERE patient_id = ?", (patient_id,)).fetchone()
+        return PatientState(**json.loads(row[0])) if row else None
+
+    def save(self, state: PatientState) -> None:
+        """
+        Save the state of a patient.
+
+        Args:
+            state: The patient state
+        """
+        self.conn.execute("INSERT OR REPLACE INTO patient_state VALUES (?, ?, ?)",
+                          (state.patient_id, json.dumps(asdict(state)), datetime.datetime.now().isoformat()))
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class LongitudinalStaging:
+    """
+    Stages each patient once across all of their notes, on top of an AdultCancerStaging pipeline.
+    """
+
+    def __init__(self, staging, state_db_path: Optional[str] = None, max_digest_chars: int = 12000):
+        """
+        Initialize longitudinal staging.
+
+        Args:
+            staging: The AdultCancerStaging pipeline used for the identify, analyze,
+                calculate and report stages
+            state_db_path: Optional SQLite file keeping patient states between runs
+            max_digest_chars: Approximate size limit of the evidence digest sent to the LLM stages
+        """
+        self.staging = staging
+        self.state_db_path = state_db_path
+        self.max_digest_chars = max_digest_chars
+
+    def _identify(self, staging, state: PatientState, digest: str) -> None:
+        """
+        Identify the patient's cancer from the evidence digest.
+        """
+        # The local category classifier only knows the categories of the main pipeline
+        prediction = staging.classify_notes([digest])[0] if staging is self.staging else None
+        state.cancer_type, state.cancer_category, state.tnm_values, proceed = staging.identify_note(digest, prediction)
+        state.proceed_with_staging = proceed and state.cancer_category != staging.spec.not_stageable
+        state.identified = True
+        if not state.proceed_with_staging:
+            state.explanation = f"This cancer type is not included in the {staging.spec.title} staging system."
+
+    def stage_patient(self, patient_id: str, notes: List[Dict[str, str]],
+                      state: Optional[PatientState] = None) -> Tuple[PatientState, List[Dict[str, str]]]:
+        """
+        Update a patient's staging with their notes, oldest first.
+
+        Notes already seen in an earlier run are skipped. Identification runs on the
+        first digest with evidence (and again on new evidence while the patient has
+        no stageable cancer); every note adding new evidence restages the patient.
+
+        Args:
+            patient_id: The patient ID
+            notes: The patient's notes as {"note_id", "note_date", "text"} dicts, oldest first
+            state: The patient's saved state, if any
+
+        Returns:
+            Tuple: (updated state, timeline rows of the new notes)
+        """
+        metrics = get_metrics()
+        state = state or PatientState(patient_id)
+        if not state.staging_system and notes:
+            state.staging_system = self.staging.route(notes[0]["text"])
+        staging = self.staging.system_pipeline(state.staging_system or self.staging.SYSTEM)
+        seen = set(state.notes_seen)
+        known_evidence = set(state.evidence_keys)
+        rows = []
+        restaged = False
+
+        for note in notes:
+            if note["note_id"] in seen:
+                metrics.inc("staging_patient_notes_total", decision="already_seen")
+                continue
+            seen.add(note["note_id"])
+            state.notes_seen.append(note["note_id"])
+
+            new_evidence = []
+            for sentence in extract_evidence(note["text"]):
+                key = _evidence_key(sentence)
+                if key not in known_evidence:
+                    known_evidence.add(key)
+                    state.evidence_keys.append(key)
+                    new_evidence.append(sentence)
+
+            note_restaged = False
+            if new_evidence:
+                state.evidence.append({"note_id": note["note_id"], "note_date": note["note_date"],
+                                       "sentences": new_evidence})
+                digest = state.digest(self.max_digest_chars)
+                with note_context(note_id=note["note_id"]):
+                    if not state.identified or not state.proceed_with_staging:
+                        self._identify(staging, state, digest)
+                    else:
+                        # TNM written in the new note supersedes the earlier values
+                        state.tnm_values = find_tnm(" ".join(new_evidence)) or state.tnm_values
+                    if state.proceed_with_staging:
+                        (state.criteria_analysis, state.clinical_stage, state.pathologic_stage,
+                         state.explanation) = staging.calculate_stages(
+                            digest, state.cancer_type, state.cancer_category, state.tnm_values)
+                        note_restaged = restaged = True
+            metrics.inc("staging_patient_notes_total", decision="restaged" if note_restaged else "no_new_evidence")
+
+            entry = {
+                "Patient ID": patient_id,
+                "Medical Note": note["note_id"],
+                "Note Date": note["note_date"],
+                "Disease": state.cancer_type,
+                "Category": state.cancer_category,
+                "System": staging.spec.label,
+                "TNM Values": state.tnm_values,
+                "Clinical Stage": state.clinical_stage,
+                "Pathologic Stage": state.pathologic_stage,
+                "Restaged": "Yes" if note_restaged else "No",
+                "Explanation": state.explanation if note_restaged else ""
+            }
+            state.timeline.append(entry)
+            rows.append(entry)
+
+        if restaged:
+            state.report = staging.generate_report(
+                state.digest(self.max_digest_chars), state.cancer_type, state.cancer_category, state.clinical_stage,
+                state.pathologic_stage, state.tnm_values, state.criteria_analysis, state.explanation)
+        return state, rows
+
+    @staticmethod
+    def _patient_markdown(state: PatientState) -> str:
+        """
+        Format the timeline and final staging of one patient.
+        """
+        section = f"## Patient {state.patient_id}\n\n"
+        section += f"**Disease:** {state.cancer_type}\n\n"
+        section += f"**Category:** {state.cancer_category}\n\n"
+        section += f"**Current Stage:** Clinical: {state.clinical_stage}, Pathologic: {state.pathologic_stage}\n\n"
+        section += "| Note Date | Medical Note | TNM Values | Clinical Stage | Pathologic Stage | Restaged |\n"
+        section += "|-----------|--------------|------------|----------------|------------------|----------|\n"
+        for entry in state.timeline:
+            section += (f"| {entry['Note Date'] or '-'} | {entry['Medical Note']} | {entry['TNM Values']} | "
+                        f"{entry['Clinical Stage']} | {entry['Pathologic Stage']} | {entry['Restaged']} |\n")
+        section += f"\n**Detailed Explanation:**\n\n{state.explanation}\n\n"
+        if state.report:
+            section += f"**Staging Report:**\n\n{state.report}\n\n"
+        return section
+
+    def process_patients(self, source: str, output_csv: str, patient_column: str = DEFAULT_PATIENT_COLUMN,
+                         id_column: str = DEFAULT_ID_COLUMN, text_column: str = DEFAULT_TEXT_COLUMN,
+                         date_column: Optional[str] = None) -> None:
+        """
+        Stage every patient of a note source and save the timelines to CSV and markdown files.
+        A patient that fails is logged and does not stop the run.
+
+        Args:
+            source: Directory of patient subdirectories, or a JSONL/CSV/Parquet file of notes
+            output_csv: Path to save the CSV output ("_patients" is added to the file name)
+            patient_column: Field or column holding the patient ID (file sources only)
+            id_column: Field or column holding the note ID (file sources only)
+            text_column: Field or column holding the note text (file sources only)
+            date_column: Optional field or column holding the note date (file sources only)
+        """
+        metrics = get_metrics()
+        output_base, output_ext = os.path.splitext(output_csv)
+        csv_output, md_output = self.staging._timestamped_output_paths(f"{output_base}_patients{output_ext or '.csv'}")
+        store = PatientStateStore(self.state_db_path) if self.state_db_path else None
+        progress = ProgressReporter(description="Patients")
+        patients = failed = 0
+        try:
+            with open(csv_output, 'w', newline='', encoding='utf-8') as csv_file, \
+                    open(md_output, 'w', encoding='utf-8') as md:
+                writer = csv.DictWriter(csv_file, fieldnames=PATIENT_TIMELINE_COLUMNS)
+                writer.writeheader()
+                md.write("# Cancer Staging Report - Patient Timelines\n\n")
+                md.write(f"**Date of Extraction:** {datetime.datetime.now().strftime('%Y-%m-%d')}\n\n")
+
+                for patient_id, notes in iter_patient_notes(source, patient_column, id_column, text_column, date_column):
+                    with note_context(note_id=patient_id):
+                        try:
+                            state, rows = self.stage_patient(patient_id, notes, store.load(patient_id) if store else None)
+                        except Exception as e:
+                            failed += 1
+                            metrics.inc("staging_patients_total", status="failed")
+                            logger.error(f"Staging patient {patient_id} failed: {e}")
+                            progress.advance(1)
+                            continue
+                    patients += 1
+                    metrics.inc("staging_patients_total", status="done")
+                    writer.writerows(rows)
+                    md.write(self._patient_markdown(state))
+                    if store is not None:
+                        store.save(state)
+                    progress.advance(1)
+        finally:
+            progress.close()
+            if store is not None:
+                store.close()
+
+        print(f"Staged {patients} patient(s){f', {failed} failed' if failed else ''}")
+        print(f"CSV results saved to: {csv_output}")
+        print(f"Markdown report saved to: {md_output}")
+        cascade = self.staging.cascade_summary()
+        if cascade:
+            with open(md_output, 'a', encoding='utf-8') as md:
+                md.write(cascade)
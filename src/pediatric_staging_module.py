@@ -0,0 +1,139 @@
+import re
+from collections.abc import Mapping
+from typing import Dict, Any, List, Optional, Tuple
+
+from .adult_staging_module import AdultCancerStaging
+from .pediatric_tasks import PediatricStagingTasks
+from .stage_validation import StagingValidator
+from .staging_systems import SYSTEM_AJCC8, SYSTEM_TORONTO, STAGING_SYSTEMS
+from .run_logging import get_logger
+
+logger = get_logger("pipeline")
+
+# Common names of childhood cancers that do not appear in the Toronto category names
+PEDIATRIC_DISEASE_ALIASES = {
+    "acute lymphoblastic leukaemia": "Acute Lymphoblastic Leukemia",
+    "b-cell acute lymphoblastic leukemia": "Acute Lymphoblastic Leukemia",
+    "t-cell acute lymphoblastic leukemia": "Acute Lymphoblastic Leukemia",
+    "hodgkin's lymphoma": "Hodgkin Lymphoma",
+    "burkitt lymphoma": "Non-Hodgkin Lymphoma",
+    "anaplastic large cell lymphoma": "Non-Hodgkin Lymphoma",
+    "lymphoblastic lymphoma": "Non-Hodgkin Lymphoma",
+    "diffuse large b-cell lymphoma": "Non-Hodgkin Lymphoma",
+    "ganglioneuroblastoma": "Neuroblastoma",
+    "nephroblastoma": "Wilms Tumor (Renal Tumors)",
+    "embryonal rhabdomyosarcoma": "Rhabdomyosarcoma",
+    "alveolar rhabdomyosarcoma": "Rhabdomyosarcoma",
+    "synovial sarcoma": "Non-Rhabdo Soft Tissue Sarcoma",
+    "osteosarcoma": "Bone Tumors",
+    "ewing sarcoma": "Bone Tumors",
+    "dysgerminoma": "Ovarian Germ Cell Tumor",
+    "yolk sac tumor of the ovary": "Ovarian Germ Cell Tumor",
+    "yolk sac tumor of the testis": "Testicular Germ Cell Tumor",
+    "pilocytic astrocytoma": "Astrocytoma",
+    "low-grade glioma": "Astrocytoma",
+    "atypical teratoid/rhabdoid tumor": "Medulloblastoma (CNS Embryonal Tumors)",
+}
+
+
+class PediatricStagingValidator(StagingValidator):
+    """
+    Validates staging results against the Toronto guidelines, which list named stages
+    per category instead of TNM tables and grouping rules.
+    """
+
+    def validate_stage_result(self, cancer_category: str, tnm_values: str, clinical_stage: str,
+                              pathologic_stage: str) -> List[str]:
+        """
+        Check that a determined stage is one of the category's Toronto stages.
+
+        Args:
+            cancer_category: Toronto category
+            tnm_values: Stage documented in the note (unused)
+            clinical_stage: The determined Toronto stage, e.g. "Stage III" or "CNS2"
+            pathologic_stage: Unused by the Toronto guidelines
+
+        Returns:
+            List[str]: Problems found (empty when the stage is known or could not be determined)
+        """
+        stages = list((self.entries.get(cancer_category) or {}).get("stages") or {})
+        stage_text = (clinical_stage or "").strip()
+        if not stages or not stage_text or stage_text.lower().startswith(("insufficient", "not applicable", "unknown")):
+            return []
+        if any(re.search(rf"(?<!\w){re.escape(stage)}(?!\w)", stage_text, re.IGNORECASE) for stage in stages):
+            return []
+        return [f"Clinical stage: '{stage_text}' is not a Toronto stage of {cancer_category} "
+                f"(known stages: {', '.join(stages)})"]
+
+    def reference(self, cancer_category: str) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """
+        The stage definitions of a category, for prompts.
+
+        Args:
+            cancer_category: Toronto category
+
+        Returns:
+            Tuple: (empty TNM table, {stage: definition})
+        """
+        return {}, (self.entries.get(cancer_category) or {}).get("stages") or {}
+
+
+class PediatricCancerStaging(AdultCancerStaging):
+    """
+    Staging pipeline for childhood cancers using the Toronto childhood cancer staging guidelines.
+
+    Runs the same stages, caching, cascade and correction logic as AdultCancerStaging with
+    the Toronto staging data, task templates and stage validation.
+    """
+
+    SYSTEM = SYSTEM_TORONTO
+    TASKS = PediatricStagingTasks
+    VALIDATOR = PediatricStagingValidator
+
+    def _create_disease_mapping(self, data: Mapping) -> None:
+        """
+        Create the mapping of disease names to Toronto categories: each category name,
+        the names inside and outside its parentheses, and PEDIATRIC_DISEASE_ALIASES.
+
+        Args:
+            data: The Toronto staging data (category name to entry)
+        """
+        self.available_categories = list(data.keys())
+        self.disease_mapping = {}
+        for category in self.available_categories:
+            self.disease_mapping[category.lower()] = category
+            for name in re.split(r"\s*[()]\s*", category):
+                if name:
+                    self.disease_mapping.setdefault(name.lower(), category)
+        for alias, category in PEDIATRIC_DISEASE_ALIASES.items():
+            if category in data:
+                self.disease_mapping.setdefault(alias, category)
+
+        print(f"Created pediatric disease mapping with {len(self.disease_mapping)} entries")
+        print(f"Available categories: {len(self.available_categories)}")
+
+
+def create_staging_pipeline(staging_data_path: str, staging_system: str = SYSTEM_AJCC8,
+                            pediatric_staging_data_path: Optional[str] = None, **kwargs) -> AdultCancerStaging:
+    """
+    Create the staging pipeline of a staging system.
+
+    Args:
+        staging_data_path: Path to the AJCC staging JSON file
+        staging_system: "ajcc8", "toronto", or "auto" to route each note by patient age
+        pediatric_staging_data_path: Path to the Toronto staging JSON file ("toronto" and "auto" only)
+        **kwargs: Other AdultCancerStaging settings
+
+    Returns:
+        AdultCancerStaging: The pipeline
+    """
+    if staging_system == SYSTEM_TORONTO:
+        return PediatricCancerStaging(staging_data_path=pediatric_staging_data_path or staging_data_path, **kwargs)
+    if staging_system == "auto":
+        if not pediatric_staging_data_path:
+            raise ValueError("Routing notes between staging systems needs the Toronto staging data")
+        return AdultCancerStaging(staging_data_path=staging_data_path,
+                                  pediatric_staging_data_path=pediatric_staging_data_path, **kwargs)
+    if staging_system != SYSTEM_AJCC8:
+        raise ValueError(f"Unknown staging system '{staging_system}' (known: {', '.join(STAGING_SYSTEMS)}, auto)")
+    return AdultCancerStaging(staging_data_path=staging_data_path, **kwargs)
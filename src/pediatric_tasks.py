@@ -0,0 +1,272 @@
+from crewai import Task
+from typing import Dict, Any, List
+
+class PediatricStagingTasks:
+    """
+    Provides tasks for pediatric cancer staging with the Toronto childhood cancer staging guidelines.
+
+    The builders mirror AdultCancerStagingTasks (same names, arguments and answer formats),
+    so the staging pipeline runs them unchanged.
+    """
+
+    @staticmethod
+    def identify_cancer_type(agent, medical_note: str, staging_data: Dict[str, Any],
+                            available_categories: List[str] = None,
+                            disease_mapping: Dict[str, str] = None) -> Task:
+        """
+        Creates a task to identify the childhood cancer type and any documented stage from medical notes,
+        and verify the cancer is covered by the Toronto guidelines.
+
+        Args:
+            agent: The agent to assign this task to
+            medical_note: The medical note content
+            staging_data: Toronto staging data (category name to {"criteria", "stages", "definitions"})
+            available_categories: List of Toronto cancer categories
+            disease_mapping: Mapping of disease names to their Toronto categories
+
+        Returns:
+            Task: A CrewAI task for cancer identification
+        """
+        if available_categories is None:
+            available_categories = list(staging_data.keys())
+
+        mapping_examples = ""
+        if disease_mapping:
+            mapping_sample = list(disease_mapping.items())[:20]
+            mapping_examples = "\n".join([f"- '{key}' maps to category '{value}'"
+                                         for key, value in mapping_sample])
+
+        return Task(
+            description=f"""
+            Analyze the provided medical note of a pediatric patient carefully to identify the specific
+            childhood cancer type from the Toronto childhood cancer staging guidelines.
+
+            If multiple cancer types are mentioned, select the one that appears to be the primary diagnosis.
+
+            Also extract any stage already documented in the note (e.g., CNS2, Stage III, L2, M1, or TNM values).
+            If no stage is documented, indicate 'Not provided'.
+
+            IMPORTANT: After identifying the cancer type, verify that it belongs to one of the Toronto
+            staging categories. If it does not, indicate 'Not in Toronto staging guidelines' and do not
+            proceed with staging.
+
+            Medical Note:
+            {medical_note}
+
+            Available Cancer Categories in the Toronto staging guidelines:
+            {', '.join(available_categories)}
+
+            Disease Mapping Examples:
+            {mapping_examples}
+
+            Your response should follow this format:
+            Cancer Type: [Identified cancer type]
+            Cancer Category: [The Toronto category it belongs to, or 'Not in Toronto staging guidelines']
+            TNM Values: [Stage or TNM values documented in the note, or 'Not provided']
+            Proceed with Staging: [Yes/No] (Only 'Yes' if the cancer is covered by the Toronto guidelines)
+            """,
+            expected_output="Identification of specific cancer type, its category, documented stage, and whether to proceed with staging",
+            agent=agent
+        )
+
+    @staticmethod
+    def analyze_staging_criteria(agent, medical_note: str, cancer_type: str, cancer_category: str, tnm_values: str, staging_data: Dict[str, Any]) -> Task:
+        """
+        Creates a task to analyze which Toronto staging criteria are present for a childhood cancer.
+
+        Args:
+            agent: The agent to assign this task to
+            medical_note: The medical note content
+            cancer_type: The identified cancer type
+            cancer_category: The Toronto category the cancer belongs to
+            tnm_values: Stage or TNM values documented in the note
+            staging_data: Toronto staging data
+
+        Returns:
+            Task: A CrewAI task for criteria analysis
+        """
+        entry = staging_data.get(cancer_category) or {}
+        criteria = "\n".join(f"- {criterion}" for criterion in entry.get("criteria", []))
+        definitions = "\n".join(f"- {term}: {definition}" for term, definition in (entry.get("definitions") or {}).items())
+
+        return Task(
+            description=f"""
+            Carefully analyze the provided medical note to identify which staging criteria for
+            {cancer_type} (in the {cancer_category} category) are present, according to the
+            Toronto childhood cancer staging guidelines.
+
+            Medical Note:
+            {medical_note}
+
+            Documented Stage (if provided): {tnm_values}
+
+            Criteria to check for {cancer_category}:
+            {criteria}
+
+            Definitions:
+            {definitions}
+
+            For each criterion, state whether it is present, absent or not documented,
+            and cite the exact text from the medical note that supports this.
+            """,
+            expected_output="Detailed analysis of the Toronto staging criteria with supporting evidence from the medical note",
+            agent=agent
+        )
+
+    @staticmethod
+    def calculate_stage(agent, medical_note: str, cancer_type: str, cancer_category: str, tnm_values: str, criteria_analysis: str, staging_data: Dict[str, Any]) -> Task:
+        """
+        Creates a task to determine the Toronto stage based on the analyzed criteria.
+
+        Args:
+            agent: The agent to assign this task to
+            medical_note: The medical note content
+            cancer_type: The identified cancer type
+            cancer_category: The Toronto category the cancer belongs to
+            tnm_values: Stage or TNM values documented in the note
+            criteria_analysis: The detailed analysis of present staging criteria
+            staging_data: Toronto staging data
+
+        Returns:
+            Task: A CrewAI task for stage calculation
+        """
+        stages = (staging_data.get(cancer_category) or {}).get("stages") or {}
+        stage_definitions = "\n".join(f"{stage}: {definition}" for stage, definition in stages.items())
+
+        return Task(
+            description=f"""
+            Based on the identified criteria and the Toronto childhood cancer staging guidelines for
+            {cancer_type} (in the {cancer_category} category), determine the stage.
+
+            Medical Note:
+            {medical_note}
+
+            Documented Stage (if provided): {tnm_values}
+
+            Criteria Analysis:
+            {criteria_analysis}
+
+            Toronto Stages for {cancer_category}:
+            {stage_definitions}
+
+            Use exactly one of the stage names listed above. The Toronto guidelines have no separate
+            pathologic stage.
+            Your response should follow this format:
+            Clinical Stage: [Determined Toronto stage or 'Insufficient information']
+            Pathologic Stage: Not applicable
+            Explanation: [Detailed explanation of how you determined the stage based on the present criteria]
+            """,
+            expected_output="Determination of the Toronto stage with detailed explanation",
+            agent=agent
+        )
+
+    @staticmethod
+    def correct_stage(agent, medical_note: str, cancer_type: str, cancer_category: str, tnm_values: str,
+                      criteria_analysis: str, previous_result: str, problems: List[str],
+                      tnm_categories: Dict[str, Any], stage_groupings: Dict[str, str]) -> Task:
+        """
+        Creates a task to correct a stage that is not one of the category's Toronto stages.
+
+        Args:
+            agent: The agent to assign this task to
+            medical_note: The medical note content
+            cancer_type: The identified cancer type
+            cancer_category: The Toronto category the cancer belongs to
+            tnm_values: Stage or TNM values documented in the note
+            criteria_analysis: The detailed analysis of present staging criteria
+            previous_result: The stage determination that failed validation
+            problems: The inconsistencies found in the previous result
+            tnm_categories: Unused (the Toronto guidelines have no TNM tables)
+            stage_groupings: The category's Toronto stages ({"Stage I": definition, ...})
+
+        Returns:
+            Task: A CrewAI task for stage correction
+        """
+        stages = "\n".join(f"{stage}: {definition}" for stage, definition in stage_groupings.items())
+        issues = "\n".join(f"- {problem}" for problem in problems)
+
+        return Task(
+            description=f"""
+            A stage determination for {cancer_type} (in the {cancer_category} category) does not follow
+            the Toronto childhood cancer staging guidelines. Correct it.
+
+            Medical Note:
+            {medical_note}
+
+            Documented Stage (if provided): {tnm_values}
+
+            Criteria Analysis:
+            {criteria_analysis}
+
+            Previous Stage Determination:
+            {previous_result}
+
+            Inconsistencies Found:
+            {issues}
+
+            Toronto Stages for {cancer_category}:
+            {stages}
+
+            Use exactly one of the stage names listed above.
+            Your response should follow this format:
+            Clinical Stage: [Determined Toronto stage or 'Insufficient information']
+            Pathologic Stage: Not applicable
+            Explanation: [Detailed explanation of how you determined the stage and what was corrected]
+            """,
+            expected_output="Corrected stage using one of the Toronto stages of the category",
+            agent=agent
+        )
+
+    @staticmethod
+    def generate_report(agent, medical_note: str, cancer_type: str, cancer_category: str, clinical_stage: str,
+                         pathologic_stage: str, tnm_values: str, criteria_analysis: str, explanation: str) -> Task:
+        """
+        Creates a task to generate a pediatric staging report.
+
+        Args:
+            agent: The agent to assign this task to
+            medical_note: The medical note content
+            cancer_type: The identified cancer type
+            cancer_category: The Toronto category the cancer belongs to
+            clinical_stage: The determined Toronto stage
+            pathologic_stage: Unused by the Toronto guidelines ("Not applicable")
+            tnm_values: Stage or TNM values documented in the note
+            criteria_analysis: The detailed analysis of present staging criteria
+            explanation: The explanation for the stage determination
+
+        Returns:
+            Task: A CrewAI task for report generation
+        """
+        return Task(
+            description=f"""
+            Generate a comprehensive and professionally formatted pediatric cancer staging report
+            based on the analysis of the medical note. The report should be suitable for inclusion
+            in a patient's medical record.
+
+            Patient Information:
+            [Extract relevant non-identifying patient information from the medical note]
+
+            Diagnosis: {cancer_type} (Category: {cancer_category})
+
+            Documented Stage: {tnm_values}
+
+            Toronto Stage: {clinical_stage}
+
+            Criteria Analysis Summary:
+            {criteria_analysis}
+
+            Stage Determination:
+            {explanation}
+
+            Your report should include:
+            1. A brief summary of the case
+            2. The Toronto stage
+            3. Key findings that determined the stage
+            4. Any important prognostic factors
+            5. Any limitations or uncertainties in the staging determination
+
+            Format the report in a clear, professional manner suitable for medical documentation.
+            """,
+            expected_output="Comprehensive, professionally formatted pediatric cancer staging report",
+            agent=agent
+        )
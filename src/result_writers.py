@@ -0,0 +1,136 @@
+"""
+Columnar (Parquet) output for staging results.
+
+Results are written incrementally in row groups while a run is in progress.
+Stage and TNM fields go to a typed staging file, and the long free-text
+Explanation and Report columns go to a separate text file keyed by the note,
+so analytics jobs can read the stage columns without touching the reports.
+"""
+
+import datetime
+from typing import Dict, Any, List
+
+from .tnm_utils import split_tnm
+
+
+def _require_pyarrow():
+    """
+    Import pyarrow, which is only needed for columnar output.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet output requires pyarrow (pip install pyarrow)")
+    return pa, pq
+
+
+class ParquetResultWriter:
+    """
+    Appends result rows to a staging Parquet file and a free-text Parquet file.
+    """
+
+    def __init__(self, output_base: str, row_group_size: int = 256):
+        """
+        Open the Parquet files for writing.
+
+        Args:
+            output_base: Output path without extension; writes <base>.parquet and <base>_text.parquet
+            row_group_size: Number of rows buffered before a row group is written
+        """
+        pa, pq = _require_pyarrow()
+        self._pa = pa
+        self.row_group_size = row_group_size
+        self.staging_path = f"{output_base}.parquet"
+        self.text_path = f"{output_base}_text.parquet"
+
+        self.staging_schema = pa.schema([
+            ("medical_note", pa.string()),
+            ("date_of_extraction", pa.date32()),
+            ("disease", pa.string()),
+            ("category", pa.string()),
+            ("system", pa.string()),
+            ("tnm_values", pa.string()),
+            ("tnm_prefix", pa.string()),
+            ("t_category", pa.string()),
+            ("n_category", pa.string()),
+            ("m_category", pa.string()),
+            ("clinical_stage", pa.string()),
+            ("pathologic_stage", pa.string()),
+            ("proceed_with_staging", pa.bool_()),
+            ("triage_score", pa.float64()),
+            ("triage_decision", pa.string()),
+            ("predicted_category", pa.string()),
+            ("category_confidence", pa.float64())
+        ])
+        self.text_schema = pa.schema([
+            ("medical_note", pa.string()),
+            ("explanation", pa.string()),
+            ("report", pa.string())
+        ])
+
+        self._staging_writer = pq.ParquetWriter(self.staging_path, self.staging_schema, compression="zstd")
+        self._text_writer = pq.ParquetWriter(self.text_path, self.text_schema, compression="zstd")
+        self._staging_buffer: List[Dict[str, Any]] = []
+        self._text_buffer: List[Dict[str, Any]] = []
+        self.rows_written = 0
+
+    def write_row(self, row: Dict[str, Any]) -> None:
+        """
+        Buffer one result row (as built by AdultCancerStaging._build_result_row),
+        writing a row group when the buffer is full.
+
+        Args:
+            row: The result row
+        """
+        tnm = split_tnm(row['TNM Values'])
+        self._staging_buffer.append({
+            "medical_note": row['Medical Note'],
+            "date_of_extraction": datetime.date.fromisoformat(row['Date of Extraction']),
+            "disease": row['Disease'],
+            "category": row['Category'],
+            "system": row['System'],
+            "tnm_values": row['TNM Values'],
+            "tnm_prefix": tnm["prefix"],
+            "t_category": tnm["T"],
+            "n_category": tnm["N"],
+            "m_category": tnm["M"],
+            "clinical_stage": row.get('Clinical Stage'),
+            "pathologic_stage": row.get('Pathologic Stage'),
+            "proceed_with_staging": row['Proceed with Staging'] == "Yes",
+            "triage_score": row.get('Triage Score'),
+            "triage_decision": row.get('Triage Decision'),
+            "predicted_category": row.get('Predicted Category'),
+            "category_confidence": row.get('Category Confidence')
+        })
+        self._text_buffer.append({
+            "medical_note": row['Medical Note'],
+            "explanation": row.get('Explanation'),
+            "report": row.get('Report')
+        })
+        if len(self._staging_buffer) >= self.row_group_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write the buffered rows as one row group in each file.
+        """
+        if not self._staging_buffer:
+            return
+        pa = self._pa
+        self._staging_writer.write_table(pa.Table.from_pylist(self._staging_buffer, schema=self.staging_schema))
+        self._text_writer.write_table(pa.Table.from_pylist(self._text_buffer, schema=self.text_schema))
+        self.rows_written += len(self._staging_buffer)
+        self._staging_buffer = []
+        self._text_buffer = []
+
+    def close(self) -> None:
+        """
+        Write any remaining rows and close both files.
+        """
+        try:
+            self.flush()
+        finally:
+            self._staging_writer.close()
+            self._text_writer.close()
+        print(f"Parquet results saved to: {self.staging_path} (free text: {self.text_path})")
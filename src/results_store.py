@@ -0,0 +1,275 @@
+"""
+Embedded SQLite database of staging results.
+
+Every run appends its results to one indexed database instead of leaving only
+timestamped CSV/markdown pairs behind, so questions such as "all stage III
+laryngeal cases this quarter" are answered by an indexed query. Free-text
+explanations and reports live in a separate table so aggregations only scan
+the narrow results table.
+"""
+
+import os
+import uuid
+import time
+import hashlib
+import sqlite3
+import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from .tnm_utils import split_tnm, normalize_stage
+
+# Columns that query results can be grouped by
+GROUP_BY_COLUMNS = {
+    "category": "category",
+    "disease": "disease",
+    "clinical_stage": "clinical_stage_code",
+    "clinical_stage_group": "clinical_stage_group",
+    "pathologic_stage": "pathologic_stage_code",
+    "pathologic_stage_group": "pathologic_stage_group",
+    "model": "model",
+    "run_id": "run_id",
+    "extraction_date": "extraction_date",
+    "extraction_month": "substr(extraction_date, 1, 7)",
+    "proceed_with_staging": "proceed_with_staging"
+}
+
+
+def content_hash(note_text: str) -> str:
+    """
+    Hash the content of a medical note.
+
+    Args:
+        note_text: The medical note content
+
+    Returns:
+        str: Hex SHA-256 digest of the note
+    """
+    return hashlib.sha256(note_text.encode("utf-8")).hexdigest()
+
+
+def new_run_id() -> str:
+    """
+    Create an identifier for a staging run.
+
+    Returns:
+        str: "<YYYYMMDD_HHMMSS>-<random suffix>"
+    """
+    return f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+class ResultsStore:
+    """
+    Indexed SQLite store of staging results across runs.
+    """
+
+    def __init__(self, db_path: str, commit_every: int = 100):
+        """
+        Open (and create if needed) the results database.
+
+        Args:
+            db_path: Path to the SQLite database file
+            commit_every: Number of recorded results per transaction
+        """
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=60.0)
+        self.conn.row_factory = sqlite3.Row
+        self.commit_every = commit_every
+        self._pending = 0
+        self._create_schema()
+
+    def _create_schema(self) -> None:
+        """
+        Create the tables and indexes if they do not exist.
+        """
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                started_at REAL NOT NULL,
+                model TEXT,
+                source TEXT
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY,
+                run_id TEXT NOT NULL,
+                note_id TEXT NOT NULL,
+                content_hash TEXT,
+                extraction_date TEXT,
+                recorded_at REAL NOT NULL,
+                model TEXT,
+                disease TEXT,
+                category TEXT,
+                system TEXT,
+                tnm_values TEXT,
+                t_category TEXT,
+                n_category TEXT,
+                m_category TEXT,
+                clinical_stage TEXT,
+                clinical_stage_code TEXT,
+                clinical_stage_group TEXT,
+                pathologic_stage TEXT,
+                pathologic_stage_code TEXT,
+                pathologic_stage_group TEXT,
+                proceed_with_staging INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS result_text (
+                result_id INTEGER PRIMARY KEY REFERENCES results (id),
+                explanation TEXT,
+                report TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_results_note_id ON results (note_id);
+            CREATE INDEX IF NOT EXISTS idx_results_content_hash ON results (content_hash);
+            CREATE INDEX IF NOT EXISTS idx_results_run_id ON results (run_id);
+            CREATE INDEX IF NOT EXISTS idx_results_model ON results (model);
+            CREATE INDEX IF NOT EXISTS idx_results_category_clinical ON results (category, clinical_stage_group, extraction_date);
+            CREATE INDEX IF NOT EXISTS idx_results_category_pathologic ON results (category, pathologic_stage_group, extraction_date);
+            CREATE INDEX IF NOT EXISTS idx_results_clinical_stage ON results (clinical_stage_code);
+            CREATE INDEX IF NOT EXISTS idx_results_pathologic_stage ON results (pathologic_stage_code);
+            CREATE INDEX IF NOT EXISTS idx_results_extraction_date ON results (extraction_date);
+        """)
+
+    def start_run(self, model: Optional[str] = None, source: Optional[str] = None,
+                  run_id: Optional[str] = None) -> str:
+        """
+        Register a new run.
+
+        Args:
+            model: The model used for the run
+            source: The note, directory or file that was processed
+            run_id: Optional run identifier (generated if omitted)
+
+        Returns:
+            str: The run identifier
+        """
+        run_id = run_id or new_run_id()
+        self.conn.execute(
+            "INSERT OR IGNORE INTO runs (run_id, started_at, model, source) VALUES (?, ?, ?, ?)",
+            (run_id, time.time(), model, source)
+        )
+        self.conn.commit()
+        return run_id
+
+    def record(self, run_id: str, row: Dict[str, Any], note_hash: Optional[str] = None,
+               model: Optional[str] = None) -> int:
+        """
+        Record one result row (as built by AdultCancerStaging._build_result_row).
+
+        Args:
+            run_id: The run the result belongs to
+            row: The result row
+            note_hash: Content hash of the note (see content_hash)
+            model: The model that produced the result
+
+        Returns:
+            int: The result identifier
+        """
+        tnm = split_tnm(row['TNM Values'])
+        clinical = normalize_stage(row.get('Clinical Stage'))
+        pathologic = normalize_stage(row.get('Pathologic Stage'))
+        cursor = self.conn.execute(
+            """
+            INSERT INTO results (
+                run_id, note_id, content_hash, extraction_date, recorded_at, model, disease, category, system,
+                tnm_values, t_category, n_category, m_category,
+                clinical_stage, clinical_stage_code, clinical_stage_group,
+                pathologic_stage, pathologic_stage_code, pathologic_stage_group, proceed_with_staging
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                run_id, row['Medical Note'], note_hash, row['Date of Extraction'], time.time(), model,
+                row['Disease'], row['Category'], row['System'],
+                row['TNM Values'], tnm["T"], tnm["N"], tnm["M"],
+                row.get('Clinical Stage'), clinical["code"], clinical["group"],
+                row.get('Pathologic Stage'), pathologic["code"], pathologic["group"],
+                1 if row['Proceed with Staging'] == "Yes" else 0
+            )
+        )
+        result_id = cursor.lastrowid
+        self.conn.execute(
+            "INSERT INTO result_text (result_id, explanation, report) VALUES (?, ?, ?)",
+            (result_id, row.get('Explanation'), row.get('Report'))
+        )
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.commit()
+        return result_id
+
+    def commit(self) -> None:
+        """
+        Commit the recorded results.
+        """
+        self.conn.commit()
+        self._pending = 0
+
+    def close(self) -> None:
+        """
+        Commit and close the database.
+        """
+        self.commit()
+        self.conn.close()
+
+    def query(self, category: Optional[str] = None, stage: Optional[str] = None, stage_type: str = "any",
+              since: Optional[str] = None, until: Optional[str] = None, model: Optional[str] = None,
+              run_id: Optional[str] = None, note_id: Optional[str] = None, content_hash: Optional[str] = None,
+              group_by: Optional[List[str]] = None, limit: Optional[int] = None) -> Tuple[List[str], List[tuple]]:
+        """
+        Query the results, either listing matching rows or counting them per group.
+
+        Args:
+            category: AJCC category (exact match)
+            stage: Stage group such as "III" (matches IIIA, IIIB, ...) or a full code such as "IIIB"
+            stage_type: "clinical", "pathologic" or "any"
+            since: Earliest extraction date (YYYY-MM-DD, inclusive)
+            until: Latest extraction date (YYYY-MM-DD, inclusive)
+            model: Model name
+            run_id: Run identifier
+            note_id: Note identifier
+            content_hash: Content hash of the note
+            group_by: Columns to count by (see GROUP_BY_COLUMNS); lists rows when omitted
+            limit: Maximum number of rows returned
+
+        Returns:
+            Tuple: (column names, rows)
+        """
+        conditions = []
+        params: List[Any] = []
+        for column, value in (("category", category), ("model", model), ("run_id", run_id),
+                              ("note_id", note_id), ("content_hash", content_hash)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if since:
+            conditions.append("extraction_date >= ?")
+            params.append(since)
+        if until:
+            conditions.append("extraction_date <= ?")
+            params.append(until)
+        if stage:
+            normalized = normalize_stage(stage if stage.lower().startswith("stage") else f"Stage {stage}")
+            if normalized["code"] is None:
+                raise ValueError(f"Unrecognized stage '{stage}'")
+            # A bare group ("III") matches all its sub-stages; a full code ("IIIB") matches exactly
+            suffix, value = ("group", normalized["group"]) if normalized["code"] == normalized["group"] else ("code", normalized["code"])
+            stage_types = ["clinical", "pathologic"] if stage_type == "any" else [stage_type]
+            conditions.append("(" + " OR ".join(f"{kind}_stage_{suffix} = ?" for kind in stage_types) + ")")
+            params.extend([value] * len(stage_types))
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        if group_by:
+            unknown = [name for name in group_by if name not in GROUP_BY_COLUMNS]
+            if unknown:
+                raise ValueError(f"Cannot group by {', '.join(unknown)}. Expected one of: {', '.join(GROUP_BY_COLUMNS)}")
+            expressions = [GROUP_BY_COLUMNS[name] for name in group_by]
+            sql = (f"SELECT {', '.join(f'{expr} AS {name}' for expr, name in zip(expressions, group_by))}, COUNT(*) AS count "
+                   f"FROM results {where} GROUP BY {', '.join(expressions)} ORDER BY count DESC")
+        else:
+            sql = (f"SELECT run_id, note_id, extraction_date, model, disease, category, tnm_values, "
+                   f"clinical_stage, pathologic_stage FROM results {where} ORDER BY id")
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+
+        cursor = self.conn.execute(sql, params)
+        columns = [description[0] for description in cursor.description]
+        return columns, [tuple(row) for row in cursor.fetchall()]
@@ -0,0 +1,210 @@
+"""
+Per-note retries and dead-letter output for batch runs.
+
+A failed note is put back on a bounded retry queue with exponential backoff
+when the failure looks transient (LLM timeouts, rate limits, connection
+errors, or an unparseable model answer). Once it runs out of attempts, or
+when the failure is permanent, the note goes to a dead-letter JSONL file.
+The batch keeps going either way. The dead-letter file uses the note_id/text
+fields of the JSONL note source, so it can be fed back as --note_source.
+"""
+
+import os
+import json
+import time
+import heapq
+import random
+import datetime
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Exception class names (from openai, httpx, litellm, ...) treated as transient,
+# matched by name so none of those packages has to be imported here
+TRANSIENT_ERROR_NAMES = {
+    "APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError",
+    "ServiceUnavailableError", "Timeout", "TimeoutException", "ConnectError", "ReadTimeout",
+    "RemoteProtocolError", "TimeoutError", "ConnectionError", "ConnectionResetError"
+}
+
+
+class ModelOutputParseError(ValueError):
+    """
+    Raised when a model answer cannot be parsed.
+    """
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Decide whether a failed note is worth retrying.
+
+    Network, timeout and rate-limit errors are transient, and so is a
+    ModelOutputParseError (the next completion usually parses). Everything
+    else, such as unreadable input or a configuration error, is permanent.
+
+    Args:
+        error: The exception raised while processing the note
+
+    Returns:
+        bool: True if the note should be retried
+    """
+    if isinstance(error, ModelOutputParseError):
+        return True
+    return any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(error).__mro__)
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Attempt limit and exponential backoff for failed notes.
+    """
+
+    max_attempts: int = 3
+    base_delay: float = 2.0
+    max_delay: float = 60.0
+    jitter: float = 0.25
+
+    def delay(self, attempt: int) -> float:
+        """
+        Backoff before the next attempt.
+
+        Args:
+            attempt: The attempt that just failed (1 for the first attempt)
+
+        Returns:
+            float: Seconds to wait, base_delay * 2^(attempt - 1) capped at max_delay, with jitter
+        """
+        delay = min(self.base_delay * (2 ** (attempt - 1)), self.max_delay)
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+@dataclass(order=True)
+class RetryItem:
+    """
+    A note waiting for its next attempt.
+    """
+
+    ready_at: float
+    note_id: str = field(compare=False)
+    note_text: str = field(compare=False)
+    attempt: int = field(compare=False)
+
+
+class RetryQueue:
+    """
+    Bounded queue of notes to retry, ordered by the time they become ready.
+    """
+
+    def __init__(self, policy: Optional[RetryPolicy] = None, max_size: int = 100):
+        """
+        Initialize the queue.
+
+        Args:
+            policy: Attempt limit and backoff (defaults to RetryPolicy())
+            max_size: Maximum number of notes waiting; when full, new notes wait
+                for the earliest retry instead of growing the queue
+        """
+        self.policy = policy or RetryPolicy()
+        self.max_size = max_size
+        self._heap: List[RetryItem] = []
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, note_id: str, note_text: str, failed_attempt: int) -> float:
+        """
+        Schedule the next attempt of a note.
+
+        Args:
+            note_id: The note identifier
+            note_text: The note content
+            failed_attempt: The attempt that just failed
+
+        Returns:
+            float: Seconds until the next attempt
+        """
+        delay = self.policy.delay(failed_attempt)
+        heapq.heappush(self._heap, RetryItem(time.monotonic() + delay, note_id, note_text, failed_attempt + 1))
+        return delay
+
+    def _pop(self, wait: bool) -> Optional[RetryItem]:
+        if not self._heap:
+            return None
+        wait_seconds = self._heap[0].ready_at - time.monotonic()
+        if wait_seconds > 0:
+            if not wait:
+                return None
+            time.sleep(wait_seconds)
+        return heapq.heappop(self._heap)
+
+    def schedule(self, notes: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str, int]]:
+        """
+        Interleave new notes with retries that are due. Failures reported with
+        push() while iterating are picked up by the same iteration.
+
+        Args:
+            notes: (note ID, note content) pairs
+
+        Yields:
+            Tuple: (note ID, note content, attempt number)
+        """
+        for note_id, note_text in notes:
+            while True:
+                item = self._pop(wait=len(self._heap) >= self.max_size)
+                if item is None:
+                    break
+                yield item.note_id, item.note_text, item.attempt
+            yield note_id, note_text, 1
+        # Drain the retries left once the source is exhausted
+        while self._heap:
+            item = self._pop(wait=True)
+            yield item.note_id, item.note_text, item.attempt
+
+
+class DeadLetterWriter:
+    """
+    Appends permanently failed notes to a JSONL file, opened on the first failure.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Path to the dead-letter JSONL file
+        """
+        self.path = path
+        self.count = 0
+        self._file = None
+
+    def write(self, note_id: str, note_text: str, error: BaseException, attempts: int) -> None:
+        """
+        Record a failed note with its error.
+
+        Args:
+            note_id: The note identifier
+            note_text: The note content
+            error: The last exception raised for the note
+            attempts: Number of attempts made
+        """
+        if self._file is None:
+            output_dir = os.path.dirname(self.path)
+            if output_dir and not os.path.exists(output_dir):
+                os.makedirs(output_dir, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps({
+            "note_id": note_id,
+            "error_type": type(error).__name__,
+            "error": str(error),
+            "attempts": attempts,
+            "failed_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "text": note_text
+        }) + "\n")
+        self._file.flush()
+        self.count += 1
+
+    def close(self) -> None:
+        """
+        Close the file and report how many notes failed.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            print(f"{self.count} failed notes written to: {self.path}")
@@ -0,0 +1,213 @@
+"""
+Structured, non-blocking logging for staging runs.
+
+Log records from the staging code go through a QueueHandler, so worker
+threads only enqueue them; a QueueListener thread formats them as JSON lines
+into one file per run (and, above a threshold, to the console). Every record
+carries the run ID and the ID and stage of the note being processed. Full
+agent transcripts (agent steps and task outputs) are written to a separate
+file, and only when requested.
+"""
+
+import os
+import json
+import queue
+import logging
+import datetime
+import contextvars
+import logging.handlers
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+LOGGER_NAME = "staging"
+TRANSCRIPT_LOGGER_NAME = f"{LOGGER_NAME}.transcript"
+
+_note_id = contextvars.ContextVar("log_note_id", default=None)
+_stage = contextvars.ContextVar("log_stage", default=None)
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "run_id", "note_id", "stage"}
+
+
+def get_logger(component: str) -> logging.Logger:
+    """
+    Return the logger of a staging component.
+
+    Args:
+        component: Component name, e.g. "pipeline" or "worker"
+
+    Returns:
+        logging.Logger: The "staging.<component>" logger
+    """
+    return logging.getLogger(f"{LOGGER_NAME}.{component}")
+
+
+@contextmanager
+def note_context(note_id: Optional[str] = None, stage: Optional[str] = None):
+    """
+    Attach a note ID and/or pipeline stage to the log records emitted inside the block.
+
+    Args:
+        note_id: The note being processed (unchanged when None)
+        stage: The pipeline stage (unchanged when None)
+    """
+    note_token = _note_id.set(note_id) if note_id is not None else None
+    stage_token = _stage.set(stage) if stage is not None else None
+    try:
+        yield
+    finally:
+        if stage_token is not None:
+            _stage.reset(stage_token)
+        if note_token is not None:
+            _note_id.reset(note_token)
+
+
+class _ContextFilter(logging.Filter):
+    """
+    Stamps records with the run ID and the current note context. Runs in the
+    emitting thread, before the record crosses the queue.
+    """
+
+    def __init__(self, run_id: str):
+        super().__init__()
+        self.run_id = run_id
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.run_id = self.run_id
+        record.note_id = _note_id.get()
+        record.stage = _stage.get()
+        return True
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "run_id": getattr(record, "run_id", None),
+            "note_id": getattr(record, "note_id", None),
+            "stage": getattr(record, "stage", None),
+            "message": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RunLogging:
+    """
+    Queue-based logging setup for one run; call close() to flush the files.
+    """
+
+    def __init__(self, log_dir: str, run_id: str, level: str = "INFO", console_level: str = "WARNING",
+                 capture_transcripts: bool = False):
+        """
+        Install the queue handler and start the listener thread.
+
+        Args:
+            log_dir: Directory of the per-run log files
+            run_id: Run identifier, used in the file names and on every record
+            level: Minimum level written to the log file
+            console_level: Minimum level also printed to the console
+            capture_transcripts: Also write agent transcripts to <run>_transcripts.jsonl
+        """
+        os.makedirs(log_dir, exist_ok=True)
+        self.run_id = run_id
+        self.log_path = os.path.join(log_dir, f"run_{run_id}.jsonl")
+        self.transcript_path = os.path.join(log_dir, f"run_{run_id}_transcripts.jsonl") if capture_transcripts else None
+
+        formatter = JsonLinesFormatter()
+        not_transcript = lambda record: not record.name.startswith(TRANSCRIPT_LOGGER_NAME)
+
+        file_handler = logging.FileHandler(self.log_path, encoding="utf-8")
+        file_handler.setLevel(level)
+        file_handler.setFormatter(formatter)
+        file_handler.addFilter(not_transcript)
+        handlers = [file_handler]
+
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(console_level)
+        console_handler.setFormatter(logging.Formatter("%(levelname)s %(name)s: %(message)s"))
+        console_handler.addFilter(not_transcript)
+        handlers.append(console_handler)
+
+        if self.transcript_path:
+            transcript_handler = logging.FileHandler(self.transcript_path, encoding="utf-8")
+            transcript_handler.setFormatter(formatter)
+            transcript_handler.addFilter(lambda record: record.name.startswith(TRANSCRIPT_LOGGER_NAME))
+            handlers.append(transcript_handler)
+
+        self._queue = queue.SimpleQueue()
+        self._queue_handler = logging.handlers.QueueHandler(self._queue)
+        self._queue_handler.addFilter(_ContextFilter(run_id))
+        self._listener = logging.handlers.QueueListener(self._queue, *handlers, respect_handler_level=True)
+
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self.logger.addHandler(self._queue_handler)
+        transcript_logger = logging.getLogger(TRANSCRIPT_LOGGER_NAME)
+        transcript_logger.disabled = not capture_transcripts
+        self._handlers = handlers
+        self._listener.start()
+
+    def close(self) -> None:
+        """
+        Stop the listener, flushing the queued records, and remove the handler.
+        """
+        if self._listener is None:
+            return
+        self._listener.stop()
+        self._listener = None
+        self.logger.removeHandler(self._queue_handler)
+        for handler in self._handlers:
+            handler.close()
+        print(f"Run log saved to: {self.log_path}")
+
+
+def configure_run_logging(log_dir: str, run_id: str, level: str = "INFO", console_level: str = "WARNING",
+                          capture_transcripts: bool = False) -> RunLogging:
+    """
+    Set up non-blocking JSON-lines logging for a run.
+
+    Args:
+        log_dir: Directory of the per-run log files
+        run_id: Run identifier
+        level: Minimum level written to the log file
+        console_level: Minimum level also printed to the console
+        capture_transcripts: Also write agent transcripts to a separate file
+
+    Returns:
+        RunLogging: The logging setup (call close() at the end of the run)
+    """
+    return RunLogging(log_dir, run_id, level=level, console_level=console_level,
+                      capture_transcripts=capture_transcripts)
+
+
+def transcript_callbacks() -> Dict[str, Any]:
+    """
+    Build Crew step/task callbacks that log the agent transcript; the note ID
+    and stage come from the surrounding note_context.
+
+    Returns:
+        Dict: Keyword arguments for Crew (step_callback and task_callback)
+    """
+    logger = logging.getLogger(TRANSCRIPT_LOGGER_NAME)
+
+    def step_callback(step: Any) -> None:
+        logger.info("agent step", extra={"event": "step", "step_type": type(step).__name__, "content": str(step)})
+
+    def task_callback(output: Any) -> None:
+        logger.info("task output", extra={"event": "task", "agent": getattr(output, "agent", None),
+                                          "description": getattr(output, "description", None),
+                                          "content": getattr(output, "raw", None) or str(output)})
+
+    return {"step_callback": step_callback, "task_callback": task_callback}
@@ -0,0 +1,107 @@
+"""
+Priority classes and worker reservation for staging jobs.
+
+Jobs are claimed from the work table in priority order (urgent before normal
+before bulk), then by earliest deadline, then in submission order. A number of
+workers can be reserved for the urgent class so that tumor-board notes never
+wait behind a long registry backfill.
+"""
+
+import time
+from typing import Dict, Any, List, Optional
+
+# Priority classes and their ranks (lower rank is claimed first)
+PRIORITY_CLASSES = {
+    "urgent": 0,
+    "normal": 1,
+    "bulk": 2
+}
+
+DEFAULT_PRIORITY_CLASS = "normal"
+
+
+def priority_rank(priority_class: str) -> int:
+    """
+    Look up the rank of a priority class.
+
+    Args:
+        priority_class: Name of the priority class
+
+    Returns:
+        int: The rank used to order claims
+
+    Raises:
+        ValueError: If the class is unknown
+    """
+    if priority_class not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority class '{priority_class}'. Expected one of: {', '.join(PRIORITY_CLASSES)}")
+    return PRIORITY_CLASSES[priority_class]
+
+
+def deadline_from_now(minutes: Optional[float]) -> Optional[float]:
+    """
+    Convert a relative deadline into an absolute timestamp.
+
+    Args:
+        minutes: Minutes from now, or None for no deadline
+
+    Returns:
+        float: The deadline as a Unix timestamp, or None
+    """
+    if minutes is None:
+        return None
+    return time.time() + minutes * 60.0
+
+
+class SchedulingPolicy:
+    """
+    Decides which priority classes each worker of a pool may claim.
+    """
+
+    def __init__(self, num_workers: int, reserved_urgent_workers: int = 0):
+        """
+        Initialize the policy.
+
+        Args:
+            num_workers: Total number of workers in the pool
+            reserved_urgent_workers: Workers that only take urgent jobs
+        """
+        if reserved_urgent_workers >= num_workers and reserved_urgent_workers > 0:
+            raise ValueError("At least one worker must remain available for non-urgent jobs")
+        self.num_workers = num_workers
+        self.reserved_urgent_workers = max(reserved_urgent_workers, 0)
+
+    def classes_for_worker(self, worker_index: int) -> Optional[List[str]]:
+        """
+        List the priority classes a worker may claim.
+
+        Args:
+            worker_index: Position of the worker in the pool (0-based)
+
+        Returns:
+            List: Allowed class names, or None if the worker may claim any class
+        """
+        if worker_index < self.reserved_urgent_workers:
+            return ["urgent"]
+        return None
+
+
+def format_class_metrics(metrics: Dict[str, Dict[str, Any]]) -> str:
+    """
+    Format per-class queue metrics as a compact table for the console.
+
+    Args:
+        metrics: Output of WorkQueue.class_metrics
+
+    Returns:
+        str: One line per priority class
+    """
+    lines = []
+    for priority_class in sorted(metrics, key=lambda name: PRIORITY_CLASSES.get(name, len(PRIORITY_CLASSES))):
+        m = metrics[priority_class]
+        lines.append(
+            f"{priority_class:<7} queued={m['queued']:<6} running={m['running']:<4} done={m['done']:<7} "
+            f"failed={m['failed']:<5} avg_wait={m['avg_wait_seconds']:.1f}s max_wait={m['max_wait_seconds']:.1f}s "
+            f"oldest_queued={m['oldest_queued_seconds']:.1f}s missed_deadlines={m['missed_deadlines']}"
+        )
+    return "\n".join(lines)
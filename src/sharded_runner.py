@@ -0,0 +1,400 @@
+"""
+Sharded batch execution of the staging module.
+
+A shard directory on a shared filesystem holds the SQLite work table and one
+partial output file per worker. Any number of worker processes, on one host
+or on several hosts, claim notes from the work table, and a merge step writes
+the same CSV and markdown outputs as a serial `process_multiple_notes` run.
+"""
+
+import os
+import json
+import time
+import datetime
+import multiprocessing
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Callable
+
+from .adult_staging_module import AdultCancerStaging
+from .pediatric_staging_module import create_staging_pipeline
+from .work_queue import WorkQueue, LeaseKeeper, default_worker_id
+from .note_sources import iter_notes, DEFAULT_ID_COLUMN, DEFAULT_TEXT_COLUMN
+from .result_writers import ParquetResultWriter
+from .scheduler import SchedulingPolicy, DEFAULT_PRIORITY_CLASS, deadline_from_now, format_class_metrics
+from .tracing import configure_tracing
+from .metrics import get_metrics, start_metrics_server, ProgressReporter
+from .run_logging import get_logger, note_context
+
+logger = get_logger("worker")
+
+
+class ShardedStagingRunner:
+    """
+    Coordinates sharded staging runs through a shard directory.
+    """
+
+    def __init__(self, shard_dir: str, staging_kwargs: Optional[Dict[str, Any]] = None):
+        """
+        Initialize the runner.
+
+        Args:
+            shard_dir: Shared directory holding the work table and partial outputs
+            staging_kwargs: Keyword arguments of create_staging_pipeline, used to build the pipeline in each worker
+        """
+        self.shard_dir = shard_dir
+        self.staging_kwargs = staging_kwargs or {}
+        self.db_path = os.path.join(shard_dir, "work_queue.db")
+        self.partials_dir = os.path.join(shard_dir, "partials")
+        os.makedirs(self.partials_dir, exist_ok=True)
+
+    def enqueue_directory(self, note_dir: str, priority_class: str = DEFAULT_PRIORITY_CLASS,
+                          deadline_minutes: Optional[float] = None) -> int:
+        """
+        Add every .txt note in a directory to the work table, in the same order
+        a serial run would process them.
+
+        Args:
+            note_dir: Directory containing medical notes
+            priority_class: Priority class of the notes (urgent, normal or bulk)
+            deadline_minutes: Optional deadline in minutes from now
+
+        Returns:
+            int: Number of notes newly added
+        """
+        note_files = list(Path(note_dir).glob('*.txt'))
+        queue = WorkQueue(self.db_path)
+        try:
+            queue.set_meta("extraction_date", datetime.datetime.now().strftime("%Y-%m-%d"))
+            added = queue.enqueue_many([
+                {"note_id": note_file.name, "note_path": str(note_file.resolve())}
+                for note_file in note_files
+            ], priority_class=priority_class, deadline=deadline_from_now(deadline_minutes))
+        finally:
+            queue.close()
+        print(f"Enqueued {added} new notes from {note_dir} ({len(note_files) - added} already queued)")
+        return added
+
+    def enqueue_source(self, source: str, id_column: str = DEFAULT_ID_COLUMN, text_column: str = DEFAULT_TEXT_COLUMN,
+                       priority_class: str = DEFAULT_PRIORITY_CLASS, deadline_minutes: Optional[float] = None,
+                       chunk_size: int = 1000) -> int:
+        """
+        Stream the notes of a JSONL/CSV/Parquet file into the work table.
+        The note text is stored in the work table, so workers do not need the source file.
+
+        Args:
+            source: Path to the note file
+            id_column: Field or column holding the note ID
+            text_column: Field or column holding the note text
+            priority_class: Priority class of the notes (urgent, normal or bulk)
+            deadline_minutes: Optional deadline in minutes from now
+            chunk_size: Number of notes inserted per transaction
+
+        Returns:
+            int: Number of notes newly added
+        """
+        queue = WorkQueue(self.db_path)
+        added = 0
+        total = 0
+        deadline = deadline_from_now(deadline_minutes)
+        try:
+            queue.set_meta("extraction_date", datetime.datetime.now().strftime("%Y-%m-%d"))
+            chunk = []
+            for note_id, note_text in iter_notes(source, id_column, text_column):
+                chunk.append({"note_id": note_id, "note_text": note_text})
+                if len(chunk) >= chunk_size:
+                    added += queue.enqueue_many(chunk, priority_class=priority_class, deadline=deadline)
+                    total += len(chunk)
+                    chunk = []
+            if chunk:
+                added += queue.enqueue_many(chunk, priority_class=priority_class, deadline=deadline)
+                total += len(chunk)
+        finally:
+            queue.close()
+        print(f"Enqueued {added} new notes from {source} ({total - added} already queued)")
+        return added
+
+    def run_worker(self, worker_id: Optional[str] = None, lease_seconds: float = 900.0,
+                   priority_classes: Optional[List[str]] = None) -> int:
+        """
+        Claim and process notes until the work table has nothing left to claim.
+
+        Args:
+            worker_id: Identifier of this worker (defaults to hostname and pid)
+            lease_seconds: How long a claimed note stays reserved for this worker
+            priority_classes: Restrict this worker to these priority classes (None for any class)
+
+        Returns:
+            int: Number of notes processed successfully by this worker
+        """
+        worker_id = worker_id or default_worker_id()
+        staging_module = create_staging_pipeline(**self.staging_kwargs)
+        queue = WorkQueue(self.db_path)
+        extraction_date = queue.get_meta("extraction_date", datetime.datetime.now().strftime("%Y-%m-%d"))
+        partial_path = os.path.join(self.partials_dir, f"{worker_id}.jsonl")
+        metrics = get_metrics()
+        processed = 0
+
+        try:
+            with open(partial_path, 'a', encoding='utf-8') as partial_file:
+                while True:
+                    item = queue.claim(worker_id, lease_seconds=lease_seconds, priority_classes=priority_classes)
+                    if item is None:
+                        break
+
+                    logger.info(f"[{worker_id}] Processing {item['note_id']}")
+                    # The lease is renewed while the note is staged, however long its stages take
+                    error = None
+                    with LeaseKeeper(queue, item["seq"], worker_id, lease_seconds) as lease:
+                        try:
+                            note_text = item["note_text"]
+                            if note_text is None:
+                                note_text = staging_module._read_medical_note(item["note_path"])
+                            prediction = staging_module.classify_notes([note_text])[0]
+                            result = staging_module.process_note_text(note_text, note_id=item["note_id"],
+                                                                      prediction=prediction)
+                            row = staging_module._build_result_row(item["note_id"], extraction_date, result,
+                                                                   prediction, note_text)
+                        except Exception as e:
+                            error = e
+
+                    if error is not None:
+                        with note_context(note_id=item["note_id"]):
+                            logger.error(f"[{worker_id}] Error processing note: {error}", extra={"worker_id": worker_id})
+                        queue.fail(item["seq"], worker_id, str(error))
+                        metrics.inc("staging_notes_total", status="failed")
+                        continue
+                    if lease.lost:
+                        self._lease_lost(worker_id, item)
+                        continue
+                    # Persist the partial output before releasing the lease
+                    partial_file.write(json.dumps({"seq": item["seq"], "note_id": item["note_id"], "row": dict(row)}) + "\n")
+                    partial_file.flush()
+                    os.fsync(partial_file.fileno())
+                    if not queue.complete(item["seq"], worker_id):
+                        self._lease_lost(worker_id, item)
+                        continue
+                    metrics.inc("staging_notes_total", status="done")
+                    processed += 1
+        finally:
+            queue.close()
+
+        print(f"[{worker_id}] Finished after processing {processed} notes")
+        return processed
+
+    @staticmethod
+    def _lease_lost(worker_id: str, item: Dict[str, Any]) -> None:
+        with note_context(note_id=item["note_id"]):
+            logger.warning(f"[{worker_id}] Lost the lease of the note to another worker; its result is not counted",
+                           extra={"worker_id": worker_id})
+
+    def run_local_workers(self, num_workers: int, lease_seconds: float = 900.0,
+                          initializer: Optional[Callable[[], None]] = None,
+                          reserved_urgent_workers: int = 0, trace_path: Optional[str] = None,
+                          metrics_port: Optional[int] = None) -> None:
+        """
+        Run several worker processes on this host and wait for all of them,
+        showing the progress of the whole shard directory meanwhile.
+
+        Args:
+            num_workers: Number of worker processes to start
+            lease_seconds: Lease duration passed to every worker
+            initializer: Optional function called at the start of every worker process
+            reserved_urgent_workers: Number of workers that only take urgent notes
+            trace_path: Optional trace file path; each worker writes <base>.<worker ID><ext>
+            metrics_port: Optional metrics port; this process serves the shard-wide note
+                counts on it and worker N serves its own metrics on metrics_port + 1 + N
+        """
+        context = multiprocessing.get_context("spawn")
+        policy = SchedulingPolicy(num_workers, reserved_urgent_workers)
+        base_id = default_worker_id()
+        processes = []
+        for index in range(num_workers):
+            process = context.Process(
+                target=_worker_main,
+                args=(self.shard_dir, self.staging_kwargs, f"{base_id}-w{index}", lease_seconds, initializer,
+                      policy.classes_for_worker(index), trace_path,
+                      metrics_port + 1 + index if metrics_port else None)
+            )
+            process.start()
+            processes.append(process)
+
+        metrics_server = start_metrics_server(metrics_port) if metrics_port else None
+        self._report_progress(processes)
+        if metrics_server is not None:
+            metrics_server.shutdown()
+
+        for process in processes:
+            process.join()
+            if process.exitcode != 0:
+                print(f"Warning: worker process {process.pid} exited with code {process.exitcode}")
+
+    def _report_progress(self, processes: List[Any], interval: float = 2.0) -> None:
+        """
+        Poll the work table until the worker processes exit, updating the
+        progress line and the shard-wide note counters.
+
+        Args:
+            processes: The worker processes
+            interval: Seconds between polls
+        """
+        metrics = get_metrics()
+        queue = WorkQueue(self.db_path)
+        try:
+            counts = queue.status_counts()
+            finished = counts.get("done", 0) + counts.get("failed", 0)
+            progress = ProgressReporter(total=sum(counts.values()) - finished, description="Shard")
+            try:
+                while any(process.is_alive() for process in processes):
+                    time.sleep(interval)
+                    counts = queue.status_counts()
+                    metrics.set("staging_notes_total", counts.get("done", 0), status="done")
+                    metrics.set("staging_notes_total", counts.get("failed", 0), status="failed")
+                    now_finished = counts.get("done", 0) + counts.get("failed", 0)
+                    progress.advance(now_finished - finished)
+                    finished = now_finished
+            finally:
+                progress.close()
+        finally:
+            queue.close()
+
+    def class_metrics(self) -> str:
+        """
+        Summarize queue depth and wait times per priority class.
+
+        Returns:
+            str: The formatted per-class metrics
+        """
+        queue = WorkQueue(self.db_path)
+        try:
+            return format_class_metrics(queue.class_metrics())
+        finally:
+            queue.close()
+
+    def _load_partial_rows(self) -> Dict[int, Dict[str, Any]]:
+        """
+        Read the rows written by every worker, keyed by sequence number.
+        If a note was processed twice after a lease expired, the first row wins.
+
+        Returns:
+            Dict: Mapping of sequence number to result row
+        """
+        rows = {}
+        for partial_path in sorted(Path(self.partials_dir).glob('*.jsonl')):
+            with open(partial_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A worker killed mid-write leaves a truncated last line
+                        print(f"Warning: skipping truncated record in {partial_path}")
+                        continue
+                    rows.setdefault(record["seq"], record["row"])
+        return rows
+
+    def merge(self, output_csv: str, allow_incomplete: bool = False, output_format: str = "csv") -> Optional[List[str]]:
+        """
+        Merge the partial outputs into the final CSV and markdown files.
+
+        Args:
+            output_csv: Path to save the CSV output (a timestamp is added as in serial runs)
+            allow_incomplete: Merge even if some notes are still pending or leased
+            output_format: "csv" (CSV and markdown), "parquet" (columnar files) or "both"
+
+        Returns:
+            List: The written output paths (CSV and markdown first), or None if the run is not complete
+        """
+        queue = WorkQueue(self.db_path)
+        try:
+            counts = queue.status_counts()
+            items = queue.items()
+            extraction_date = queue.get_meta("extraction_date", datetime.datetime.now().strftime("%Y-%m-%d"))
+        finally:
+            queue.close()
+
+        outstanding = counts.get("pending", 0) + counts.get("leased", 0)
+        if outstanding and not allow_incomplete:
+            print(f"Cannot merge: {outstanding} notes are still pending or in progress")
+            return None
+        for item in items:
+            if item["status"] == "failed":
+                print(f"Warning: note {item['note_id']} failed and is not in the merged output: {item['error']}")
+
+        rows = self._load_partial_rows()
+        all_data = []
+        merged_items = []
+        for item in items:
+            # A failed note may still have the partial row of an earlier lease holder
+            row = rows.get(item["seq"]) if item["status"] == "done" else None
+            if row is None:
+                continue
+            all_data.append(row)
+            merged_items.append(item)
+
+        if not all_data:
+            print("No completed notes to merge")
+            return None
+
+        csv_output, md_output = AdultCancerStaging._timestamped_output_paths(output_csv)
+        outputs = []
+        if output_format in ("parquet", "both"):
+            parquet_writer = ParquetResultWriter(os.path.splitext(csv_output)[0])
+            try:
+                for row in all_data:
+                    parquet_writer.write_row(row)
+            finally:
+                parquet_writer.close()
+            outputs.extend([parquet_writer.staging_path, parquet_writer.text_path])
+        if output_format in ("csv", "both"):
+            AdultCancerStaging._write_multiple_notes_outputs(all_data, self._note_blocks(merged_items), extraction_date,
+                                                             csv_output, md_output)
+            outputs = [csv_output, md_output] + outputs
+        return outputs
+
+
+    def _note_blocks(self, items: List[Dict[str, Any]]):
+        """
+        Lazily render the complete-note markdown blocks of merged work items.
+
+        Args:
+            items: The merged work items, in serial order
+
+        Yields:
+            str: One markdown block per note
+        """
+        queue = WorkQueue(self.db_path)
+        try:
+            for item in items:
+                if item["note_path"]:
+                    with open(item["note_path"], 'r', encoding='utf-8') as f:
+                        note_content = f.read()
+                else:
+                    note_content = queue.note_text(item["seq"])
+                yield AdultCancerStaging._format_note_block(item["note_id"], note_content)
+        finally:
+            queue.close()
+
+
+def _worker_main(shard_dir: str, staging_kwargs: Dict[str, Any], worker_id: str, lease_seconds: float,
+                 initializer: Optional[Callable[[], None]], priority_classes: Optional[List[str]],
+                 trace_path: Optional[str] = None, metrics_port: Optional[int] = None) -> None:
+    """
+    Entry point of a worker process started by run_local_workers.
+    """
+    if initializer is not None:
+        initializer()
+    if metrics_port:
+        start_metrics_server(metrics_port)
+    tracer = None
+    if trace_path:
+        trace_base, trace_ext = os.path.splitext(trace_path)
+        tracer = configure_tracing(f"{trace_base}.{worker_id}{trace_ext or '.json'}")
+    try:
+        ShardedStagingRunner(shard_dir, staging_kwargs).run_worker(
+            worker_id=worker_id, lease_seconds=lease_seconds, priority_classes=priority_classes
+        )
+    finally:
+        if tracer is not None:
+            tracer.close()
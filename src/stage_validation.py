@@ -0,0 +1,306 @@
+"""
+Local validation of staging results against the AJCC 8th Edition data.
+
+Checks that an identified category exists, that the T, N and M codes exist
+for that category in AJCC8.json, and that a stage agrees with the category's
+stage grouping table. The grouping text ("T1-3, N1, M0 or T4a, Any N, M0") is
+parsed into rules. Conditions that cannot be parsed (grades, PSA, risk
+groups) are treated as wildcards, so a stage is only reported as
+inconsistent when the parseable rules clearly exclude it. Rows qualified by
+something other than TNM (e.g. "Stage I (age <55)" and "Stage I (age ≥55)")
+are merged into one stage code, widening it to all of their alternatives.
+check_groupings() stages every grouping row's own TNM to catch rules that
+would reject correct stages.
+"""
+
+import re
+from collections.abc import Mapping
+from typing import Dict, Any, List, Optional, Tuple
+
+from .tnm_utils import split_tnm, normalize_stage
+
+NOT_IN_AJCC = "Not in AJCC 8th Edition"
+
+# One grouping condition: "Any N", "T1-3", "T4a", "N2"
+_CONDITION_PATTERN = re.compile(r"^(?:any\s+(?P<any>[TNM])|(?P<axis>[TNM])(?P<code>is|X|\d[a-d]?(?:mi)?)(?:\s*-\s*(?P<upper>\d)[a-d]?)?)$", re.IGNORECASE)
+
+
+def _parse_condition(text: str) -> Optional[Tuple[str, Optional[Tuple[str, Optional[str]]]]]:
+    """
+    Parse one grouping condition.
+
+    Returns:
+        (axis, None) for "Any <axis>", (axis, (code, upper digit)) for a code or range,
+        or None when the text is not a TNM condition
+    """
+    match = _CONDITION_PATTERN.match(text.strip().replace("–", "-"))
+    if not match:
+        return None
+    if match.group("any"):
+        return match.group("any").upper(), None
+    return match.group("axis").upper(), (match.group("code"), match.group("upper"))
+
+
+def _code_matches(code: str, condition: Tuple[str, Optional[str]]) -> bool:
+    """
+    Whether a TNM code (without axis letter, e.g. "4a") satisfies a condition:
+    a rule code matches itself and its subcategories ("4" matches "4a"),
+    and a range "1-3" matches every code from 1 to 3.
+    """
+    rule_code, upper = condition
+    if upper is not None and rule_code[:1].isdigit() and code[:1].isdigit():
+        return int(rule_code[0]) <= int(code[0]) <= int(upper)
+    return code.lower().startswith(rule_code.lower())
+
+
+def parse_stage_groupings(groupings: Optional[Dict[str, str]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Parse a Stage_Groupings table into rules.
+
+    Args:
+        groupings: {"Stage III": "T3, N0, M0 or T1-3, N1, M0", ...}
+
+    Returns:
+        Dict: Stage code (e.g. "III") to a list of alternatives; each alternative maps
+        an axis to a condition, and axes not mentioned are unconstrained
+    """
+    rules: Dict[str, List[Dict[str, Any]]] = {}
+    for stage_name, text in (groupings or {}).items():
+        code = normalize_stage(stage_name)["code"]
+        if code is None or not isinstance(text, str):
+            continue
+        alternatives = []
+        for alternative in re.split(r"\s+or\s+|;", text, flags=re.IGNORECASE):
+            conditions = {}
+            for part in alternative.split(","):
+                parsed = _parse_condition(part)
+                if parsed is not None and parsed[1] is not None:
+                    conditions[parsed[0]] = parsed[1]
+            alternatives.append(conditions)
+        # Qualified rows ("Stage II (age <55)", "Stage III (B)") share the code of their stage
+        rules.setdefault(code, []).extend(alternatives)
+    return rules
+
+
+# Clinical, pathologic and other prefixes of TNM keys in the staging data ("cN1", "pN1a")
+_KEY_PREFIX_PATTERN = re.compile(r"^[ycpra]{1,2}(?=[TNM])")
+
+
+def _strip_prefix(code: str) -> str:
+    return _KEY_PREFIX_PATTERN.sub("", code)
+
+
+class StagingValidator:
+    """
+    Validates identification and staging results against AJCC8 data.
+    """
+
+    def __init__(self, staging_data: Any, available_categories: Optional[List[str]] = None,
+                 not_stageable: str = NOT_IN_AJCC):
+        """
+        Index the staging data.
+
+        Args:
+            staging_data: The AJCC8 data (list of {"name", "TNM", "Stage_Groupings", ...}, or a
+                mapping of category name to entry such as a compiled staging system)
+            available_categories: Accepted category names (defaults to the names in staging_data)
+            not_stageable: Category of cancers the staging system does not cover
+        """
+        if isinstance(staging_data, Mapping):
+            self.entries = staging_data
+        else:
+            self.entries = {item["name"]: item for item in staging_data
+                            if isinstance(item, dict) and "name" in item}
+        self.available_categories = set(available_categories or self.entries)
+        self.not_stageable = not_stageable
+        self._rules: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+
+    def _stage_rules(self, category: str) -> Dict[str, List[Dict[str, Any]]]:
+        if category not in self._rules:
+            entry = self.entries.get(category) or {}
+            self._rules[category] = parse_stage_groupings(entry.get("Stage_Groupings"))
+        return self._rules[category]
+
+    def validate_identification(self, cancer_category: str, tnm_values: str) -> List[str]:
+        """
+        Check an identify result: the category must be known and the TNM codes
+        must exist for it.
+
+        Args:
+            cancer_category: The category returned by the identify stage
+            tnm_values: The TNM values returned by the identify stage
+
+        Returns:
+            List[str]: Problems found (empty when the result is valid)
+        """
+        if cancer_category == self.not_stageable:
+            return []
+        if cancer_category not in self.available_categories:
+            return [f"Unknown category '{cancer_category}'"]
+        return self.validate_tnm_codes(cancer_category, tnm_values)
+
+    def validate_tnm_codes(self, cancer_category: str, tnm_values: str) -> List[str]:
+        """
+        Check that the T, N and M codes in a text exist for a category.
+
+        Args:
+            cancer_category: AJCC category
+            tnm_values: Text containing TNM codes (codes that are absent are not checked)
+
+        Returns:
+            List[str]: Problems found (empty when every code is valid)
+        """
+        tnm_table = (self.entries.get(cancer_category) or {}).get("TNM")
+        if not tnm_table:
+            return []
+        problems = []
+        tnm = split_tnm(tnm_values)
+        for axis in ("T", "N", "M"):
+            code = tnm[axis]
+            known = tnm_table.get(axis) or {}
+            if code is None or not known or code.upper().endswith("X"):
+                continue
+            # A subcategory such as T1b is valid when its parent T1 is listed; split_tnm
+            # drops prefixes, so listed keys such as "pN1a" are compared without them
+            listed_codes = [_strip_prefix(listed).lower() for listed in known]
+            if not any(code.lower().startswith(listed) or listed.startswith(code.lower())
+                       for listed in listed_codes):
+                problems.append(f"{code} is not a valid {axis} category for {cancer_category}")
+        return problems
+
+    def matching_stages(self, cancer_category: str, tnm_values: str) -> Optional[List[str]]:
+        """
+        Stage codes whose grouping rules the TNM values satisfy.
+
+        Args:
+            cancer_category: AJCC category
+            tnm_values: TNM text
+
+        Returns:
+            Optional[List[str]]: Matching stage codes, or None when the category has no
+            parseable grouping table or the TNM values are incomplete
+        """
+        rules = self._stage_rules(cancer_category)
+        tnm = split_tnm(tnm_values)
+        if not rules or tnm["T"] is None or tnm["N"] is None or tnm["M"] is None:
+            return None
+        matches = []
+        for stage_code, alternatives in rules.items():
+            for conditions in alternatives:
+                if all(_code_matches(tnm[axis][1:], condition) for axis, condition in conditions.items()):
+                    matches.append(stage_code)
+                    break
+        return matches
+
+    def validate_stage(self, cancer_category: str, tnm_values: str, stage_text: str) -> List[str]:
+        """
+        Check a stage against the category's grouping table.
+
+        Args:
+            cancer_category: AJCC category
+            tnm_values: TNM values from the note (used when the stage text has none)
+            stage_text: Stage output such as "Stage III (T3 N0 M0)"
+
+        Returns:
+            List[str]: Problems found (empty when consistent or when it cannot be checked)
+        """
+        stage = normalize_stage(stage_text)
+        if stage["code"] is None:
+            return []
+        # Prefer the TNM the stage was derived from, as written next to it
+        stage_tnm = split_tnm(stage_text)
+        tnm_source = stage_text if all(stage_tnm[axis] for axis in ("T", "N", "M")) else tnm_values
+        matches = self.matching_stages(cancer_category, tnm_source)
+        if not matches:
+            return []
+        # "Stage IV" agrees with a IVA match and "Stage IVA" with a bare IV rule
+        for match in matches:
+            match_group = normalize_stage(f"Stage {match}")["group"]
+            if stage["code"] == match or (match_group == stage["group"] and (match == match_group or stage["code"] == stage["group"])):
+                return []
+        tnm = split_tnm(tnm_source)
+        return [f"Stage {stage['code']} is inconsistent with {tnm['T']} {tnm['N']} {tnm['M']} for {cancer_category} "
+                f"(grouping table allows: {', '.join('Stage ' + match for match in matches)})"]
+
+    def validate_stage_result(self, cancer_category: str, tnm_values: str, clinical_stage: str,
+                              pathologic_stage: str) -> List[str]:
+        """
+        Check the clinical and pathologic stages of a calculate result: the TNM codes
+        written with each stage and the stage against the grouping table.
+
+        Args:
+            cancer_category: AJCC category
+            tnm_values: TNM values from the note
+            clinical_stage: Clinical stage output, e.g. "Stage III (cT3 N1 M0)"
+            pathologic_stage: Pathologic stage output
+
+        Returns:
+            List[str]: Problems found, prefixed with the stage they concern
+        """
+        problems = []
+        for label, stage_text in (("Clinical", clinical_stage), ("Pathologic", pathologic_stage)):
+            for problem in self.validate_tnm_codes(cancer_category, stage_text) + \
+                    self.validate_stage(cancer_category, tnm_values, stage_text):
+                problems.append(f"{label} stage: {problem}")
+        return problems
+
+    def check_groupings(self) -> List[str]:
+        """
+        Stage the TNM of every grouping row with its own stage: each alternative of a row
+        (ranges at their lower bound, "Any" axes at the first listed code) must pass
+        validate_tnm_codes and validate_stage.
+
+        Returns:
+            List[str]: Problems found, one per failing alternative
+        """
+        problems = []
+        for category in sorted(self.entries):
+            entry = self.entries.get(category) or {}
+            groupings = entry.get("Stage_Groupings")
+            if not isinstance(groupings, Mapping):
+                continue
+            tnm_table = entry.get("TNM") or {}
+            for stage_name, text in groupings.items():
+                if normalize_stage(stage_name)["code"] is None or not isinstance(text, str):
+                    continue
+                for alternative in re.split(r"\s+or\s+|;", text, flags=re.IGNORECASE):
+                    tnm = self._example_tnm(alternative, tnm_table)
+                    if tnm is None:
+                        continue
+                    stage_text = f"{stage_name} ({tnm})"
+                    for problem in self.validate_tnm_codes(category, tnm) + \
+                            self.validate_stage(category, tnm, stage_text):
+                        problems.append(f"{category}, {stage_name} ('{alternative.strip()}'): {problem}")
+        return problems
+
+    @staticmethod
+    def _example_tnm(alternative: str, tnm_table: Mapping) -> Optional[str]:
+        """
+        A TNM satisfying one grouping alternative, or None when an axis has no code to use.
+        """
+        codes = {}
+        for part in alternative.split(","):
+            parsed = _parse_condition(part)
+            if parsed is not None and parsed[1] is not None:
+                codes[parsed[0]] = parsed[0] + parsed[1][0]
+        for axis in ("T", "N", "M"):
+            if axis not in codes:
+                listed = [_strip_prefix(key) for key in (tnm_table.get(axis) or {})]
+                listed = [code for code in listed if not code.upper().endswith("X")]
+                if not listed:
+                    return None
+                codes[axis] = listed[0]
+        return f"{codes['T']} {codes['N']} {codes['M']}"
+
+    def reference(self, cancer_category: str) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """
+        The TNM categories and stage groupings of a category, for prompts.
+
+        Args:
+            cancer_category: AJCC category
+
+        Returns:
+            Tuple: (TNM table, stage groupings), empty when the category has none
+        """
+        entry = self.entries.get(cancer_category) or {}
+        return entry.get("TNM") or {}, entry.get("Stage_Groupings") or {}
@@ -0,0 +1,325 @@
+"""
+Compact staging results.
+
+StagingResult holds the eight outputs of the staging pipeline for one note.
+ResultRow is the output row of one note: it keeps a reference to the
+StagingResult plus the note name, extraction date, system and local
+classifier outputs. Display columns are derived when read instead of being
+copied into a per-note dict. These include "Extracted Stage" (the TNM values),
+"AI Stage", "Proceed with Staging" and the report without its signature
+block. Both classes use __slots__, so a large batch keeps a few small objects
+per note rather than a 13-key dict.
+
+A run stopped after an earlier stage (identify, analyze or calculate) gives
+partial rows: ResultRow then only has the columns of the stages that ran
+(STAGE_COLUMNS), and the pipeline's artifact store lets a later run finish the
+remaining stages.
+
+ResultRow is a read-only Mapping of the CSV columns. The writers (CSV,
+Parquet, results database) read it directly. dict(row) gives a plain dict
+where JSON is needed.
+
+RowSpool keeps the rows of a run for the final CSV and markdown files. Under a
+memory budget it moves them to a temporary JSONL file and reads them back as
+dicts when the files are written.
+"""
+
+import csv
+import json
+import tempfile
+from collections.abc import Mapping
+from typing import Any, Iterable, Iterator, List, Optional
+
+# Columns of every result row, in output order
+RESULT_COLUMNS = ("Medical Note", "Date of Extraction", "Disease", "Category", "System", "TNM Values",
+                  "Extracted Stage", "Clinical Stage", "Pathologic Stage", "AI Stage", "Proceed with Staging",
+                  "Explanation", "Report")
+
+# Columns only present when the local classifiers are configured
+OPTIONAL_COLUMNS = ("Triage Score", "Triage Decision", "Predicted Category", "Category Confidence")
+
+# Column of the criteria analysis, only output by runs stopped after the analyze or calculate stage
+CRITERIA_ANALYSIS_COLUMN = "Criteria Analysis"
+
+# Order of all columns a row can have
+_EXPLANATION_INDEX = RESULT_COLUMNS.index("Explanation")
+COLUMN_ORDER = (RESULT_COLUMNS[:_EXPLANATION_INDEX] + (CRITERIA_ANALYSIS_COLUMN,) + RESULT_COLUMNS[_EXPLANATION_INDEX:]
+                + OPTIONAL_COLUMNS)
+
+_IDENTIFY_COLUMNS = {"Medical Note", "Date of Extraction", "Disease", "Category", "System", "TNM Values",
+                     "Extracted Stage", "Proceed with Staging"}
+_STAGE_COLUMN_SETS = {
+    "identify": _IDENTIFY_COLUMNS,
+    "analyze": _IDENTIFY_COLUMNS | {CRITERIA_ANALYSIS_COLUMN},
+    "calculate": (set(RESULT_COLUMNS) - {"Report"}) | {CRITERIA_ANALYSIS_COLUMN},
+    "report": set(RESULT_COLUMNS)
+}
+
+# Columns of the rows of a run, by the last stage it runs (before the optional columns)
+STAGE_COLUMNS = {stage: tuple(column for column in COLUMN_ORDER if column in columns)
+                 for stage, columns in _STAGE_COLUMN_SETS.items()}
+
+# Value of the outputs of stages a partial run did not reach
+STAGE_NOT_RUN = "Not run"
+
+SIGNATURE_BLOCK_TEXT = ("This report is generated for inclusion in the patient's medical records and should be reviewed "
+                        "in conjunction with all other clinical information available for comprehensive care planning.")
+
+
+def trim_signature_block(report: str) -> str:
+    """
+    Remove the signature block the report agent appends to its reports.
+
+    Args:
+        report: The staging report
+
+    Returns:
+        str: The report up to the signature block
+    """
+    pos = report.find(SIGNATURE_BLOCK_TEXT)
+    return report[:pos].strip() if pos != -1 else report
+
+
+class StagingResult:
+    """
+    Outputs of the staging pipeline for one note.
+
+    Unpacks like the tuple the pipeline used to return: (cancer_type, cancer_category,
+    clinical_stage, pathologic_stage, tnm_values, explanation, report, proceed_with_staging).
+    The criteria analysis is only kept by partial runs and is not part of the tuple.
+    """
+
+    FIELDS = ("cancer_type", "cancer_category", "clinical_stage", "pathologic_stage", "tnm_values",
+              "explanation", "report", "proceed_with_staging")
+    __slots__ = FIELDS + ("criteria_analysis",)
+
+    def __init__(self, cancer_type: str, cancer_category: str, clinical_stage: str, pathologic_stage: str,
+                 tnm_values: str, explanation: str, report: str, proceed_with_staging: bool):
+        self.cancer_type = cancer_type
+        self.cancer_category = cancer_category
+        self.clinical_stage = clinical_stage
+        self.pathologic_stage = pathologic_stage
+        self.tnm_values = tnm_values
+        self.explanation = explanation
+        self.report = report
+        self.proceed_with_staging = proceed_with_staging
+        self.criteria_analysis: Optional[str] = None
+
+    @classmethod
+    def not_staged(cls, cancer_type: str, cancer_category: str, tnm_values: str, explanation: str,
+                   report: str) -> "StagingResult":
+        """
+        Result of a note that was not staged (skipped by triage, or a cancer outside the staging system).
+        """
+        return cls(cancer_type, cancer_category, "Not applicable", "Not applicable", tnm_values, explanation,
+                   report, False)
+
+    @classmethod
+    def partial(cls, cancer_type: str, cancer_category: str, tnm_values: str, criteria_analysis: Optional[str] = None,
+                clinical_stage: str = STAGE_NOT_RUN, pathologic_stage: str = STAGE_NOT_RUN,
+                explanation: str = STAGE_NOT_RUN) -> "StagingResult":
+        """
+        Result of a note whose run stopped before the report stage. Outputs of the
+        stages that did not run are STAGE_NOT_RUN.
+        """
+        result = cls(cancer_type, cancer_category, clinical_stage, pathologic_stage, tnm_values, explanation,
+                     STAGE_NOT_RUN, True)
+        result.criteria_analysis = criteria_analysis
+        return result
+
+    @property
+    def ai_stage(self) -> str:
+        return f"Clinical: {self.clinical_stage}, Pathologic: {self.pathologic_stage}"
+
+    def __iter__(self) -> Iterator[Any]:
+        return (getattr(self, name) for name in self.FIELDS)
+
+    def __len__(self) -> int:
+        return len(self.FIELDS)
+
+    def __getitem__(self, index):
+        return tuple(self)[index]
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (StagingResult, tuple)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS)
+        return f"StagingResult({fields})"
+
+
+class ResultRow(Mapping):
+    """
+    Output row of one note: a read-only mapping of the columns of the stages that ran
+    (STAGE_COLUMNS, and the optional classifier columns that are set) to values derived
+    from a StagingResult.
+    """
+
+    __slots__ = ("note_name", "extraction_date", "system", "result", "stop_after", "triage_score",
+                 "triage_decision", "predicted_category", "category_confidence")
+
+    def __init__(self, note_name: str, extraction_date: str, system: str, result: StagingResult,
+                 stop_after: str = "report", triage_score: Optional[float] = None,
+                 triage_decision: Optional[str] = None, predicted_category: Optional[str] = None,
+                 category_confidence: Optional[float] = None):
+        """
+        Args:
+            note_name: Name of the medical note
+            extraction_date: Date of extraction (YYYY-MM-DD)
+            system: Value of the "System" column
+            result: The note's staging result
+            stop_after: Last stage of the run (a key of STAGE_COLUMNS), which decides the columns
+            triage_score: Relevance score of the triage classifier, if configured
+            triage_decision: "Staged" or "Skipped", if the triage classifier is configured
+            predicted_category: Category of the local category classifier, if configured
+            category_confidence: Probability of the predicted category
+        """
+        self.note_name = note_name
+        self.extraction_date = extraction_date
+        self.system = system
+        self.result = result
+        self.stop_after = stop_after
+        self.triage_score = triage_score
+        self.triage_decision = triage_decision
+        self.predicted_category = predicted_category
+        self.category_confidence = category_confidence
+
+    def __getitem__(self, column: str) -> Any:
+        result = self.result
+        if (self.stop_after != "report" and column not in _STAGE_COLUMN_SETS[self.stop_after]
+                and column not in OPTIONAL_COLUMNS):
+            raise KeyError(column)
+        if column == "Medical Note":
+            return self.note_name
+        if column == "Date of Extraction":
+            return self.extraction_date
+        if column == "Disease":
+            return result.cancer_type
+        if column == "Category":
+            return result.cancer_category
+        if column == "System":
+            return self.system
+        if column in ("TNM Values", "Extracted Stage"):
+            # The stage extracted from the note is its TNM values
+            return result.tnm_values
+        if column == "Clinical Stage":
+            return result.clinical_stage
+        if column == "Pathologic Stage":
+            return result.pathologic_stage
+        if column == "AI Stage":
+            return result.ai_stage
+        if column == "Proceed with Staging":
+            return "Yes" if result.proceed_with_staging else "No"
+        if column == CRITERIA_ANALYSIS_COLUMN and self.stop_after in ("analyze", "calculate"):
+            return result.criteria_analysis or "Not applicable"
+        if column == "Explanation":
+            return result.explanation
+        if column == "Report":
+            return trim_signature_block(result.report)
+        if column == "Triage Score" and self.triage_score is not None:
+            return self.triage_score
+        if column == "Triage Decision" and self.triage_decision is not None:
+            return self.triage_decision
+        if column == "Predicted Category" and self.category_confidence is not None:
+            return self.predicted_category
+        if column == "Category Confidence" and self.category_confidence is not None:
+            return self.category_confidence
+        raise KeyError(column)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from STAGE_COLUMNS[self.stop_after]
+        if self.triage_score is not None:
+            yield from OPTIONAL_COLUMNS[:2]
+        if self.category_confidence is not None:
+            yield from OPTIONAL_COLUMNS[2:]
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"ResultRow({self.note_name!r}, {self.result!r})"
+
+
+def result_columns(rows: Iterable[Mapping]) -> List[str]:
+    """
+    Columns of a set of result rows: the columns any row has, in COLUMN_ORDER. Without
+    rows these are RESULT_COLUMNS.
+
+    Args:
+        rows: Result rows (ResultRow objects or dicts)
+
+    Returns:
+        List[str]: Column names in output order
+    """
+    present = set()
+    for row in rows:
+        present.update(row)
+    if not present:
+        return list(RESULT_COLUMNS)
+    return [column for column in COLUMN_ORDER if column in present]
+
+
+class RowSpool:
+    """
+    Result rows of a run in order, held in memory until spill() moves them to a temporary file.
+    """
+
+    def __init__(self):
+        self._rows: List[Mapping] = []
+        self._file = None
+        self._spilled = 0
+
+    def append(self, row: Mapping) -> None:
+        self._rows.append(row)
+
+    def spill(self) -> int:
+        """
+        Move the rows held in memory to the spill file.
+
+        Returns:
+            int: Number of rows spilled
+        """
+        if not self._rows:
+            return 0
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+        self._file.seek(0, 2)
+        for row in self._rows:
+            self._file.write(json.dumps(dict(row)) + "\n")
+        count = len(self._rows)
+        self._spilled += count
+        self._rows = []
+        return count
+
+    def __len__(self) -> int:
+        return self._spilled + len(self._rows)
+
+    def __iter__(self) -> Iterator[Mapping]:
+        # Spilled rows come back as dicts, before the rows still in memory
+        if self._file is not None:
+            self._file.flush()
+            self._file.seek(0)
+            for line in iter(self._file.readline, ''):
+                yield json.loads(line)
+        yield from self._rows
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def write_results_csv(rows: Iterable[Mapping], csv_output: str) -> None:
+    """
+    Write result rows to a CSV file, reading each value straight from its row.
+
+    Args:
+        rows: Result rows (ResultRow objects or dicts), in output order; iterated twice
+        csv_output: Path of the CSV file
+    """
+    with open(csv_output, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=result_columns(rows), lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(rows)
@@ -0,0 +1,383 @@
+"""
+Long-lived staging service with a local HTTP/JSON API.
+
+The service keeps one warm AdultCancerStaging instance (staging data, disease
+mappings and LLM client loaded once), queues submitted notes in an on-disk
+job table and processes them with a pool of worker threads. Jobs carry a
+priority class (urgent, normal, bulk) and an optional deadline, and some
+workers can be reserved for urgent jobs.
+
+Endpoints:
+    POST /jobs                 {"note_id": "...", "text": "...", "priority": "urgent",
+                                "deadline_minutes": 60} -> job (409 when the note_id
+                                was submitted with different text)
+    GET  /jobs/<job_id>        job status and, once done, the result row
+    GET  /jobs/<job_id>?wait=N long-poll up to N seconds for the job to finish
+    GET  /jobs/<job_id>/events newline-delimited JSON status events until the job finishes
+    GET  /health               job counts and per-class queue depth and wait times
+    GET  /metrics              Prometheus-style metrics (notes, LLM calls, tokens, errors)
+"""
+
+import json
+import time
+import uuid
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional
+from urllib.parse import urlparse, parse_qs
+
+from .adult_staging_module import AdultCancerStaging
+from .work_queue import WorkQueue, LeaseKeeper, NoteConflictError, default_worker_id
+from .scheduler import SchedulingPolicy, DEFAULT_PRIORITY_CLASS, priority_rank, deadline_from_now
+from .metrics import get_metrics
+from .run_logging import get_logger, note_context
+
+logger = get_logger("service")
+
+TERMINAL_STATUSES = ("done", "failed")
+
+
+class StagingService:
+    """
+    Wraps a warm staging module with an on-disk job table and a worker pool.
+    """
+
+    def __init__(self, staging_module: AdultCancerStaging, db_path: str, num_workers: int = 4,
+                 lease_seconds: float = 900.0, reserved_urgent_workers: int = 0):
+        """
+        Initialize the service.
+
+        Args:
+            staging_module: The staging module shared by all workers
+            db_path: Path to the SQLite job table
+            num_workers: Number of worker threads processing jobs concurrently
+            lease_seconds: How long a worker holds a job before it is handed to another worker
+            reserved_urgent_workers: Number of workers that only take urgent jobs
+        """
+        self.staging_module = staging_module
+        self.db_path = db_path
+        self.num_workers = num_workers
+        self.lease_seconds = lease_seconds
+        self.policy = SchedulingPolicy(num_workers, reserved_urgent_workers)
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._job_available = threading.Event()
+        self._job_finished = threading.Condition()
+        self._workers = []
+
+    def _queue(self) -> WorkQueue:
+        """
+        Return the job table connection of the calling thread.
+
+        Returns:
+            WorkQueue: A connection owned by the current thread
+        """
+        queue = getattr(self._local, "queue", None)
+        if queue is None:
+            queue = WorkQueue(self.db_path)
+            self._local.queue = queue
+        return queue
+
+    def start(self) -> None:
+        """
+        Start the worker threads. Jobs left over from a previous run are
+        picked up as soon as their leases expire.
+        """
+        base_id = default_worker_id()
+        for index in range(self.num_workers):
+            worker = threading.Thread(
+                target=self._worker_loop,
+                args=(f"{base_id}-t{index}", self.policy.classes_for_worker(index)),
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+        self._job_available.set()
+
+    def stop(self) -> None:
+        """
+        Ask the worker threads to stop after their current job.
+        """
+        self._stop.set()
+        self._job_available.set()
+
+    def submit(self, note_text: str, note_id: Optional[str] = None, priority_class: str = DEFAULT_PRIORITY_CLASS,
+               deadline_minutes: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Queue a note for staging.
+
+        Args:
+            note_text: The medical note content
+            note_id: Optional client identifier; resubmitting it with the same text returns the existing job
+            priority_class: Priority class of the job (urgent, normal or bulk)
+            deadline_minutes: Optional deadline in minutes from now
+
+        Returns:
+            Dict: The job description
+
+        Raises:
+            NoteConflictError: If the note ID was submitted before with different text
+        """
+        item = self._queue().submit(note_id or uuid.uuid4().hex, note_text, priority_class=priority_class,
+                                    deadline=deadline_from_now(deadline_minutes))
+        self._job_available.set()
+        return self._describe(item)
+
+    def get_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Look up a job.
+
+        Args:
+            job_id: The job identifier returned by submit
+
+        Returns:
+            Dict: The job description, or None if the job does not exist
+        """
+        item = self._queue().get(job_id)
+        return self._describe(item) if item else None
+
+    def wait_for_job(self, job_id: int, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Wait until a job finishes or the timeout expires.
+
+        Args:
+            job_id: The job identifier
+            timeout: Maximum number of seconds to wait
+
+        Returns:
+            Dict: The latest job description, or None if the job does not exist
+        """
+        deadline = time.monotonic() + timeout
+        job = self.get_job(job_id)
+        while job is not None and job["status"] not in TERMINAL_STATUSES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            with self._job_finished:
+                # Jobs finished by another service process are noticed on the next poll
+                self._job_finished.wait(min(remaining, 1.0))
+            job = self.get_job(job_id)
+        return job
+
+    def health(self) -> Dict[str, Any]:
+        """
+        Summarize the state of the service.
+
+        Returns:
+            Dict: Worker count, job counts by status and per-class queue metrics
+        """
+        queue = self._queue()
+        return {
+            "status": "ok",
+            "workers": self.num_workers,
+            "reserved_urgent_workers": self.policy.reserved_urgent_workers,
+            "jobs": queue.status_counts(),
+            "classes": queue.class_metrics()
+        }
+
+    @staticmethod
+    def _describe(item: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Convert a work item into the JSON job description returned to clients.
+
+        Args:
+            item: The work item from the job table
+
+        Returns:
+            Dict: The job description
+        """
+        return {
+            "job_id": item["seq"],
+            "note_id": item["note_id"],
+            "status": item["status"],
+            "priority": item["priority_class"],
+            "deadline": item["deadline"],
+            "attempts": item["attempts"],
+            "error": item["error"],
+            "result": json.loads(item["result"]) if item.get("result") else None
+        }
+
+    def _worker_loop(self, worker_id: str, priority_classes: Optional[list]) -> None:
+        """
+        Claim and process jobs until the service stops.
+
+        Args:
+            worker_id: Identifier of this worker thread
+            priority_classes: Classes this worker may claim (None for any class)
+        """
+        queue = self._queue()
+        while not self._stop.is_set():
+            # Clear before claiming so a submit that races with the claim still wakes this worker
+            self._job_available.clear()
+            item = queue.claim(worker_id, lease_seconds=self.lease_seconds, priority_classes=priority_classes)
+            if item is None:
+                self._job_available.wait(1.0)
+                continue
+
+            # The lease is renewed while the job is staged, so a slow job is not handed to a second worker
+            error = None
+            with LeaseKeeper(queue, item["seq"], worker_id, self.lease_seconds) as lease:
+                try:
+                    prediction = self.staging_module.classify_notes([item["note_text"]])[0]
+                    result = self.staging_module.process_note_text(item["note_text"], note_id=item["note_id"],
+                                                                   prediction=prediction)
+                    extraction_date = datetime.datetime.now().strftime("%Y-%m-%d")
+                    row = self.staging_module._build_result_row(item["note_id"], extraction_date, result, prediction,
+                                                                item["note_text"])
+                except Exception as e:
+                    error = e
+
+            if error is not None:
+                with note_context(note_id=item["note_id"]):
+                    logger.error(f"[{worker_id}] Error processing job {item['seq']}: {error}", extra={"job_id": item["seq"]})
+                queue.fail(item["seq"], worker_id, str(error))
+                get_metrics().inc("staging_notes_total", status="failed")
+            elif lease.lost or not queue.complete(item["seq"], worker_id, result=dict(row)):
+                with note_context(note_id=item["note_id"]):
+                    logger.warning(f"[{worker_id}] Lost the lease of job {item['seq']} to another worker; "
+                                   f"its result is not counted", extra={"job_id": item["seq"]})
+            else:
+                get_metrics().inc("staging_notes_total", status="done")
+
+            with self._job_finished:
+                self._job_finished.notify_all()
+
+    def serve_forever(self, host: str = "127.0.0.1", port: int = 8765) -> None:
+        """
+        Start the workers and serve the HTTP API until interrupted.
+
+        Args:
+            host: Interface to bind (local only by default)
+            port: TCP port to listen on
+        """
+        self.start()
+        server = ThreadingHTTPServer((host, port), _make_handler(self))
+        print(f"Staging service listening on http://{host}:{port} with {self.num_workers} workers")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("Shutting down staging service")
+        finally:
+            server.server_close()
+            self.stop()
+
+
+def _make_handler(service: StagingService):
+    """
+    Build the request handler class bound to a service instance.
+    """
+
+    class StagingRequestHandler(BaseHTTPRequestHandler):
+
+        def log_message(self, format, *args):
+            # Keep the console for worker output; request logging is not needed
+            pass
+
+        def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _job_id(self, part: str) -> Optional[int]:
+            try:
+                return int(part)
+            except ValueError:
+                return None
+
+        def do_POST(self):
+            if urlparse(self.path).path.rstrip("/") != "/jobs":
+                self._send_json(404, {"error": "Not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except (ValueError, json.JSONDecodeError):
+                self._send_json(400, {"error": "Request body must be JSON"})
+                return
+            if not isinstance(payload, dict) or not isinstance(payload.get("text"), str) or not payload["text"].strip():
+                self._send_json(400, {"error": "Field 'text' with the note content is required"})
+                return
+            note_id = payload.get("note_id")
+            priority_class = payload.get("priority", DEFAULT_PRIORITY_CLASS)
+            deadline_minutes = payload.get("deadline_minutes")
+            try:
+                priority_rank(priority_class)
+                if deadline_minutes is not None:
+                    deadline_minutes = float(deadline_minutes)
+            except (TypeError, ValueError) as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            try:
+                job = service.submit(payload["text"], note_id=str(note_id) if note_id is not None else None,
+                                     priority_class=priority_class, deadline_minutes=deadline_minutes)
+            except NoteConflictError as e:
+                # An amended note needs a new note_id; the existing job keeps its result
+                self._send_json(409, {"error": str(e), "job": service._describe(e.item)})
+                return
+            self._send_json(202, job)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [part for part in url.path.split("/") if part]
+
+            if parts == ["health"]:
+                self._send_json(200, service.health())
+                return
+
+            if parts == ["metrics"]:
+                body = get_metrics().render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            if len(parts) in (2, 3) and parts[0] == "jobs":
+                job_id = self._job_id(parts[1])
+                job = service.get_job(job_id) if job_id is not None else None
+                if job is None:
+                    self._send_json(404, {"error": "Job not found"})
+                    return
+
+                if len(parts) == 3 and parts[2] == "events":
+                    self._stream_events(job)
+                    return
+                if len(parts) == 2:
+                    wait = parse_qs(url.query).get("wait")
+                    if wait:
+                        try:
+                            job = service.wait_for_job(job_id, timeout=min(float(wait[0]), 300.0))
+                        except ValueError:
+                            self._send_json(400, {"error": "'wait' must be a number of seconds"})
+                            return
+                    self._send_json(200, job)
+                    return
+
+            self._send_json(404, {"error": "Not found"})
+
+        def _stream_events(self, job: Dict[str, Any]) -> None:
+            # Stream one JSON line per status change; the connection closes when the job finishes
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            last_status = None
+            try:
+                while True:
+                    if job["status"] != last_status:
+                        self.wfile.write((json.dumps(job) + "\n").encode("utf-8"))
+                        self.wfile.flush()
+                        last_status = job["status"]
+                    if job["status"] in TERMINAL_STATUSES:
+                        break
+                    job = service.wait_for_job(job["job_id"], timeout=15.0)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stopped listening; the job keeps running
+                pass
+
+    return StagingRequestHandler
@@ -0,0 +1,355 @@
+"""
+Registry of staging systems (AJCC 8th Edition for adults, Toronto guidelines
+for children) and routing of notes between them.
+
+Each system's JSON source is compiled on first use into a binary table. The
+table holds a JSON index of categories followed by one JSON blob per
+category. It is stored under a name that includes the hash of the source and
+is opened through a read-only memory map. Worker processes on the same host
+therefore share one copy of the pages, and a category is only decoded when a
+note needs it. Compilation writes to a temporary file and renames it, so
+concurrent workers may compile the same system safely.
+"""
+
+import os
+import re
+import json
+import mmap
+import struct
+import hashlib
+import tempfile
+import threading
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from .metrics import get_metrics
+
+SYSTEM_AJCC8 = "ajcc8"
+SYSTEM_TORONTO = "toronto"
+
+POPULATION_ADULT = "adult"
+POPULATION_PEDIATRIC = "pediatric"
+
+# Patients younger than this are staged with the pediatric system
+PEDIATRIC_AGE_LIMIT = 18
+
+_TABLE_MAGIC = b"STG1"
+
+
+@dataclass(frozen=True)
+class StagingSystemSpec:
+    """
+    Description of a staging system.
+    """
+
+    name: str
+    # Value of the "System" output column
+    label: str
+    # Name used in prompts and messages
+    title: str
+    # Prefix of agent roles
+    short_name: str
+    population: str
+    # Category of cancers the system does not cover
+    not_stageable: str
+
+
+STAGING_SYSTEMS: Dict[str, StagingSystemSpec] = {
+    SYSTEM_AJCC8: StagingSystemSpec(SYSTEM_AJCC8, "AJCC8 system", "AJCC 8th Edition", "AJCC",
+                                    POPULATION_ADULT, "Not in AJCC 8th Edition"),
+    SYSTEM_TORONTO: StagingSystemSpec(SYSTEM_TORONTO, "Toronto pediatric system", "Toronto childhood cancer staging guidelines",
+                                      "Toronto", POPULATION_PEDIATRIC, "Not in Toronto staging guidelines")
+}
+
+
+def fix_json_syntax(content: str) -> str:
+    """
+    Fix common JSON syntax errors in hand-edited staging data: unquoted TNM keys,
+    trailing commas and closing brackets that do not match their opening bracket.
+
+    Args:
+        content: JSON content with potential syntax errors
+
+    Returns:
+        str: Fixed JSON content
+    """
+    # Property keys must be doublequoted
+    content = content.replace("{ N:", '{ "N":')
+    content = content.replace("{ M:", '{ "M":')
+    content = content.replace("{ T:", '{ "T":')
+
+    # Remove trailing commas before closing brackets
+    content = re.sub(r",(\s*[}\]])", r"\1", content)
+
+    # Replace closing brackets that do not match the innermost open bracket
+    closing = {"{": "}", "[": "]"}
+    fixed = []
+    stack = []
+    in_string = escaped = False
+    for char in content:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in closing:
+            stack.append(char)
+        elif char in "}]" and stack:
+            char = closing[stack.pop()]
+        fixed.append(char)
+    return "".join(fixed)
+
+
+def load_staging_json(source_path: str) -> Any:
+    """
+    Load a staging data JSON file, fixing common syntax errors when it does not parse.
+
+    Args:
+        source_path: Path to the JSON file
+
+    Returns:
+        Any: The parsed data
+    """
+    with open(source_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError as e:
+        print(f"JSON decode error in {source_path}: {e}")
+        return json.loads(fix_json_syntax(content))
+
+
+def _normalize_entries(data: Any) -> Dict[str, Dict[str, Any]]:
+    """
+    Staging entries by category name, from a list of {"name", ...} entries (AJCC8.json)
+    or a mapping of category name to entry (Toronto).
+    """
+    if isinstance(data, list):
+        return {item["name"]: item for item in data if isinstance(item, dict) and "name" in item}
+    if isinstance(data, dict):
+        return {name: {"name": name, **entry} if isinstance(entry, dict) else {"name": name, "value": entry}
+                for name, entry in data.items()}
+    raise ValueError(f"Unsupported staging data: expected a list or an object, got {type(data).__name__}")
+
+
+def compile_staging_system(name: str, source_path: str, cache_dir: str) -> str:
+    """
+    Compile a staging data JSON file into a memory-mappable table, unless it is already compiled.
+
+    Args:
+        name: Staging system name
+        source_path: Path to the JSON source
+        cache_dir: Directory of compiled tables
+
+    Returns:
+        str: Path to the compiled table
+    """
+    with open(source_path, 'rb') as f:
+        source_hash = hashlib.sha256(f.read()).hexdigest()
+    table_path = os.path.join(cache_dir, f"{name}-{source_hash[:16]}.stg")
+    if os.path.exists(table_path):
+        return table_path
+
+    entries = _normalize_entries(load_staging_json(source_path))
+    blobs, index, offset = [], {}, 0
+    for category, entry in entries.items():
+        blob = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        index[category] = [offset, len(blob)]
+        blobs.append(blob)
+        offset += len(blob)
+    header = json.dumps({"system": name, "source": os.path.abspath(source_path), "source_hash": source_hash,
+                         "categories": index}, ensure_ascii=False).encode("utf-8")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=f".{name}-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_TABLE_MAGIC + struct.pack("<I", len(header)) + header)
+            for blob in blobs:
+                f.write(blob)
+        os.replace(tmp_path, table_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    get_metrics().inc("staging_system_compilations_total", system=name)
+    return table_path
+
+
+class StagingSystem(Mapping):
+    """
+    Read-only mapping of category name to staging entry, backed by a memory-mapped compiled table.
+    """
+
+    def __init__(self, spec: StagingSystemSpec, table_path: str):
+        """
+        Open a compiled table.
+
+        Args:
+            spec: The staging system
+            table_path: Path to the table written by compile_staging_system
+        """
+        self.spec = spec
+        self.table_path = table_path
+        with open(table_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:4] != _TABLE_MAGIC:
+            raise ValueError(f"{table_path} is not a compiled staging table")
+        (header_length,) = struct.unpack_from("<I", self._mm, 4)
+        self._data_start = 8 + header_length
+        header = json.loads(self._mm[8:self._data_start].decode("utf-8"))
+        self.source_hash = header["source_hash"]
+        self._index: Dict[str, List[int]] = header["categories"]
+        self._decoded: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def categories(self) -> List[str]:
+        return list(self._index)
+
+    def __getitem__(self, category: str) -> Dict[str, Any]:
+        entry = self._decoded.get(category)
+        if entry is None:
+            offset, length = self._index[category]
+            start = self._data_start + offset
+            entry = self._decoded[category] = json.loads(self._mm[start:start + length].decode("utf-8"))
+        return entry
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, category: object) -> bool:
+        return category in self._index
+
+
+class StagingSystemRegistry:
+    """
+    Staging systems by name, compiled and opened on first use.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        """
+        Args:
+            cache_dir: Directory of compiled tables (defaults to a directory in the system
+                temporary directory, shared by the processes of a host)
+        """
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "cancer_staging_systems")
+        self._lock = threading.Lock()
+        self._sources: Dict[str, str] = {}
+        self._systems: Dict[str, StagingSystem] = {}
+
+    def register(self, name: str, source_path: str) -> None:
+        """
+        Register the JSON source of a staging system (a different source replaces the loaded system).
+
+        Args:
+            name: A key of STAGING_SYSTEMS
+            source_path: Path to the staging data JSON file
+        """
+        if name not in STAGING_SYSTEMS:
+            raise ValueError(f"Unknown staging system '{name}' (known: {', '.join(STAGING_SYSTEMS)})")
+        with self._lock:
+            if self._sources.get(name) != source_path:
+                self._sources[name] = source_path
+                self._systems.pop(name, None)
+
+    def get(self, name: str) -> StagingSystem:
+        """
+        The staging system of a name, compiling and opening it on first use.
+
+        Args:
+            name: A registered staging system
+
+        Returns:
+            StagingSystem: The read-only staging tables
+        """
+        with self._lock:
+            system = self._systems.get(name)
+            if system is None:
+                if name not in self._sources:
+                    raise ValueError(f"Staging system '{name}' has no registered data file")
+                table_path = compile_staging_system(name, self._sources[name], self.cache_dir)
+                system = self._systems[name] = StagingSystem(STAGING_SYSTEMS[name], table_path)
+            return system
+
+
+_registry = StagingSystemRegistry()
+
+
+def get_staging_registry() -> StagingSystemRegistry:
+    """
+    The process-wide staging system registry.
+    """
+    return _registry
+
+
+# An age: "45-year-old", "3 months old boy", "12 yo", "age: 45", "aged 7", "age of 12"
+_AGE_PATTERN = re.compile(
+    r"\b(?P<value>\d{1,3})[- ]?(?P<unit>years?|yrs?|months?|weeks?|days?)[- ]old\b(?:[- ]+(?P<word>[a-z]+))?"
+    r"|\b(?P<yo>\d{1,3})\s?(?:y/?o|yo)\b"
+    r"|\bage[d:]?\s*(?:of\s+)?(?P<age>\d{1,3})(?:\s*(?P<age_unit>years?|months?|weeks?|days?))?\b",
+    re.IGNORECASE
+)
+# Words after "N months/weeks/days old" showing the age is the patient's, not a lesion's
+_PATIENT_WORDS = {"male", "female", "boy", "girl", "infant", "baby", "patient", "child", "neonate", "newborn",
+                  "toddler", "son", "daughter", "twin", "with", "who", "presenting", "presents", "admitted", "referred"}
+# Ages of past events: "at age 12", "since the age of 5", "when she was 12 years old"
+_PAST_AGE_PREFIX = re.compile(r"\b(?:at|since|from|until|by|before|after|was|were)\s+(?:the\s+)?(?:an?\s+)?$",
+                              re.IGNORECASE)
+_CURRENT_AGE_PREFIX = re.compile(r"\b(?:now|currently|presently|today)\b[^.;\n]{0,20}$", re.IGNORECASE)
+# Terms describing the patient (not history such as "childhood asthma" or "as a child")
+_PEDIATRIC_TERMS = re.compile(
+    r"\b(pediatric|paediatric|infant|toddler|neonat\w*|newborn|adolescent)\b", re.IGNORECASE
+)
+
+
+def _patient_ages(note_text: str) -> List[Tuple[int, bool]]:
+    """
+    Stated ages of the patient, in years (0 for ages in months, weeks or days), with
+    whether each is marked as the current age ("now 45 years old"). Ages of past events
+    and of lesions ("a 2 week old lump") are left out.
+    """
+    ages = []
+    for match in _AGE_PATTERN.finditer(note_text):
+        before = note_text[max(0, match.start() - 40):match.start()]
+        if _PAST_AGE_PREFIX.search(before):
+            continue
+        unit = (match.group("unit") or match.group("age_unit") or "years").lower()
+        in_years = unit.startswith(("year", "yr"))
+        if match.group("unit") and not in_years and (match.group("word") or "").lower() not in _PATIENT_WORDS:
+            continue
+        value = int(match.group("value") or match.group("yo") or match.group("age"))
+        ages.append((value if in_years else 0, bool(_CURRENT_AGE_PREFIX.search(before))))
+    return ages
+
+
+def route_population(note_text: str) -> str:
+    """
+    Decide whether a note should be staged with the adult or the pediatric system.
+
+    The patient's age decides: an age marked as current ("now 45 years old") if any,
+    otherwise the first stated age. Ages of past events ("at age 12") and ages not
+    tied to the patient ("a 2 week old lump") are ignored. Younger than
+    PEDIATRIC_AGE_LIMIT years, or an age in months, weeks or days, is pediatric.
+    Without an age, terms describing the patient such as "infant" or "pediatric"
+    route the note to the pediatric system.
+
+    Args:
+        note_text: The medical note content
+
+    Returns:
+        str: POPULATION_ADULT or POPULATION_PEDIATRIC
+    """
+    note_text = note_text or ""
+    ages = _patient_ages(note_text)
+    if ages:
+        age = next((years for years, current in ages if current), ages[0][0])
+        return POPULATION_PEDIATRIC if age < PEDIATRIC_AGE_LIMIT else POPULATION_ADULT
+    return POPULATION_PEDIATRIC if _PEDIATRIC_TERMS.search(note_text) else POPULATION_ADULT
@@ -0,0 +1,83 @@
+"""
+Helpers for parsing TNM notation such as "cT3N1M0" or "pT2, pN1a, cM0",
+and stage text such as "Stage IIIB".
+"""
+
+import re
+from typing import Dict, Optional
+
+# A prefix (c, p, y, r, a and combinations such as yp) followed by the category code.
+# The code must not run into further lowercase letters or digits ("T2ish" is not a T category).
+_TNM_PATTERNS = {
+    "T": re.compile(r"(?<![A-Za-z])(?P<prefix>[ycpra]{0,2})(?P<code>T(?:X|is|0|[1-4](?:mi|[a-d]\d?)?))(?![a-z0-9])"),
+    "N": re.compile(r"(?<![A-Za-z])(?P<prefix>[ycpra]{0,2})(?P<code>N(?:X|0|[1-3](?:mi|[a-c])?))(?![a-z0-9])"),
+    "M": re.compile(r"(?<![A-Za-z])(?P<prefix>[ycpra]{0,2})(?P<code>M(?:X|0|1[a-d]?))(?![a-z0-9])")
+}
+
+
+def split_tnm(tnm_text: Optional[str]) -> Dict[str, Optional[str]]:
+    """
+    Extract the first T, N and M categories from free-text TNM notation.
+
+    Args:
+        tnm_text: Text such as "cT3N1M0", "pT2 pN1a M0" or "Not provided"
+
+    Returns:
+        Dict: {"T": code, "N": code, "M": code, "prefix": prefix}; codes are None when absent
+    """
+    result = {"T": None, "N": None, "M": None, "prefix": None}
+    if not tnm_text:
+        return result
+
+    for category, pattern in _TNM_PATTERNS.items():
+        match = pattern.search(tnm_text)
+        if match:
+            result[category] = match.group("code")
+            if result["prefix"] is None and match.group("prefix"):
+                result["prefix"] = match.group("prefix")
+    return result
+
+
+# A T category followed closely by N (and optionally M), e.g. "cT3N1M0" or "pT2, pN1a, cM0"
+_TNM_EXPRESSION = re.compile(
+    r"(?<![A-Za-z])[ycpra]{0,2}T(?:X|is|0|[1-4](?:mi|[a-d]\d?)?)[\s,/]*"
+    r"[ycpra]{0,2}N(?:X|0|[1-3](?:mi|[a-c])?)(?:[\s,/]*[ycpra]{0,2}M(?:X|0|1[a-d]?))?(?![a-z0-9])"
+)
+
+
+def find_tnm(note_text: Optional[str]) -> Optional[str]:
+    """
+    Find the first TNM expression in a note.
+
+    Only a T category directly followed by an N category counts, so stray
+    tokens such as "T1-weighted" are not mistaken for staging.
+
+    Args:
+        note_text: Free text of a medical note
+
+    Returns:
+        Optional[str]: The TNM expression as written (e.g. "cT3N1M0"), or None
+    """
+    match = _TNM_EXPRESSION.search(note_text or "")
+    return match.group(0).strip(" ,/") if match else None
+
+
+_STAGE_PATTERN = re.compile(r"\bstage\s*(?P<group>IV|III|II|I|0)(?P<sub>[A-C]\d?)?(?![A-Za-z])", re.IGNORECASE)
+
+
+def normalize_stage(stage_text: Optional[str]) -> Dict[str, Optional[str]]:
+    """
+    Extract the stage code and its stage group from free-text stage output.
+
+    Args:
+        stage_text: Text such as "Stage IIIB", "Stage IVA (T4a N2 M0)" or "Insufficient information"
+
+    Returns:
+        Dict: {"code": e.g. "IIIB", "group": e.g. "III"}; both None when no stage is found
+    """
+    match = _STAGE_PATTERN.search(stage_text or "")
+    if not match:
+        return {"code": None, "group": None}
+    group = match.group("group").upper()
+    sub = (match.group("sub") or "").upper()
+    return {"code": group + sub, "group": group}
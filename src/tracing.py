@@ -0,0 +1,193 @@
+"""
+Lightweight hierarchical tracing for staging runs.
+
+Spans are nested through a context variable, carry the note ID of the root
+span they belong to, and are streamed to a file in the Chrome Trace Event
+format, which Perfetto (https://ui.perfetto.dev) and chrome://tracing open
+directly. When tracing is turned off, span() returns a shared no-op object,
+so instrumented code pays only a function call and an attribute check.
+"""
+
+import os
+import json
+import time
+import random
+import threading
+import contextvars
+from typing import Dict, Any, Optional
+
+
+class _NoopSpan:
+    """
+    Span returned while tracing is disabled.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+# (span_id, note_id) of the innermost open span in the current thread or task
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    A timed, named unit of work with a parent span and attributes.
+    """
+
+    __slots__ = ("tracer", "name", "span_id", "parent_id", "note_id", "attributes", "start_ns", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.attributes = attributes
+        self.start_ns = 0
+        self._token = None
+        parent = _current_span.get()
+        self.parent_id = parent[0] if parent else None
+        self.note_id = attributes.get("note_id") or (parent[1] if parent else None)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """
+        Attach an attribute to the span.
+
+        Args:
+            key: Attribute name
+            value: JSON-serializable value
+        """
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self._token = _current_span.set((self.span_id, self.note_id))
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end_ns = time.perf_counter_ns()
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer._record(self, end_ns)
+        return False
+
+
+class Tracer:
+    """
+    Collects spans and streams them to a Chrome Trace Event JSON file.
+    """
+
+    def __init__(self, output_path: Optional[str] = None):
+        """
+        Initialize the tracer.
+
+        Args:
+            output_path: Path of the trace file; tracing is disabled when None
+        """
+        self.enabled = output_path is not None
+        self.output_path = output_path
+        self._lock = threading.Lock()
+        self._file = None
+        self._first_event = True
+        # Trace timestamps are relative to the tracer start, in microseconds
+        self._origin_ns = time.perf_counter_ns()
+        self._pid = os.getpid()
+        if self.enabled:
+            output_dir = os.path.dirname(output_path)
+            if output_dir and not os.path.exists(output_dir):
+                os.makedirs(output_dir, exist_ok=True)
+            self._file = open(output_path, 'w', encoding='utf-8')
+            self._file.write('{"displayTimeUnit": "ms", "traceEvents": [\n')
+
+    def span(self, name: str, **attributes):
+        """
+        Open a span as a context manager.
+
+        Args:
+            name: Span name, e.g. "kickoff:identify"
+            **attributes: Span attributes; pass note_id on the root span of a note
+
+        Returns:
+            Span: The span (a shared no-op object when tracing is disabled)
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def _record(self, span: Span, end_ns: int) -> None:
+        """
+        Write a finished span as a complete ("X") trace event.
+        """
+        args = dict(span.attributes)
+        args["span_id"] = span.span_id
+        if span.parent_id:
+            args["parent_id"] = span.parent_id
+        if span.note_id:
+            args["note_id"] = span.note_id
+        event = {
+            "name": span.name,
+            "cat": span.name.split(":", 1)[0],
+            "ph": "X",
+            "ts": (span.start_ns - self._origin_ns) / 1000.0,
+            "dur": (end_ns - span.start_ns) / 1000.0,
+            "pid": self._pid,
+            "tid": threading.get_ident(),
+            "args": args
+        }
+        line = json.dumps(event, default=str)
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line if self._first_event else ",\n" + line)
+            self._first_event = False
+            self._file.flush()
+
+    def close(self) -> None:
+        """
+        Finish the trace file.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.write("\n]}\n")
+                self._file.close()
+                self._file = None
+                print(f"Trace saved to: {self.output_path}")
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """
+    Return the process-wide tracer.
+
+    Returns:
+        Tracer: The configured tracer (disabled unless configure_tracing was called)
+    """
+    return _tracer
+
+
+def configure_tracing(output_path: Optional[str]) -> Tracer:
+    """
+    Replace the process-wide tracer.
+
+    Args:
+        output_path: Path of the trace file, or None to disable tracing
+
+    Returns:
+        Tracer: The new tracer
+    """
+    global _tracer
+    _tracer.close()
+    _tracer = Tracer(output_path)
+    return _tracer
@@ -0,0 +1,465 @@
+"""
+SQLite-backed work table shared by staging worker processes.
+
+Workers on one host or several hosts that share a filesystem claim notes
+through time-limited leases, so a note held by a crashed worker becomes
+claimable again once its lease expires.
+"""
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+from typing import Dict, Any, List, Optional
+
+from .scheduler import PRIORITY_CLASSES, DEFAULT_PRIORITY_CLASS, priority_rank
+from .results_store import content_hash
+
+
+class NoteConflictError(ValueError):
+    """
+    Raised when a note ID is submitted again with different content.
+    """
+
+    def __init__(self, message: str, item: Dict[str, Any]):
+        super().__init__(message)
+        self.item = item
+
+
+class WorkQueue:
+    """
+    A work table of medical notes stored in a single SQLite file.
+
+    Every note is enqueued with a sequence number that records the order of
+    a serial run, so partial outputs can be merged back into that order.
+    Claims follow priority class, then deadline, then sequence number.
+    """
+
+    def __init__(self, db_path: str, timeout: float = 60.0):
+        """
+        Open (and create if needed) the work table.
+
+        Args:
+            db_path: Path to the SQLite database file
+            timeout: Seconds to wait for a lock held by another worker
+        """
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+        # Autocommit mode; write transactions are opened explicitly with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._create_schema()
+
+    def _create_schema(self) -> None:
+        """
+        Create the work table and the run metadata table if they do not exist.
+        """
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS work_items (
+                seq INTEGER PRIMARY KEY,
+                note_id TEXT NOT NULL UNIQUE,
+                note_path TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker_id TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                enqueued_at REAL NOT NULL,
+                finished_at REAL,
+                note_text TEXT,
+                result TEXT,
+                priority_class TEXT NOT NULL DEFAULT 'normal',
+                priority INTEGER NOT NULL DEFAULT 1,
+                deadline REAL,
+                started_at REAL,
+                note_hash TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_work_items_status ON work_items (status, lease_expires);
+            CREATE TABLE IF NOT EXISTS run_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        self._ensure_columns({
+            "note_text": "TEXT",
+            "result": "TEXT",
+            "priority_class": "TEXT NOT NULL DEFAULT 'normal'",
+            "priority": "INTEGER NOT NULL DEFAULT 1",
+            "deadline": "REAL",
+            "started_at": "REAL",
+            "note_hash": "TEXT"
+        })
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_work_items_priority ON work_items (status, priority, deadline, seq)")
+
+    def _ensure_columns(self, columns: Dict[str, str]) -> None:
+        """
+        Add columns missing from a work table created by an older version.
+
+        Args:
+            columns: Mapping of column name to SQL type
+        """
+        existing = {row["name"] for row in self.conn.execute("PRAGMA table_info(work_items)")}
+        for name, sql_type in columns.items():
+            if name not in existing:
+                self.conn.execute(f"ALTER TABLE work_items ADD COLUMN {name} {sql_type}")
+
+    def close(self) -> None:
+        """
+        Close the database connection.
+        """
+        self.conn.close()
+
+    def set_meta(self, key: str, value: Any) -> None:
+        """
+        Store a run-level setting (kept only if the key is not already set).
+
+        Args:
+            key: Setting name
+            value: JSON-serializable value
+        """
+        self.conn.execute("INSERT OR IGNORE INTO run_meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def get_meta(self, key: str, default: Any = None) -> Any:
+        """
+        Read a run-level setting.
+
+        Args:
+            key: Setting name
+            default: Value returned when the setting is missing
+
+        Returns:
+            Any: The stored value or the default
+        """
+        row = self.conn.execute("SELECT value FROM run_meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row["value"]) if row else default
+
+    def enqueue(self, note_id: str, note_path: Optional[str] = None,
+                priority_class: str = DEFAULT_PRIORITY_CLASS, deadline: Optional[float] = None) -> bool:
+        """
+        Add a note to the work table. Notes that are already queued are skipped,
+        which makes enqueueing the same directory from several hosts safe.
+
+        Args:
+            note_id: Unique identifier of the note (the note file name)
+            note_path: Path to the note file
+            priority_class: Priority class of the note (urgent, normal or bulk)
+            deadline: Optional Unix timestamp by which the note should be staged
+
+        Returns:
+            bool: True if the note was added, False if it was already queued
+        """
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO work_items (note_id, note_path, enqueued_at, priority_class, priority, deadline) VALUES (?, ?, ?, ?, ?, ?)",
+            (note_id, note_path, time.time(), priority_class, priority_rank(priority_class), deadline)
+        )
+        return cursor.rowcount == 1
+
+    def submit(self, note_id: str, note_text: str, priority_class: str = DEFAULT_PRIORITY_CLASS,
+               deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Add a note given by its content (rather than a path) to the work table.
+        Resubmitting a note ID with the same content returns the existing work item.
+
+        Args:
+            note_id: Unique identifier of the note
+            note_text: The medical note content
+            priority_class: Priority class of the note (urgent, normal or bulk)
+            deadline: Optional Unix timestamp by which the note should be staged
+
+        Returns:
+            Dict: The work item for this note
+
+        Raises:
+            NoteConflictError: If the note ID was submitted before with different content
+        """
+        note_hash = content_hash(note_text)
+        self.conn.execute(
+            "INSERT OR IGNORE INTO work_items (note_id, note_text, note_hash, enqueued_at, priority_class, priority, deadline) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (note_id, note_text, note_hash, time.time(), priority_class, priority_rank(priority_class), deadline)
+        )
+        item = dict(self.conn.execute("SELECT * FROM work_items WHERE note_id = ?", (note_id,)).fetchone())
+        # Items from older work tables (or enqueued by path) have no stored hash
+        stored_hash = item["note_hash"] or (content_hash(item["note_text"]) if item["note_text"] is not None else None)
+        if stored_hash != note_hash:
+            raise NoteConflictError(f"Note '{note_id}' was already submitted with different content "
+                                    f"(job {item['seq']})", item)
+        return item
+
+    def get(self, seq: int) -> Optional[Dict[str, Any]]:
+        """
+        Look up a work item by sequence number.
+
+        Args:
+            seq: Sequence number of the work item
+
+        Returns:
+            Dict: The work item, or None if it does not exist
+        """
+        row = self.conn.execute("SELECT * FROM work_items WHERE seq = ?", (seq,)).fetchone()
+        return dict(row) if row else None
+
+    def enqueue_many(self, items: List[Dict[str, str]], priority_class: str = DEFAULT_PRIORITY_CLASS,
+                     deadline: Optional[float] = None) -> int:
+        """
+        Add several notes to the work table in one transaction.
+
+        Args:
+            items: List of dictionaries with 'note_id' and either 'note_path' or 'note_text', in serial order
+            priority_class: Priority class of the notes (urgent, normal or bulk)
+            deadline: Optional Unix timestamp by which the notes should be staged
+
+        Returns:
+            int: Number of notes that were newly added
+        """
+        added = 0
+        now = time.time()
+        rank = priority_rank(priority_class)
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for item in items:
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO work_items (note_id, note_path, note_text, enqueued_at, priority_class, priority, deadline) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (item["note_id"], item.get("note_path"), item.get("note_text"), now, priority_class, rank, deadline)
+                )
+                added += cursor.rowcount
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def claim(self, worker_id: str, lease_seconds: float = 900.0,
+              priority_classes: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Claim the next pending note, or a note whose lease has expired.
+        Higher priority classes are claimed first, then the earliest deadline,
+        then the oldest submission.
+
+        Args:
+            worker_id: Identifier of the claiming worker
+            lease_seconds: How long the claim is valid before other workers may take it over
+            priority_classes: Restrict the claim to these classes (None for any class)
+
+        Returns:
+            Dict: The claimed work item, or None if nothing is claimable
+        """
+        now = time.time()
+        class_filter = ""
+        params = [now]
+        if priority_classes:
+            class_filter = f"AND priority_class IN ({', '.join('?' for _ in priority_classes)})"
+            params.extend(priority_classes)
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(
+                f"""
+                SELECT * FROM work_items
+                WHERE (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) {class_filter}
+                ORDER BY priority, deadline IS NULL, deadline, seq
+                LIMIT 1
+                """,
+                params
+            ).fetchone()
+            if row is None:
+                self.conn.execute("COMMIT")
+                return None
+            self.conn.execute(
+                "UPDATE work_items SET status = 'leased', worker_id = ?, lease_expires = ?, attempts = attempts + 1, started_at = ? WHERE seq = ?",
+                (worker_id, now + lease_seconds, now, row["seq"])
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        item = dict(row)
+        item["worker_id"] = worker_id
+        item["attempts"] += 1
+        return item
+
+    def renew(self, seq: int, worker_id: str, lease_seconds: float = 900.0) -> bool:
+        """
+        Extend the lease of a claimed note.
+
+        Args:
+            seq: Sequence number of the work item
+            worker_id: Identifier of the worker holding the lease
+            lease_seconds: How long the lease is valid from now
+
+        Returns:
+            bool: False if the lease had been taken over by another worker
+        """
+        cursor = self.conn.execute(
+            "UPDATE work_items SET lease_expires = ? WHERE seq = ? AND worker_id = ? AND status = 'leased'",
+            (time.time() + lease_seconds, seq, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, seq: int, worker_id: str, result: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Mark a claimed note as done.
+
+        Args:
+            seq: Sequence number of the work item
+            worker_id: Identifier of the worker holding the lease
+            result: Optional result row stored with the work item
+
+        Returns:
+            bool: False if the lease had been taken over by another worker
+        """
+        cursor = self.conn.execute(
+            "UPDATE work_items SET status = 'done', finished_at = ?, error = NULL, result = ? WHERE seq = ? AND worker_id = ?",
+            (time.time(), json.dumps(result) if result is not None else None, seq, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, seq: int, worker_id: str, error: str) -> bool:
+        """
+        Mark a claimed note as failed.
+
+        Args:
+            seq: Sequence number of the work item
+            worker_id: Identifier of the worker holding the lease
+            error: Description of the failure
+
+        Returns:
+            bool: False if the lease had been taken over by another worker
+        """
+        cursor = self.conn.execute(
+            "UPDATE work_items SET status = 'failed', finished_at = ?, error = ? WHERE seq = ? AND worker_id = ?",
+            (time.time(), error, seq, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def status_counts(self) -> Dict[str, int]:
+        """
+        Count work items by status.
+
+        Returns:
+            Dict: Mapping of status to number of notes
+        """
+        rows = self.conn.execute("SELECT status, COUNT(*) AS n FROM work_items GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def class_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Compute queue depth and wait times for every priority class.
+        The wait time of a note is the time from submission to its last claim.
+
+        Returns:
+            Dict: Mapping of priority class to its metrics
+        """
+        now = time.time()
+        metrics = {
+            name: {"queued": 0, "running": 0, "done": 0, "failed": 0, "avg_wait_seconds": 0.0,
+                   "max_wait_seconds": 0.0, "oldest_queued_seconds": 0.0, "missed_deadlines": 0}
+            for name in PRIORITY_CLASSES
+        }
+        rows = self.conn.execute(
+            """
+            SELECT priority_class,
+                   SUM(status = 'pending') AS queued,
+                   SUM(status = 'leased') AS running,
+                   SUM(status = 'done') AS done,
+                   SUM(status = 'failed') AS failed,
+                   AVG(CASE WHEN started_at IS NOT NULL THEN started_at - enqueued_at END) AS avg_wait,
+                   MAX(CASE WHEN started_at IS NOT NULL THEN started_at - enqueued_at END) AS max_wait,
+                   MIN(CASE WHEN status = 'pending' THEN enqueued_at END) AS oldest_queued,
+                   SUM(deadline IS NOT NULL AND COALESCE(finished_at, ?) > deadline) AS missed
+            FROM work_items
+            GROUP BY priority_class
+            """,
+            (now,)
+        ).fetchall()
+        for row in rows:
+            metrics[row["priority_class"]] = {
+                "queued": row["queued"] or 0,
+                "running": row["running"] or 0,
+                "done": row["done"] or 0,
+                "failed": row["failed"] or 0,
+                "avg_wait_seconds": row["avg_wait"] or 0.0,
+                "max_wait_seconds": row["max_wait"] or 0.0,
+                "oldest_queued_seconds": now - row["oldest_queued"] if row["oldest_queued"] else 0.0,
+                "missed_deadlines": row["missed"] or 0
+            }
+        return metrics
+
+    def items(self) -> List[Dict[str, Any]]:
+        """
+        List all work items in serial order, without the note text and result
+        columns so large runs can be listed cheaply.
+
+        Returns:
+            List: The work items
+        """
+        return [dict(row) for row in self.conn.execute(
+            """
+            SELECT seq, note_id, note_path, status, worker_id, lease_expires, attempts, error,
+                   enqueued_at, finished_at, priority_class, priority, deadline, started_at
+            FROM work_items ORDER BY seq
+            """
+        )]
+
+    def note_text(self, seq: int) -> Optional[str]:
+        """
+        Read the stored note text of a work item.
+
+        Args:
+            seq: Sequence number of the work item
+
+        Returns:
+            str: The note text, or None if the item refers to a note file
+        """
+        row = self.conn.execute("SELECT note_text FROM work_items WHERE seq = ?", (seq,)).fetchone()
+        return row["note_text"] if row else None
+
+
+class LeaseKeeper:
+    """
+    Renews the lease of a claimed note from a background thread while the note is processed,
+    so a note that takes longer than one lease is not claimed by a second worker.
+    """
+
+    def __init__(self, queue: WorkQueue, seq: int, worker_id: str, lease_seconds: float = 900.0):
+        """
+        Args:
+            queue: The work table holding the claim
+            seq: Sequence number of the claimed note
+            worker_id: Identifier of the worker holding the lease
+            lease_seconds: Lease duration; the lease is renewed every third of it
+        """
+        self.queue = queue
+        self.seq = seq
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._renew, name=f"lease-{seq}", daemon=True)
+
+    def _renew(self) -> None:
+        while not self._stop.wait(self.lease_seconds / 3):
+            if not self.queue.renew(self.seq, self.worker_id, self.lease_seconds):
+                self.lost = True
+                return
+
+    def __enter__(self) -> "LeaseKeeper":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def default_worker_id() -> str:
+    """
+    Build a worker identifier that is unique across hosts sharing the work table.
+
+    Returns:
+        str: "<hostname>-<pid>"
+    """
+    return f"{socket.gethostname()}-{os.getpid()}"